@@ -1,5 +1,6 @@
 from omfpandas.reader import OMFPandasReader
 from omfpandas.writer import OMFPandasWriter
+from omfpandas.accessor import GeometryAccessor
 from importlib import metadata
 
 try:
@@ -0,0 +1,81 @@
+"""
+The df.omf accessor of a DataFrame read with a positional index, e.g.
+OMFPandasReader.read_blockmodel(..., positional_index=True).
+
+The DataFrame is indexed by the flat (C order) positions of the cells, rather than a float MultiIndex of
+centroids (and cell sizes), and the geometry is stored in the DataFrame attrs.  Coordinates are calculated from the
+geometry on demand.
+"""
+
+import numpy as np
+import pandas as pd
+
+from omfpandas.blockmodels.geometry import Geometry, POSITION_INDEX_NAME, GEOMETRY_ATTR
+
+
+@pd.api.extensions.register_dataframe_accessor("omf")
+class GeometryAccessor:
+    """Geometry-backed coordinates of a DataFrame indexed by cell position.
+
+    Examples:
+        >>> df = reader.read_blockmodel('BlockModel', positional_index=True)
+        >>> df.omf.x
+        >>> df.omf.to_multi_index()
+    """
+
+    def __init__(self, pandas_obj: pd.DataFrame):
+        if pandas_obj.index.names != [POSITION_INDEX_NAME] or GEOMETRY_ATTR not in pandas_obj.attrs:
+            raise AttributeError("The DataFrame is not indexed by cell position, with a geometry.  "
+                                 "Read it with positional_index=True.")
+        self._obj: pd.DataFrame = pandas_obj
+
+    @property
+    def geometry(self) -> Geometry:
+        """The geometry of the BlockModel."""
+        return self._obj.attrs[GEOMETRY_ATTR]
+
+    @property
+    def positions(self) -> np.ndarray:
+        """The flat (C order) positions of the cells."""
+        return self._obj.index.to_numpy()
+
+    @property
+    def ijk(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The (i, j, k) indices of the cells."""
+        return self.geometry.position_to_ijk(self.positions)
+
+    @property
+    def centroids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The (x, y, z) world coordinates of the cell centroids."""
+        return self.geometry.position_to_world(self.positions)
+
+    @property
+    def x(self) -> pd.Series:
+        """The x coordinates of the cell centroids."""
+        return self._coordinate("x")
+
+    @property
+    def y(self) -> pd.Series:
+        """The y coordinates of the cell centroids."""
+        return self._coordinate("y")
+
+    @property
+    def z(self) -> pd.Series:
+        """The z coordinates of the cell centroids."""
+        return self._coordinate("z")
+
+    def to_multi_index(self) -> pd.MultiIndex:
+        """Return the geometry MultiIndex of the cells, as read without a positional index."""
+        return self.geometry.positions_multi_index(self.positions)
+
+    def with_multi_index(self) -> pd.DataFrame:
+        """Return the DataFrame indexed by the geometry MultiIndex, as read without a positional index."""
+        # a shallow copy, so the columns are not copied
+        res: pd.DataFrame = self._obj.copy(deep=False)
+        res.index = self.to_multi_index()
+        res.attrs.pop(GEOMETRY_ATTR, None)
+        return res
+
+    def _coordinate(self, axis: str) -> pd.Series:
+        values: np.ndarray = self.centroids["xyz".index(axis)]
+        return pd.Series(values, index=self._obj.index, name=axis)
@@ -2,15 +2,21 @@ import json
 import json
 import logging
 import os
+import struct
 import tempfile
 import webbrowser
+import zipfile
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, TYPE_CHECKING, Union, Any
 
+import numpy as np
 import omf
 import pandas as pd
 
+from omfpandas.blockmodels.calculated import is_materialized
+
 if TYPE_CHECKING:
     from omf import Project
     from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry
@@ -22,11 +28,13 @@ PathLike = Union[str, Path, os.PathLike]
 
 class OMFPandas(ABC):
 
-    def __init__(self, filepath: PathLike):
+    def __init__(self, filepath: PathLike, lazy: bool = False):
         """Instantiate the OMFPandas object.
 
         Args:
             filepath (Path): Path to the OMF file.
+            lazy (bool): If True, only the project, element and attribute headers are loaded on open.  The binary
+             arrays are loaded from the file on demand, when an attribute is first read.  Default is False.
 
         Raises:
             FileNotFoundError: If the OMF file does not exist.
@@ -40,9 +48,136 @@ class OMFPandas(ABC):
         if not filepath.suffix == '.omf':
             raise ValueError(f'File is not an OMF file: {filepath}')
         self.filepath: Path = filepath
+        self.lazy: bool = lazy
         self.project: Optional[Project] = None
+        # serialized element definitions (keyed by element name) used to locate binary arrays in the file
+        self._element_headers: dict[str, dict] = {}
         if filepath.exists():
-            self.project = omf.load(str(filepath))
+            if lazy:
+                self.project = self._load_project_headers()
+            else:
+                self.project = omf.load(str(filepath))
+
+    def _read_element_headers(self) -> dict:
+        """Read the project json, retaining the serialized elements that reference the binary arrays."""
+        with zipfile.ZipFile(self.filepath, mode='r') as zf:
+            project_json: dict = json.loads(zf.read('project.json').decode('utf-8'))
+
+        self._element_headers = {}
+        for el in project_json.get('elements', []):
+            self._element_headers[el['name']] = el
+            for child in el.get('elements', []):
+                self._element_headers[f"{el['name']}.{child['name']}"] = child
+        return project_json
+
+    def _load_project_headers(self) -> 'Project':
+        """Load the project without the binary arrays, retaining the array references for deferred loading."""
+        project_json: dict = self._read_element_headers()
+        return omf.load(str(self.filepath), include_binary=False, project_json=project_json)
+
+    def _load_attribute_arrays(self, element_name: str, attribute_names: Optional[list[str]] = None,
+                               max_workers: Optional[int] = None):
+        """Load the binary arrays of an element that was opened lazily.
+
+        Arrays already loaded are not re-read.  The cbc array of a RegularBlockModel is always loaded, since
+        it defines the number of cells.
+
+        Args:
+            element_name (str): The name of the element.  Use dot notation for elements in a composite.
+            attribute_names (Optional[list[str]]): The attributes to load.  If None, all attributes are loaded.
+            max_workers (Optional[int]): The number of threads used to decompress the arrays concurrently.
+                If None or 1, the arrays are loaded serially.
+        """
+        if not self.lazy or element_name not in self._element_headers:
+            return
+        from omf.attribute import Array
+
+        element = self.get_element_by_name(element_name)
+        element_json: dict = self._element_headers[element_name]
+
+        # collect the (owner, property, serialized array) triples that are yet to be loaded
+        pending: list[tuple[Any, str, dict]] = []
+        if 'cbc' in element_json and element.cbc.array is None:
+            pending.append((element, 'cbc', element_json['cbc']))
+        for attr, attr_json in zip(element.attributes, element_json.get('attributes', [])):
+            if attribute_names is not None and attr.name not in attribute_names:
+                continue
+            if attr.array.array is None:
+                pending.append((attr, 'array', attr_json['array']))
+
+        if not pending:
+            return
+        with zipfile.ZipFile(self.filepath, mode='r') as zf:
+            def deserialize(array_json: dict) -> Array:
+                # reads of a shared ZipFile are serialised, while decompression runs concurrently
+                return Array.deserialize(array_json, binary_dict={array_json['array']: zf.read(array_json['array'])})
+
+            if max_workers is None or max_workers < 2 or len(pending) < 2:
+                loaded: list[Array] = [deserialize(array_json) for _, _, array_json in pending]
+            else:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                    loaded = list(executor.map(deserialize, [array_json for _, _, array_json in pending]))
+        for (owner, prop, _), array in zip(pending, loaded):
+            setattr(owner, prop, array)
+        self._logger.debug(f"Loaded {len(pending)} arrays for element '{element_name}' from {self.filepath.name}")
+
+    def _map_attribute_arrays(self, element_name: str,
+                              attribute_names: Optional[list[str]] = None) -> dict[str, np.memmap]:
+        """Memory-map the attribute arrays of an element directly from the OMF file.
+
+        Only arrays stored uncompressed in the archive can be mapped.  Note that omf.save compresses arrays, so
+        mapping requires a file written with the arrays stored uncompressed, e.g. by an OMFPandasWriter with
+        compress_arrays=False.  Attributes that cannot be mapped are reported and omitted from the result.  Mapped
+        arrays are read-only and reflect the persisted file.
+
+        Args:
+            element_name (str): The name of the element.  Use dot notation for elements in a composite.
+            attribute_names (Optional[list[str]]): The attributes to map.  If None, all cell attributes are mapped.
+
+        Returns:
+            dict[str, np.memmap]: The mapped arrays keyed by attribute name.
+        """
+        from omf.attribute import DATA_TYPE_LOOKUP_TO_NUMPY
+
+        if not self._element_headers:
+            self._read_element_headers()
+        element_json: Optional[dict] = self._element_headers.get(element_name)
+        if element_json is None:
+            self._logger.warning(f"Element '{element_name}' is not persisted in {self.filepath.name}, "
+                                 f"attributes cannot be memory-mapped.")
+            return {}
+
+        mapped: dict[str, np.memmap] = {}
+        with zipfile.ZipFile(self.filepath, mode='r') as zf, open(self.filepath, 'rb') as f:
+            for attr_json in element_json.get('attributes', []):
+                attr_name: str = attr_json['name']
+                if attr_json.get('location') != 'cells':
+                    continue
+                if attribute_names is not None and attr_name not in attribute_names:
+                    continue
+                array_json: dict = attr_json['array']
+                info: zipfile.ZipInfo = zf.getinfo(array_json['array'])
+                if array_json['data_type'] == 'BooleanArray':
+                    reason = 'boolean arrays are bit-packed'
+                elif info.compress_type != zipfile.ZIP_STORED:
+                    reason = 'the array is compressed'
+                else:
+                    reason = None
+                if reason:
+                    self._logger.warning(f"Attribute '{attr_name}' in '{element_name}' cannot be memory-mapped, "
+                                         f"{reason}.  It will be loaded into memory.")
+                    continue
+
+                # the data follows the fixed 30 byte local file header, the file name and the extra field
+                f.seek(info.header_offset)
+                local_header: bytes = f.read(30)
+                if local_header[:4] != b'PK\x03\x04':
+                    raise ValueError(f"Invalid zip local file header for attribute '{attr_name}' in {self.filepath}")
+                filename_length, extra_length = struct.unpack('<HH', local_header[26:30])
+                offset: int = info.header_offset + 30 + filename_length + extra_length
+                mapped[attr_name] = np.memmap(self.filepath, dtype=DATA_TYPE_LOOKUP_TO_NUMPY[array_json['data_type']],
+                                              mode='r', offset=offset, shape=tuple(array_json['shape']))
+        return mapped
 
     def __repr__(self):
         res: str = f"OMF file({self.filepath})"
@@ -80,12 +215,13 @@ class OMFPandas(ABC):
         elements = {}
         for el in self.project.elements:
             if el.__class__.__name__ in ['TensorGridBlockModel', 'RegularBlockModel']:
-                elements[el.name] = [a.name for a in el.attributes]
+                elements[el.name] = [a.name for a in el.attributes if not is_materialized(a)]
             elif hasattr(el, 'elements') and el.elements:
                 composite_elements = {}
                 for child in el.elements:
                     if child.__class__.__name__ in ['TensorGridBlockModel', 'RegularBlockModel']:
-                        composite_elements[child.name] = [a.name for a in child.attributes]
+                        composite_elements[child.name] = [a.name for a in child.attributes
+                                                          if not is_materialized(a)]
                 if composite_elements:
                     elements[el.name] = composite_elements
 
@@ -127,13 +263,13 @@ class OMFPandas(ABC):
         return element[0]
 
     def get_element_attribute_names(self, element_name: str) -> list[str]:
-        """Get the attribute names of an element.
+        """Get the attribute names of an element, excluding the hidden materializations of calculated attributes.
 
         :param element_name: The name of the element to retrieve.  Use dot notation for elements in a composite.
         :return:
         """
         element = self.get_element_by_name(element_name)
-        return [attr.name for attr in element.attributes]
+        return [attr.name for attr in element.attributes if not is_materialized(attr)]
 
     def get_bm_geometry(self, blockmodel_name: str) -> Union['RegularGeometry', 'TensorGeometry']:
         """Get the geometry of a BlockModel.
@@ -1,4 +1,6 @@
-from typing import Union, TypeVar, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import MutableMapping
+from typing import Union, TypeVar, Optional, Iterator, Callable, TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
@@ -6,18 +8,41 @@ from omf import CategoryAttribute, NumericAttribute, CategoryColormap
 from omf.blockmodel import BaseBlockModel, RegularBlockModel, TensorGridBlockModel
 from pandas.core.dtypes.common import is_integer_dtype
 
-from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry
+from omfpandas.blockmodels.calculated import required_calculations, valid_materializations, is_materialized, \
+    stored_dependencies
+from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry, MinMax, POSITION_INDEX_NAME, \
+    GEOMETRY_ATTR
+from omfpandas.utils.expression_utils import compile_expression, CompiledExpression, FUNCTIONS
 from omfpandas.utils.pandas_utils import is_nullable_integer_dtype, to_numpy_integer_dtype, to_nullable_integer_dtype, \
-    parse_vars_from_expr
+    parse_vars_from_expr, parse_comparisons_from_expr
+
+if TYPE_CHECKING:
+    import pyarrow as pa
 
 # generic type variable, used for type hinting, to indicate that the type is a subclass of BaseBlockModel
 BM = TypeVar('BM', bound=BaseBlockModel)
 
 SENTINEL_VALUE = -9  # TODO: possibly move to config file
+ZONE_MAP_CHUNK_CELLS = 65_536  # the number of cells summarised by each zone map entry
+ZONE_MAP_MAX_CANDIDATES = 0.5  # the fraction of chunks above which pruning is skipped, as a scan is cheaper
+
 
+def series_to_attribute(series: pd.Series,
+                        null_value: Optional[int] = None) -> Union[CategoryAttribute, NumericAttribute]:
+    """Convert a Series to an attribute.
 
-def series_to_attribute(series: pd.Series) -> Union[CategoryAttribute, NumericAttribute]:
+    Nulls of a nullable integer Series are stored as the SENTINEL_VALUE, and the attribute is tagged with the
+    null_value, so they are read back as nulls.  The values of a (non-nullable) numpy integer Series are all valid,
+    unless null_value is provided.
+
+    Args:
+        series: The Series to convert.
+        null_value: The value of a numpy integer Series that marks a null, e.g. the SENTINEL_VALUE of the cells
+            without a value in a scattered array.
 
+    Returns:
+        Union[CategoryAttribute, NumericAttribute]: The attribute.
+    """
     # todo manage sorting - see attribute_to_series
     if isinstance(series.dtype, pd.CategoricalDtype):
         cat_map = {i: c for i, c in enumerate(series.cat.categories)}
@@ -34,25 +59,156 @@ def series_to_attribute(series: pd.Series) -> Union[CategoryAttribute, NumericAt
             attribute.metadata['null_value'] = SENTINEL_VALUE
         elif is_integer_dtype(series):
             attribute = NumericAttribute(name=series.name, location="cells", array=series.values)
-            attribute.metadata['null_value'] = SENTINEL_VALUE
+            if null_value is not None:
+                attribute.metadata['null_value'] = null_value
         else:
             attribute = NumericAttribute(name=series.name, location="cells", array=series.values)
             attribute.metadata['null_value'] = 'np.nan'
+        integer_null: Optional[int] = attribute.metadata.get('null_value')
+        zone_map: Optional[dict] = create_zone_map(attribute.array.array,
+                                                   null_value=integer_null if isinstance(integer_null, int) else None)
+        if zone_map is not None:
+            attribute.metadata['zone_map'] = zone_map
     return attribute
 
 
-def attribute_to_series(attribute: Union[CategoryAttribute, NumericAttribute]) -> pd.Series:
+def create_zone_map(values: np.ndarray, chunk_cells: int = ZONE_MAP_CHUNK_CELLS,
+                    null_value: Optional[int] = SENTINEL_VALUE) -> Optional[dict]:
+    """Create the zone map (min, max and null count statistics per chunk of cells) of an attribute array.
+
+    Nulls are NaN for floats and the null_value for integers, consistent with attribute_to_series.
+    The min and max of a chunk of nulls are None.
+
+    Args:
+        values: The (stored) attribute array.
+        chunk_cells: The number of cells in each chunk.
+        null_value: The null value of an integer array, i.e. the null_value of the attribute metadata.  If None,
+            all integer values are valid.
+
+    Returns:
+        Optional[dict]: The zone map, or None if the array is not numeric or is empty.
+    """
+    values = values.ravel()
+    if len(values) == 0 or values.dtype.kind not in 'iuf':
+        return None
+    starts: np.ndarray = np.arange(0, len(values), chunk_cells)
+    if values.dtype.kind == 'f':
+        null_mask: np.ndarray = np.isnan(values)
+        mins, maxs = np.fmin.reduceat(values, starts), np.fmax.reduceat(values, starts)
+    else:
+        info = np.iinfo(values.dtype)
+        null_mask: np.ndarray = (values == null_value) if null_value is not None \
+            else np.zeros(len(values), dtype=bool)
+        mins = np.minimum.reduceat(np.where(null_mask, info.max, values), starts)
+        maxs = np.maximum.reduceat(np.where(null_mask, info.min, values), starts)
+    null_count: np.ndarray = np.add.reduceat(null_mask.astype(np.int64), starts)
+    all_null: np.ndarray = null_count == np.diff(np.append(starts, len(values)))
+    return {'chunk_cells': chunk_cells,
+            'min': [None if n else v for v, n in zip(mins.tolist(), all_null)],
+            'max': [None if n else v for v, n in zip(maxs.tolist(), all_null)],
+            'null_count': null_count.tolist()}
+
+
+def zone_map_candidates(blockmodel: BM, query: str) -> Optional[np.ndarray]:
+    """Return the cells that may satisfy a query, pruning chunks using the attribute zone maps.
+
+    A chunk is pruned when a comparison that must hold for the query (see parse_comparisons_from_expr) cannot be
+    satisfied by the min / max of the chunk, or when the chunk holds only nulls.  Pruning is skipped when more than
+    ZONE_MAP_MAX_CANDIDATES of the chunks remain, since selecting the candidates then costs more than a full scan.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel to read from.
+        query (str): The query to filter the BlockModel.
+
+    Returns:
+        Optional[np.ndarray]: The boolean mask of the candidate cells, or None if pruning is skipped.
+    """
+    attrs: dict = {a.name: a for a in blockmodel.attributes if a.location == 'cells'}
+    num_cells: int = _get_geometry(blockmodel).num_cells
+    chunk_cells: Optional[int] = None
+    keep: Optional[np.ndarray] = None
+    for attr_name, op, value in parse_comparisons_from_expr(query):
+        zone_map: Optional[dict] = attrs[attr_name].metadata.get('zone_map') if attr_name in attrs else None
+        if not zone_map or zone_map['chunk_cells'] != (chunk_cells or zone_map['chunk_cells']):
+            continue
+        if len(zone_map['min']) != -(-num_cells // zone_map['chunk_cells']):
+            # a stale zone map is ignored
+            continue
+        chunk_cells = zone_map['chunk_cells']
+        mins = np.array([np.nan if v is None else v for v in zone_map['min']], dtype=float)
+        maxs = np.array([np.nan if v is None else v for v in zone_map['max']], dtype=float)
+        # comparisons with the NaN of an all null chunk are False, so those chunks are pruned
+        if op == '>':
+            possible = maxs > value
+        elif op == '>=':
+            possible = maxs >= value
+        elif op == '<':
+            possible = mins < value
+        elif op == '<=':
+            possible = mins <= value
+        elif op == '==':
+            possible = (mins <= value) & (maxs >= value)
+        else:
+            possible = ~((mins == value) & (maxs == value)) & ~np.isnan(mins)
+        keep = possible if keep is None else keep & possible
+
+    if keep is None or keep.mean() > ZONE_MAP_MAX_CANDIDATES:
+        return None
+    return np.repeat(keep, chunk_cells)[:num_cells]
+
+
+def attribute_to_series(attribute: Union[CategoryAttribute, NumericAttribute],
+                        array: Optional[np.ndarray] = None) -> pd.Series:
+    """Convert an attribute to a pandas Series.
+
+    Args:
+        attribute: The attribute to convert.
+        array: An optional array to use in place of the attribute array, e.g. a np.memmap of the persisted array.
+            Numeric values are not copied, so the Series is backed by the array.
+
+    Returns:
+        pd.Series: The attribute as a pandas Series.
+    """
+    values: np.ndarray = attribute.array.array if array is None else array
     if isinstance(attribute, CategoryAttribute):
-        return pd.Series(pd.Categorical.from_codes(codes=attribute.array.array.ravel(),
+        return pd.Series(pd.Categorical.from_codes(codes=values.ravel(),
                                                    categories=attribute.categories.values,
                                                    ordered=False), name=attribute.name)
     else:
         # if an int with null_value in metadata then convert to a nullable int
-        if attribute.metadata.get("null_value") and is_integer_dtype(attribute.array.array):
-            return pd.Series(attribute.array.array.ravel(), name=attribute.name).pipe(
+        if attribute.metadata.get("null_value") and is_integer_dtype(values):
+            return pd.Series(values.ravel(), name=attribute.name).pipe(
                 to_nullable_integer_dtype).replace(
                 SENTINEL_VALUE, pd.NA)
-        return pd.Series(attribute.array.array.ravel(), name=attribute.name, dtype=attribute.array.array.dtype)
+        return pd.Series(values.ravel(), name=attribute.name, dtype=values.dtype)
+
+
+def attribute_to_arrow(attribute: Union[CategoryAttribute, NumericAttribute],
+                       array: Optional[np.ndarray] = None) -> "pa.Array":
+    """Convert an attribute to a pyarrow Array.
+
+    Numeric arrays are wrapped without copying.  Integer attributes with a null_value are masked, and category
+    attributes are returned as a DictionaryArray of the stored codes and categories, without re-encoding.
+
+    Args:
+        attribute: The attribute to convert.
+        array: An optional array to use in place of the attribute array, e.g. a np.memmap of the persisted array.
+
+    Returns:
+        pa.Array: The attribute as a pyarrow Array.
+    """
+    import pyarrow as pa
+
+    values: np.ndarray = (attribute.array.array if array is None else array).ravel()
+    if isinstance(attribute, CategoryAttribute):
+        # negative codes are null categories
+        indices = pa.array(values, mask=values < 0) if (values < 0).any() else pa.array(values)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(list(attribute.categories.values), type=pa.string()))
+    if attribute.metadata.get("null_value") and is_integer_dtype(values):
+        null_mask: np.ndarray = values == SENTINEL_VALUE
+        if null_mask.any():
+            return pa.array(values, mask=null_mask)
+    return pa.array(values)
 
 
 def get_attribute_by_name(blockmodel: BM, attr_name: str) -> Union[CategoryAttribute, NumericAttribute]:
@@ -77,25 +233,229 @@ def get_attribute_by_name(blockmodel: BM, attr_name: str) -> Union[CategoryAttri
     return attrs[0]
 
 
+def stored_attribute_to_series(blockmodel: BM, attr_name: str, arrays: Optional[dict[str, np.ndarray]] = None,
+                               decoded: Optional[MutableMapping[str, pd.Series]] = None,
+                               positions: Optional[np.ndarray] = None) -> pd.Series:
+    """Return a stored attribute as a Series, reusing a previously decoded Series if available.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel to read from.
+        attr_name (str): The name of the attribute.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays.
+        decoded (Optional[MutableMapping[str, pd.Series]]): Decoded Series of all cells, keyed by attribute name.
+            Series converted for all cells are added to the mapping.
+        positions (Optional[np.ndarray]): The cell positions (or boolean mask) the arrays have been restricted to,
+            used to select from the decoded Series.  The Series returned is positionally indexed.
+
+    Returns:
+        pd.Series: The attribute as a pandas Series.
+    """
+    if decoded is not None and attr_name in decoded:
+        series: pd.Series = decoded[attr_name]
+        return series if positions is None else series.iloc[positions].reset_index(drop=True)
+    series = attribute_to_series(get_attribute_by_name(blockmodel, attr_name), (arrays or {}).get(attr_name))
+    if decoded is not None and positions is None:
+        decoded[attr_name] = series
+    return series
+
+
 def evaluate_calculated_attribute(blockmodel: BM, attr_name: str, calculated_expression: str,
-                                  attributes_available: list[str]) -> pd.Series:
+                                  attributes_available: list[str],
+                                  arrays: Optional[dict[str, np.ndarray]] = None,
+                                  decoded: Optional[MutableMapping[str, pd.Series]] = None,
+                                  positions: Optional[np.ndarray] = None,
+                                  memo: Optional[dict[str, pd.Series]] = None) -> pd.Series:
     """Evaluate a calculated attribute using the blockmodel and available attributes.
 
+    Only the attributes referenced by the expression are converted.  Referenced calculated attributes are
+    evaluated first, in dependency order.  Calculated attributes with a valid materialization are read from the
+    hidden attribute rather than evaluated.
+
     Args:
         blockmodel (BlockModel): The BlockModel to read from.
         attr_name (str): The name of the calculated attribute.
         calculated_expression (str): The expression to evaluate.
         attributes_available (list[str]): List of available attributes in the BlockModel.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays.
+        decoded (Optional[MutableMapping[str, pd.Series]]): Decoded Series of all cells, keyed by attribute name.
+            Pass the same mapping to share the converted inputs across calculated attributes.
+        positions (Optional[np.ndarray]): The cell positions (or boolean mask) the arrays have been restricted to.
+        memo (Optional[dict[str, pd.Series]]): The calculated attributes already evaluated (for the same cells),
+            keyed by attribute name.  Evaluated attributes are added, so pass the same dict to share intermediate
+            results across calculated attributes in a read.
 
     Returns:
         pd.Series: The evaluated calculated attribute as a pandas Series.
     """
-    local_dict = {attr: attribute_to_series(get_attribute_by_name(blockmodel, attr)) for attr in attributes_available}
-    return pd.Series(eval(calculated_expression, {}, local_dict), name=attr_name)
+    memo = {} if memo is None else memo
+    stored_definitions: dict[str, str] = blockmodel.metadata.get('calculated_attributes', {})
+    definitions: dict[str, str] = {**stored_definitions, attr_name: calculated_expression}
+    materialized: dict[str, str] = valid_materializations(blockmodel)
+    if stored_definitions.get(attr_name) != calculated_expression:
+        materialized.pop(attr_name, None)
+
+    def calculated(name: str) -> pd.Series:
+        if name not in memo and name in materialized:
+            memo[name] = stored_attribute_to_series(blockmodel, materialized[name], arrays, decoded,
+                                                    positions).rename(name)
+        return memo[name]
+
+    for name in required_calculations(definitions, [attr_name], materialized):
+        if name in memo:
+            continue
+        expression: str = definitions[name]
+        local_dict: dict[str, pd.Series] = {}
+        for variable in parse_vars_from_expr(expression):
+            if variable in definitions:
+                local_dict[variable] = calculated(variable)
+            elif variable in attributes_available:
+                local_dict[variable] = stored_attribute_to_series(blockmodel, variable, arrays, decoded, positions)
+        try:
+            memo[name] = pd.Series(_evaluate_expression(expression, local_dict), name=name)
+        except (KeyError, NameError) as e:
+            # e.g. an input was deleted
+            variable: str = e.name if isinstance(e, NameError) else e.args[0]
+            raise ValueError(f"Calculated attribute '{name}' cannot be evaluated, the variable '{variable}' is not "
+                             f"available in BlockModel '{blockmodel.name}'.") from e
+    return calculated(attr_name)
+
+
+def _is_numeric_array(series: pd.Series) -> bool:
+    """True if the Series is backed by a numeric (or boolean) numpy array, without nulls other than NaN."""
+    return isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf'
+
+
+def _evaluate_expression(expression: str, local_dict: dict[str, pd.Series], max_workers: Optional[int] = None):
+    """Evaluate an expression element-wise, over the arrays if possible, otherwise over the Series."""
+    compiled: Optional[CompiledExpression] = compile_expression(expression)
+    if compiled is None:
+        return eval(expression, {}, local_dict)
+    if all(_is_numeric_array(local_dict[name]) for name in compiled.variables.values()):
+        result: Optional[np.ndarray] = compiled.evaluate({name: local_dict[name].to_numpy()
+                                                          for name in compiled.variables.values()},
+                                                         max_workers=max_workers)
+        if result is not None:
+            return result
+        return eval(expression, {}, local_dict)
+    # e.g. nullable integers or categories, evaluated by pandas
+    return eval(compiled.code, dict(FUNCTIONS),
+                {identifier: local_dict[name] for identifier, name in compiled.variables.items()})
+
+
+def _get_geometry(blockmodel: BM) -> Union[RegularGeometry, TensorGeometry]:
+    if isinstance(blockmodel, RegularBlockModel):
+        return RegularGeometry.from_element(blockmodel)
+    elif isinstance(blockmodel, TensorGridBlockModel):
+        return TensorGeometry.from_element(blockmodel)
+    raise ValueError(f"BlockModel type {blockmodel.__class__.__name__} not (yet) supported.")
+
+
+def _subset_arrays(blockmodel: BM, arrays: dict[str, np.ndarray], cells: Union[slice, np.ndarray],
+                   names: Optional[list[str]] = None) -> dict[str, np.ndarray]:
+    """Restrict the (loaded or provided) cell attribute arrays to a subset of cells.
+
+    If names is provided, only the arrays of the named attributes are restricted, so others are not copied.
+    """
+    return {a.name: arrays.get(a.name, a.array.array)[cells] for a in blockmodel.attributes
+            if a.location == 'cells' and (names is None or a.name in names)
+            and (a.name in arrays or a.array.array is not None)}
+
+
+def _map_attributes(func: Callable[[str], pd.Series], attr_names: list[str],
+                    max_workers: Optional[int] = None) -> list[pd.Series]:
+    """Apply func to each attribute name, concurrently if more than one worker is requested.
+
+    Decompression and numpy conversion release the GIL, so a thread pool scales with the number of cores.
+    The results are returned in the order of attr_names.
+    """
+    if max_workers is None or max_workers < 2 or len(attr_names) < 2:
+        return [func(attr_name) for attr_name in attr_names]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(attr_names))) as executor:
+        return list(executor.map(func, attr_names))
+
+
+def query_positions(blockmodel: BM, query: str, arrays: Optional[dict[str, np.ndarray]] = None,
+                    decoded: Optional[MutableMapping[str, pd.Series]] = None, max_workers: Optional[int] = None,
+                    prune: bool = True, memo: Optional[dict[str, pd.Series]] = None) -> np.ndarray:
+    """Return the positions of the cells that satisfy the query.
+
+    Only the query variables are converted.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel to query.
+        query (str): The query to evaluate.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays.
+        decoded (Optional[MutableMapping[str, pd.Series]]): Decoded Series of all cells, keyed by attribute name.
+        max_workers (Optional[int]): The number of threads used to convert the query variables concurrently.
+        prune (bool): If True, the chunks of cells that cannot satisfy the query are pruned using the zone maps.
+            Requires the arrays to be of all cells.
+        memo (Optional[dict[str, pd.Series]]): The calculated attributes already evaluated for all cells.  Used,
+            and added to, unless the query is evaluated on the cells remaining after pruning.
+
+    Returns:
+        np.ndarray: The (ascending) positions of the cells that satisfy the query.
+
+    Raises:
+        ValueError: If a query variable is not found in the BlockModel.
+    """
+    arrays = arrays or {}
+    attributes_available = [v.name for v in blockmodel.attributes
+                            if v.location == 'cells' and not is_materialized(v)]
+    calculated_attributes: dict[str, str] = blockmodel.metadata.get('calculated_attributes', {})
+
+    # parse out the attributes from the query using a package
+    query_attrs = parse_vars_from_expr(query)
+    # check if the attributes in the query are available
+    if not set(query_attrs).issubset(attributes_available + list(calculated_attributes.keys())):
+        raise ValueError(
+            f"Variables {set(query_attrs).difference(attributes_available + list(calculated_attributes.keys()))} "
+            f"not found in the BlockModel.")
+    # prune the chunks of cells that cannot satisfy the query using the zone maps
+    candidates: Optional[np.ndarray] = zone_map_candidates(blockmodel, query) if prune else None
+    if candidates is None:
+        query_arrays = arrays
+    else:
+        # only the stored attributes the query depends on are copied
+        required: list[str] = stored_dependencies(calculated_attributes, query_attrs,
+                                                  valid_materializations(blockmodel))
+        query_arrays = _subset_arrays(blockmodel, arrays, candidates, names=required)
+    # calculated attributes evaluated on the candidate cells are not shared
+    query_memo: dict[str, pd.Series] = {} if memo is None or candidates is not None else memo
+
+    def to_query_series(attr_name: str) -> pd.Series:
+        if attr_name in calculated_attributes:
+            return evaluate_calculated_attribute(blockmodel, attr_name, calculated_attributes[attr_name],
+                                                 attributes_available, query_arrays, decoded, candidates,
+                                                 query_memo)
+        return stored_attribute_to_series(blockmodel, attr_name, query_arrays, decoded, candidates)
+
+    query_series: list[pd.Series] = _map_attributes(to_query_series, query_attrs, max_workers)
+    positions: Optional[np.ndarray] = None
+    compiled: Optional[CompiledExpression] = compile_expression(query, query=True)
+    if compiled is not None and query_series and all(_is_numeric_array(series) for series in query_series):
+        # evaluate the mask over the arrays, without a temporary DataFrame
+        mask = compiled.evaluate({series.name: series.to_numpy() for series in query_series},
+                                 max_workers=max_workers)
+        if isinstance(mask, np.ndarray) and mask.dtype == bool and len(mask) == len(query_series[0]):
+            positions = np.flatnonzero(mask)
+    if positions is None:
+        df_to_query: pd.DataFrame = pd.concat(query_series, axis=1)
+        positions = np.array(df_to_query.query(query).index, dtype=np.int64)
+    return positions if candidates is None else np.flatnonzero(candidates)[positions]
 
 
 def read_blockmodel_attributes(blockmodel: BM, attributes: Optional[list[str]] = None,
-                               query: Optional[str] = None, index_filter: Optional[list[int]] = None) -> pd.DataFrame:
+                               query: Optional[str] = None, index_filter: Optional[list[int]] = None,
+                               arrays: Optional[dict[str, np.ndarray]] = None,
+                               i_range: Optional[tuple[int, int]] = None,
+                               extent: Optional[tuple[MinMax, MinMax, MinMax]] = None,
+                               max_workers: Optional[int] = None,
+                               decoded: Optional[MutableMapping[str, pd.Series]] = None,
+                               index: bool = True,
+                               positional_index: bool = False) -> pd.DataFrame:
     """Read the attributes/variables from the BlockModel, including calculated attributes.
 
     Args:
@@ -103,6 +463,24 @@ def read_blockmodel_attributes(blockmodel: BM, attributes: Optional[list[str]] =
         attributes (list[str]): The attributes to include in the DataFrame.
         query (str): The query to filter the DataFrame.
         index_filter (list[int]): List of integer indices to filter the DataFrame.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays, e.g. memory-mapped arrays.  Unfiltered numeric columns are not copied.
+        i_range (Optional[tuple[int, int]]): The slab of x (i) positions [start, stop) to read.  Since cells are
+            stored in C order the slab is a contiguous range of cells, and only that range is converted.
+            The index_filter and query positions are relative to the slab.
+        extent (Optional[tuple[MinMax, MinMax, MinMax]]): The ((xmin, xmax), (ymin, ymax), (zmin, zmax)) extent
+            to read.  Only cells with centroids in the extent are gathered, and only those cells are indexed.
+            The index_filter and query positions are relative to the cells in the extent.
+        max_workers (Optional[int]): The number of threads used to convert the attributes concurrently.
+            If None or 1, the attributes are converted serially.
+        decoded (Optional[MutableMapping[str, pd.Series]]): Decoded Series of all cells, keyed by attribute name,
+            e.g. a cache.  Decoded Series are reused rather than converted, and Series converted for all cells are
+            added.  Ignored when reading an i_range or extent.
+        index (bool): If False, the geometry index is not built and the result has a positional RangeIndex, e.g. for
+            assembling several models that share a geometry.
+        positional_index (bool): If True, the geometry index is not built.  The result is indexed by the flat (C
+            order) positions of the cells, and the geometry is stored in the DataFrame attrs, so coordinates are
+            available on demand from the df.omf accessor.
 
     Returns:
         pd.DataFrame: The DataFrame representing the attributes in the BlockModel.
@@ -112,9 +490,12 @@ def read_blockmodel_attributes(blockmodel: BM, attributes: Optional[list[str]] =
     """
     if query and index_filter:
         raise ValueError("Cannot use both query and index_filter at the same time.")
+    if i_range is not None and extent is not None:
+        raise ValueError("Cannot use both i_range and extent at the same time.")
 
     # identify 'cell' variables in the file
-    attributes_available = [v.name for v in blockmodel.attributes if v.location == 'cells']
+    attributes_available = [v.name for v in blockmodel.attributes
+                            if v.location == 'cells' and not is_materialized(v)]
 
     # Retrieve calculated attributes from metadata
     calculated_attributes: dict[str, str] = blockmodel.metadata.get('calculated_attributes', {})
@@ -127,54 +508,190 @@ def read_blockmodel_attributes(blockmodel: BM, attributes: Optional[list[str]] =
             f"Variables {set(attributes).difference(attributes_available + list(calculated_attributes.keys()))} "
             f"not found in the BlockModel.")
 
-    int_index: np.ndarray = np.arange(blockmodel.num_cells)
+    mapped: bool = bool(arrays)
+    arrays = arrays or {}
+    geometry: Union[RegularGeometry, TensorGeometry] = _get_geometry(blockmodel)
+    cells: Optional[Union[slice, np.ndarray]] = None
+    window_index: Optional[pd.MultiIndex] = None
+    if i_range is not None:
+        # slices of the slab are views
+        slab_cells: int = int(np.prod(geometry.shape[1:]))
+        cells = slice(i_range[0] * slab_cells, i_range[1] * slab_cells)
+    elif extent is not None:
+        cells, window_index = geometry.extent_window(extent)
+    if cells is not None:
+        # only the stored attributes required by the read are restricted to the cells
+        targets: list[str] = attributes + (parse_vars_from_expr(query) if query else [])
+        arrays = _subset_arrays(blockmodel, arrays, cells,
+                                names=stored_dependencies(calculated_attributes, targets,
+                                                          valid_materializations(blockmodel)))
+        # the decoded Series are of all cells
+        decoded = None
+    if decoded is None:
+        # share the converted attributes across the query and calculated attributes of this read
+        decoded = {}
+    # share the evaluated calculated attributes of this read
+    memo: dict[str, pd.Series] = {}
+
+    int_index: Optional[np.ndarray] = None
     if query is not None:
-        # parse out the attributes from the query using a package
-        query_attrs = parse_vars_from_expr(query)
-        # check if the attributes in the query are available
-        if not set(query_attrs).issubset(attributes_available + list(calculated_attributes.keys())):
-            raise ValueError(
-                f"Variables {set(query_attrs).difference(attributes_available + list(calculated_attributes.keys()))} "
-                f"not found in the BlockModel.")
-        query_series: list = []
-        for attr_name in query_attrs:
-            if attr_name in calculated_attributes:
-                query_series.append(
-                    evaluate_calculated_attribute(blockmodel, attr_name, calculated_attributes[attr_name],
-                                                  attributes_available))
-            else:
-                query_series.append(attribute_to_series(get_attribute_by_name(blockmodel, attr_name)))
-        df_to_query: pd.DataFrame = pd.concat(query_series, axis=1)
-        int_index = np.array(df_to_query.query(query).index)
+        # the zone maps are of all cells
+        int_index = query_positions(blockmodel, query, arrays=arrays, decoded=decoded, max_workers=max_workers,
+                                    prune=cells is None, memo=memo)
     elif index_filter is not None:
         int_index = np.array(index_filter)
 
-    # Loop over the variables
-    chunks: list = []
-    attr: str
-    for attr in attributes:
+    def to_series(attr: str) -> pd.Series:
         if attr in calculated_attributes:
             # Evaluate the calculated attribute
-            calculated_series = evaluate_calculated_attribute(blockmodel, attr, calculated_attributes[attr],
-                                                              attributes_available)
-            chunks.append(calculated_series.iloc[int_index])
+            series = evaluate_calculated_attribute(blockmodel, attr, calculated_attributes[attr],
+                                                   attributes_available, arrays, decoded, memo=memo)
+        else:
+            series = stored_attribute_to_series(blockmodel, attr, arrays, decoded)
+        return series if int_index is None else series.iloc[int_index]
+
+    # Convert the variables
+    chunks: list[pd.Series] = _map_attributes(to_series, attributes, max_workers)
+
+    # the positions of the rows in the geometry, if not all cells
+    positions: Optional[Union[slice, np.ndarray]] = cells
+    if int_index is not None:
+        if isinstance(cells, slice):
+            positions = cells.start + int_index
+        elif cells is not None:
+            positions = cells[int_index]
         else:
-            attr: Union[CategoryAttribute, NumericAttribute] = get_attribute_by_name(blockmodel, attr)
-            chunks.append(attribute_to_series(attr).iloc[int_index])
+            positions = int_index
+
+    geometry_index: Optional[pd.Index] = None
+    if positional_index:
+        if isinstance(positions, slice):
+            geometry_index = pd.RangeIndex(positions.start, positions.stop, name=POSITION_INDEX_NAME)
+        elif positions is not None:
+            geometry_index = pd.Index(positions, name=POSITION_INDEX_NAME)
+        else:
+            geometry_index = pd.RangeIndex(geometry.num_cells, name=POSITION_INDEX_NAME)
+    elif int_index is not None and (index or cells is not None):
+        # only the selected cells are indexed, from their positions in the geometry
+        geometry_index = geometry.positions_multi_index(positions)
+    elif i_range is not None:
+        geometry_index = geometry.slab_multi_index(*i_range)
+    elif extent is not None:
+        geometry_index = window_index
+    elif index:
+        geometry_index = geometry.to_multi_index()
+
+    # views of the project arrays must not escape, mapped views stay backed by the file, gathered rows are copies
+    copy: bool = not mapped and not isinstance(positions, np.ndarray)
+    res = pd.concat(chunks, axis=1, copy=copy)
+    res.index = geometry_index if geometry_index is not None else pd.RangeIndex(len(res))
+    res = res if isinstance(res, pd.DataFrame) else res.to_frame()
+    if positional_index:
+        res.attrs[GEOMETRY_ATTR] = geometry
+    return res
+
+
+def read_blockmodel_attributes_arrow(blockmodel: BM, attributes: Optional[list[str]] = None,
+                                     query: Optional[str] = None, index_filter: Optional[list[int]] = None,
+                                     arrays: Optional[dict[str, np.ndarray]] = None,
+                                     centroids: bool = True) -> "pa.Table":
+    """Read the attributes/variables from the BlockModel to a pyarrow Table, including calculated attributes.
+
+    Stored attributes are converted with attribute_to_arrow, so unfiltered numeric columns are not copied and
+    category columns are dictionary encoded.  Only the query variables are converted to pandas to evaluate a query.
 
-    # create the geometry index
-    if isinstance(blockmodel, RegularBlockModel):
-        geometry_index: pd.MultiIndex = RegularGeometry.from_element(blockmodel).to_multi_index()
-    elif isinstance(blockmodel, TensorGridBlockModel):
-        geometry_index: pd.MultiIndex = TensorGeometry.from_element(blockmodel).to_multi_index()
-    else:
-        raise ValueError(f"BlockModel type {blockmodel.__class__.__name__} not (yet) supported.")
+    Args:
+        blockmodel (BlockModel): The BlockModel to read from.
+        attributes (list[str]): The attributes to include in the Table.
+        query (str): The query to filter the Table.
+        index_filter (list[int]): List of integer indices to filter the Table.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays, e.g. memory-mapped arrays.
+        centroids (bool): If True, the centroid columns (x, y, z, and dx, dy, dz for a tensor) are included first.
 
-    if (query is not None) or (index_filter is not None):
-        # filter the index to match the int_index positional index
-        geometry_index = geometry_index.take(int_index)
+    Returns:
+        pa.Table: The Table representing the attributes in the BlockModel.
 
-    res = pd.concat(chunks, axis=1)
-    # res.index = geometry_index.to_frame().reset_index(drop=True).sort_values(by=['z', 'y', 'x']).set_index(geometry_index.names).index
-    res.index = geometry_index
-    return res if isinstance(res, pd.DataFrame) else res.to_frame()
+    Raises:
+        ValueError: If the attribute is not found in the BlockModel or if both query and index_filter are provided.
+    """
+    import pyarrow as pa
+
+    if query and index_filter:
+        raise ValueError("Cannot use both query and index_filter at the same time.")
+
+    attributes_available = [v.name for v in blockmodel.attributes
+                            if v.location == 'cells' and not is_materialized(v)]
+    calculated_attributes: dict[str, str] = blockmodel.metadata.get('calculated_attributes', {})
+    attributes: list[str] = attributes or (attributes_available + list(calculated_attributes.keys()))
+    if not set(attributes).issubset(attributes_available + list(calculated_attributes.keys())):
+        raise ValueError(
+            f"Variables {set(attributes).difference(attributes_available + list(calculated_attributes.keys()))} "
+            f"not found in the BlockModel.")
+
+    arrays = arrays or {}
+    # share the converted inputs of the query and calculated attributes
+    decoded: dict[str, pd.Series] = {}
+    memo: dict[str, pd.Series] = {}
+    positions: Optional[np.ndarray] = None
+    if query is not None:
+        positions = query_positions(blockmodel, query, arrays=arrays, decoded=decoded, memo=memo)
+    elif index_filter is not None:
+        positions = np.asarray(index_filter, dtype=np.int64)
+
+    columns: dict[str, pa.Array] = {}
+    if centroids:
+        geometry: Union[RegularGeometry, TensorGeometry] = _get_geometry(blockmodel)
+        if positions is None:
+            geometry_index: pd.MultiIndex = geometry.to_multi_index()
+            for level in geometry_index.names:
+                columns[level] = pa.array(geometry_index.get_level_values(level).to_numpy())
+        else:
+            # the centroids of the selected cells only, without the index of all cells
+            ijk = geometry.position_to_ijk(positions)
+            for level, values in zip(['x', 'y', 'z'], geometry.ijk_to_world(*ijk)):
+                columns[level] = pa.array(values)
+            for (level, sizes), cells in zip(geometry._axis_cell_sizes().items(), ijk):
+                columns[level] = pa.array(sizes[cells])
+
+    for attr in attributes:
+        if attr in calculated_attributes:
+            array = pa.Array.from_pandas(evaluate_calculated_attribute(blockmodel, attr, calculated_attributes[attr],
+                                                                       attributes_available, arrays, decoded,
+                                                                       memo=memo))
+        else:
+            array = attribute_to_arrow(get_attribute_by_name(blockmodel, attr), arrays.get(attr))
+        columns[attr] = array if positions is None else array.take(pa.array(positions))
+
+    return pa.table(columns)
+
+
+def iter_blockmodel_attributes(blockmodel: BM, attributes: Optional[list[str]] = None,
+                               query: Optional[str] = None, chunk_cells: int = 1_000_000,
+                               arrays: Optional[dict[str, np.ndarray]] = None) -> Iterator[pd.DataFrame]:
+    """Iterate over the attributes/variables of the BlockModel in chunks, including calculated attributes.
+
+    Each chunk is a slab of whole x (i) positions, which is a contiguous range of the C ordered cells.
+    The index of each chunk is built for that slab only, so memory is bounded by the chunk size.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel to read from.
+        attributes (list[str]): The attributes to include in the DataFrame.
+        query (str): The query to filter each chunk.
+        chunk_cells (int): The target number of cells per chunk, rounded down to whole slabs (minimum one slab).
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays, e.g. memory-mapped arrays.
+
+    Yields:
+        pd.DataFrame: The DataFrame for each chunk.  Chunks with no cells remaining after the query are skipped.
+    """
+    if chunk_cells < 1:
+        raise ValueError("chunk_cells must be a positive integer.")
+    nx, ny, nz = _get_geometry(blockmodel).shape
+    slabs_per_chunk: int = max(1, chunk_cells // (ny * nz))
+    for i_start in range(0, nx, slabs_per_chunk):
+        chunk: pd.DataFrame = read_blockmodel_attributes(blockmodel, attributes=attributes, query=query,
+                                                         arrays=arrays,
+                                                         i_range=(i_start, min(i_start + slabs_per_chunk, nx)))
+        if not chunk.empty:
+            yield chunk
@@ -0,0 +1,202 @@
+"""
+Calculated attributes are stored as expressions in the metadata of a BlockModel.  Expressions may reference stored
+attributes and other calculated attributes, so the definitions form a dependency graph that must be acyclic.
+The graph is evaluated in topological order, so each calculated attribute is evaluated once per read.
+
+Calculated attributes may optionally be materialized: the result is stored as a hidden attribute, tagged with a
+fingerprint of the expression and the content of its inputs.  A materialization is used by reads only while the
+fingerprint matches, so a change to any (transitive) input invalidates it.
+"""
+
+import hashlib
+from typing import Optional, Iterator
+
+import numpy as np
+
+from omfpandas.utils.pandas_utils import parse_vars_from_expr
+
+MATERIALIZED_PREFIX = '__materialized__.'  # the name prefix of the hidden attributes holding materializations
+
+
+def calculated_dependencies(calculated_attributes: dict[str, str]) -> dict[str, list[str]]:
+    """Return the variables referenced by each calculated attribute expression.
+
+    Args:
+        calculated_attributes (dict[str, str]): The calculated attribute expressions, keyed by attribute name.
+
+    Returns:
+        dict[str, list[str]]: The variables referenced by each expression, keyed by attribute name.
+    """
+    return {name: list(dict.fromkeys(parse_vars_from_expr(expr))) for name, expr in calculated_attributes.items()}
+
+
+def calculation_order(calculated_attributes: dict[str, str], targets: Optional[list[str]] = None) -> list[str]:
+    """Return the calculated attributes required for the targets, in the order they are to be evaluated.
+
+    Each attribute is ordered after the calculated attributes it references.
+
+    Args:
+        calculated_attributes (dict[str, str]): The calculated attribute expressions, keyed by attribute name.
+        targets (Optional[list[str]]): The attributes to evaluate.  Stored attributes are ignored.  If None, all
+            calculated attributes are ordered.
+
+    Returns:
+        list[str]: The calculated attributes in topological order.
+
+    Raises:
+        ValueError: If the calculated attributes reference each other in a cycle.
+    """
+    dependencies: dict[str, list[str]] = calculated_dependencies(calculated_attributes)
+    targets = list(calculated_attributes) if targets is None else targets
+
+    order: list[str] = []
+    state: dict[str, str] = {}  # 'visiting' while on the current path, 'done' once ordered
+    for target in targets:
+        if target not in dependencies or state.get(target) == 'done':
+            continue
+        # iterative depth-first search, retaining the path to report a cycle
+        path: list[str] = [target]
+        stack: list[Iterator[str]] = [iter(dependencies[target])]
+        state[target] = 'visiting'
+        while stack:
+            dependency: Optional[str] = next(stack[-1], None)
+            if dependency is None:
+                stack.pop()
+                name = path.pop()
+                state[name] = 'done'
+                order.append(name)
+            elif dependency in dependencies:
+                if state.get(dependency) == 'visiting':
+                    cycle: list[str] = path[path.index(dependency):] + [dependency]
+                    raise ValueError(f"Calculated attributes reference each other in a cycle: {' -> '.join(cycle)}")
+                if state.get(dependency) is None:
+                    state[dependency] = 'visiting'
+                    path.append(dependency)
+                    stack.append(iter(dependencies[dependency]))
+    return order
+
+
+def required_calculations(calculated_attributes: dict[str, str], targets: list[str],
+                          materialized: Optional[dict[str, str]] = None) -> list[str]:
+    """Return the calculated attributes to evaluate for the targets, in the order they are to be evaluated.
+
+    Calculated attributes with a valid materialization are read rather than evaluated, so they are excluded, as are
+    the attributes only they reference.
+
+    Args:
+        calculated_attributes (dict[str, str]): The calculated attribute expressions, keyed by attribute name.
+        targets (list[str]): The attributes to evaluate.  Stored attributes are ignored.
+        materialized (Optional[dict[str, str]]): The hidden attribute names of the valid materializations, keyed by
+            calculated attribute name.
+
+    Returns:
+        list[str]: The calculated attributes to evaluate, in topological order.
+    """
+    materialized = materialized or {}
+    dependencies: dict[str, list[str]] = calculated_dependencies(calculated_attributes)
+    order: list[str] = calculation_order(calculated_attributes, targets)
+    required: set[str] = set(targets)
+    for name in reversed(order):
+        if name in required and name not in materialized:
+            required.update(dependencies[name])
+    return [name for name in order if name in required and name not in materialized]
+
+
+def stored_dependencies(calculated_attributes: dict[str, str], targets: list[str],
+                        materialized: Optional[dict[str, str]] = None) -> list[str]:
+    """Return the stored (not calculated) variables required to evaluate the targets.
+
+    Args:
+        calculated_attributes (dict[str, str]): The calculated attribute expressions, keyed by attribute name.
+        targets (list[str]): The attributes to evaluate, which may include stored attributes.
+        materialized (Optional[dict[str, str]]): The hidden attribute names of the valid materializations, keyed by
+            calculated attribute name.  The hidden attributes are required in place of the inputs.
+
+    Returns:
+        list[str]: The stored variables, including the stored targets.
+    """
+    materialized = materialized or {}
+    dependencies: dict[str, list[str]] = calculated_dependencies(calculated_attributes)
+    required: list[str] = [target for target in targets if target not in calculated_attributes]
+    for name in calculation_order(calculated_attributes, targets):
+        if name in materialized:
+            required.append(materialized[name])
+    for name in required_calculations(calculated_attributes, targets, materialized):
+        required.extend(dependency for dependency in dependencies[name] if dependency not in calculated_attributes)
+    return list(dict.fromkeys(required))
+
+
+def array_fingerprint(values: np.ndarray) -> str:
+    """Return a fingerprint of the content of an attribute array.
+
+    Args:
+        values (np.ndarray): The (stored) attribute array.
+
+    Returns:
+        str: The hex digest of the dtype, shape and values.
+    """
+    values = np.ascontiguousarray(values)
+    digest = hashlib.sha1(f"{values.dtype.str}{values.shape}".encode())
+    digest.update(values.data)
+    return digest.hexdigest()
+
+
+def is_materialized(attribute) -> bool:
+    """True if the attribute is the hidden materialization of a calculated attribute."""
+    return 'materialized' in attribute.metadata
+
+
+def calculated_fingerprint(blockmodel, attr_name: str,
+                           calculated_attributes: Optional[dict[str, str]] = None) -> Optional[str]:
+    """Return the fingerprint of a calculated attribute, from its expression and the fingerprints of its inputs.
+
+    The fingerprints of the stored inputs are read from the attribute metadata, so no arrays are loaded.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel of the calculated attribute.
+        attr_name (str): The name of the calculated attribute.
+        calculated_attributes (Optional[dict[str, str]]): The calculated attribute expressions, keyed by attribute
+            name.  If None, the expressions in the BlockModel metadata are used.
+
+    Returns:
+        Optional[str]: The fingerprint, or None if a stored input has no fingerprint.
+    """
+    if calculated_attributes is None:
+        calculated_attributes = blockmodel.metadata.get('calculated_attributes', {})
+    dependencies: dict[str, list[str]] = calculated_dependencies(calculated_attributes)
+    stored: dict[str, Optional[str]] = {a.name: a.metadata.get('fingerprint') for a in blockmodel.attributes
+                                        if a.location == 'cells' and not is_materialized(a)}
+    fingerprints: dict[str, Optional[str]] = {}
+    for name in calculation_order(calculated_attributes, [attr_name]):
+        inputs: list[Optional[str]] = [fingerprints[dependency] if dependency in calculated_attributes
+                                       else stored.get(dependency) for dependency in sorted(dependencies[name])]
+        if any(fingerprint is None for fingerprint in inputs):
+            return None
+        digest = hashlib.sha1(calculated_attributes[name].encode())
+        for dependency, fingerprint in zip(sorted(dependencies[name]), inputs):
+            digest.update(f"{dependency}={fingerprint};".encode())
+        fingerprints[name] = digest.hexdigest()
+    return fingerprints.get(attr_name)
+
+
+def valid_materializations(blockmodel) -> dict[str, str]:
+    """Return the hidden attributes that hold a valid materialization, keyed by calculated attribute name.
+
+    A materialization is valid while its fingerprint matches the fingerprint of the calculated attribute.
+
+    Args:
+        blockmodel (BlockModel): The BlockModel to inspect.
+
+    Returns:
+        dict[str, str]: The hidden attribute names, keyed by calculated attribute name.
+    """
+    calculated_attributes: dict[str, str] = blockmodel.metadata.get('calculated_attributes', {})
+    valid: dict[str, str] = {}
+    for attribute in blockmodel.attributes:
+        if not is_materialized(attribute):
+            continue
+        name: str = attribute.metadata['materialized'].get('attribute')
+        if name in calculated_attributes and attribute.metadata['materialized'].get('fingerprint') == \
+                calculated_fingerprint(blockmodel, name, calculated_attributes):
+            valid[name] = attribute.name
+    return valid
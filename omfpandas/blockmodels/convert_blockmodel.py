@@ -4,30 +4,52 @@ Our Pandas MultiIndex is sorted by x, y, z to align with OMF.
 """
 
 
-from typing import Optional, Union
+import shutil
+import tempfile
+import weakref
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Optional, Union, TYPE_CHECKING, Iterable
 
 import numpy as np
 import pandas as pd
 from omf import TensorGridBlockModel, RegularBlockModel, NumericAttribute, CategoryAttribute
 
-from omfpandas.blockmodels.attributes import read_blockmodel_attributes, BM, series_to_attribute
-from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry
+from omfpandas.blockmodels.attributes import read_blockmodel_attributes, BM, series_to_attribute, \
+    read_blockmodel_attributes_arrow, SENTINEL_VALUE
+from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry, MinMax, POSITION_INDEX_NAME, \
+    GEOMETRY_ATTR
+from omfpandas.utils.pandas_utils import is_nullable_integer_dtype, to_numpy_integer_dtype
 
 import pyvista as pv
 
-def df_to_blockmodel(df: pd.DataFrame, blockmodel_name: str) -> Union[RegularBlockModel, TensorGridBlockModel]:
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+def df_to_blockmodel(df: pd.DataFrame, blockmodel_name: str,
+                     geometry: Optional[Union[RegularGeometry, TensorGeometry]] = None
+                     ) -> Union[RegularBlockModel, TensorGridBlockModel]:
     """
     Get the appropriate function to convert a DataFrame to a BlockModel.
 
     Args:
         df (pd.DataFrame): The DataFrame to convert to a RegularBlockModel.
         blockmodel_name (str): The name of the RegularBlockModel.
+        geometry (Optional[Union[RegularGeometry, TensorGeometry]]): The geometry of the BlockModel.  If None, the
+            geometry of a DataFrame indexed by cell position (see df.omf) is used, otherwise the geometry is inferred
+            from the index.
 
     Returns:
         The RegularBlockModel|TensorGridBlockModel representing the DataFrame.
     """
 
-    if 'x' not in df.index.names and 'y' not in df.index.names and 'z' not in df.index.names:
+    if geometry is None and df.index.names == [POSITION_INDEX_NAME]:
+        if GEOMETRY_ATTR not in df.attrs:
+            raise ValueError("Dataframe indexed by cell position has no geometry.")
+        geometry = df.attrs[GEOMETRY_ATTR]
+    if geometry is not None:
+        return df_to_geometry_bm(df=df, geometry=geometry, blockmodel_name=blockmodel_name)
+    elif 'x' not in df.index.names and 'y' not in df.index.names and 'z' not in df.index.names:
         raise ValueError("Dataframe must have centroid coordinates (x, y, z) in the index.")
     elif 'dx' in df.index.names and 'dy' in df.index.names and 'dz' in df.index.names:
         return df_to_tensor_bm(df=df, blockmodel_name=blockmodel_name)
@@ -38,7 +60,13 @@ def df_to_blockmodel(df: pd.DataFrame, blockmodel_name: str) -> Union[RegularBlo
 def blockmodel_to_df(blockmodel: BM,
                      variables: Optional[list[str]] = None,
                      query: Optional[str] = None,
-                     index_filter: Optional[list[int]] = None) -> pd.DataFrame:
+                     index_filter: Optional[list[int]] = None,
+                     arrays: Optional[dict[str, np.ndarray]] = None,
+                     extent: Optional[tuple[MinMax, MinMax, MinMax]] = None,
+                     max_workers: Optional[int] = None,
+                     decoded: Optional[MutableMapping[str, pd.Series]] = None,
+                     index: bool = True,
+                     positional_index: bool = False) -> pd.DataFrame:
     """Convert regular block model to a DataFrame.
 
     Args:
@@ -46,53 +74,248 @@ def blockmodel_to_df(blockmodel: BM,
         variables (Optional[list[str]]): The variables to include in the DataFrame. If None, all variables are included.
         query (Optional[str]): The query to filter the DataFrame.
         index_filter (Optional[list[int]]): List of integer indices to filter the DataFrame.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays, e.g. memory-mapped arrays.
+        extent (Optional[tuple[MinMax, MinMax, MinMax]]): The ((xmin, xmax), (ymin, ymax), (zmin, zmax)) extent
+            of block centroids to read.
+        max_workers (Optional[int]): The number of threads used to convert the attributes concurrently.
+        decoded (Optional[MutableMapping[str, pd.Series]]): Decoded Series keyed by attribute name, e.g. a cache.
+        index (bool): If False, the geometry index is not built and the DataFrame has a positional RangeIndex.
+        positional_index (bool): If True, the DataFrame is indexed by the flat (C order) positions of the cells,
+            with the geometry available from the df.omf accessor.
 
     Returns:
         pd.DataFrame: The DataFrame representing the BlockModel.
     """
     # read the data
     df: pd.DataFrame = read_blockmodel_attributes(blockmodel, attributes=variables, query=query,
-                                                  index_filter=index_filter)
+                                                  index_filter=index_filter, arrays=arrays, extent=extent,
+                                                  max_workers=max_workers, decoded=decoded,
+                                                  index=index, positional_index=positional_index)
     return df
 
 
-def df_to_regular_bm(df: pd.DataFrame, blockmodel_name: str) -> RegularBlockModel:
-    """Convert a DataFrame to a RegularBlockModel.
+def blockmodel_to_table(blockmodel: BM,
+                        variables: Optional[list[str]] = None,
+                        query: Optional[str] = None,
+                        index_filter: Optional[list[int]] = None,
+                        arrays: Optional[dict[str, np.ndarray]] = None,
+                        centroids: bool = True) -> "pa.Table":
+    """Convert a block model to a pyarrow Table, without a round trip through pandas.
 
     Args:
-        df (pd.DataFrame): The DataFrame to convert to a RegularBlockModel.
-        blockmodel_name (str): The name of the RegularBlockModel.
+        blockmodel (BlockModel): The BlockModel to convert.
+        variables (Optional[list[str]]): The variables to include in the Table. If None, all variables are included.
+        query (Optional[str]): The query to filter the Table.
+        index_filter (Optional[list[int]]): List of integer indices to filter the Table.
+        arrays (Optional[dict[str, np.ndarray]]): Arrays, keyed by attribute name, to use in place of the
+            attribute arrays, e.g. memory-mapped arrays.
+        centroids (bool): If True, the centroid columns are included.
 
     Returns:
-        RegularBlockModel: The RegularBlockModel representing the DataFrame.
+        pa.Table: The Table representing the BlockModel.
     """
+    return read_blockmodel_attributes_arrow(blockmodel, attributes=variables, query=query,
+                                            index_filter=index_filter, arrays=arrays, centroids=centroids)
 
-    # Sort the dataframe to align with the omf spec - 'C' order
-    df.sort_index(level=['x', 'y', 'z'])
 
-    # Create the block model and geometry
-    blockmodel = RegularBlockModel(name=blockmodel_name)
-    geometry: RegularGeometry = RegularGeometry.from_multi_index(df.index)
+def geometry_to_blockmodel(geometry: Union[RegularGeometry, TensorGeometry],
+                           blockmodel_name: str) -> Union[RegularBlockModel, TensorGridBlockModel]:
+    """Create a BlockModel, without attributes, from a geometry.
+
+    Args:
+        geometry (Union[RegularGeometry, TensorGeometry]): The geometry of the BlockModel.
+        blockmodel_name (str): The name of the BlockModel.
+
+    Returns:
+        The RegularBlockModel|TensorGridBlockModel with the geometry.
+    """
+    if isinstance(geometry, TensorGeometry):
+        blockmodel = TensorGridBlockModel(name=blockmodel_name)
+        blockmodel.tensor_u = geometry.tensor_u
+        blockmodel.tensor_v = geometry.tensor_v
+        blockmodel.tensor_w = geometry.tensor_w
+    else:
+        blockmodel = RegularBlockModel(name=blockmodel_name)
+        blockmodel.block_count = [int(n) for n in geometry.shape]
+        blockmodel.block_size = list(geometry.block_size)
+        blockmodel.cbc = np.ones(geometry.num_cells, dtype=np.int64)
     blockmodel.corner = geometry.corner
     blockmodel.axis_u = geometry.axis_u
     blockmodel.axis_v = geometry.axis_v
     blockmodel.axis_w = geometry.axis_w
-    blockmodel.block_count = list(geometry.shape)
-    blockmodel.block_size = list(geometry.block_size)
-    blockmodel.cbc = [1] * geometry.num_cells
+    return blockmodel
 
-    # add the data
-    attrs: list[Union[NumericAttribute, CategoryAttribute]] = []
-    for variable in df.columns:
-        attribute = series_to_attribute(df[variable])
 
-        attrs.append(attribute)
-    blockmodel.attributes = attrs
+def chunks_to_blockmodel(chunks: Iterable[pd.DataFrame], geometry: Union[RegularGeometry, TensorGeometry],
+                         blockmodel_name: str,
+                         spill_dir: Optional[Path] = None) -> Union[RegularBlockModel, TensorGridBlockModel]:
+    """Create a BlockModel from chunks of blocks, without assembling the blocks in one DataFrame.
+
+    Each chunk is scattered into its (C order) cell positions, calculated from the centroids (x, y, z) in its index,
+    so chunks may be in any order.  Cells not in any chunk are null: NaN for floats, the SENTINEL_VALUE for
+    integers and a null category for categories.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): The chunks of blocks, indexed by centroid (x, y, z), with a column per
+            attribute.  Columns are numeric, boolean or categorical.
+        geometry (Union[RegularGeometry, TensorGeometry]): The geometry of the BlockModel.
+        blockmodel_name (str): The name of the BlockModel.
+        spill_dir (Optional[Path]): If provided, the attribute arrays are memory-mapped files in a temporary
+            directory within spill_dir, rather than in memory.  The directory is removed once the BlockModel is
+            released.
+
+    Returns:
+        The RegularBlockModel|TensorGridBlockModel.
+
+    Raises:
+        ValueError: If a centroid is not in the geometry, or a column has an unsupported or inconsistent dtype.
+    """
+    positioned_chunks = ((geometry.centroid_positions(*(chunk.index.get_level_values(level).to_numpy()
+                                                        for level in ['x', 'y', 'z'])), chunk)
+                         for chunk in chunks if not chunk.empty)
+    return _scatter_blockmodel(positioned_chunks, geometry, blockmodel_name, spill_dir=spill_dir)
+
+
+def _scatter_blockmodel(positioned_chunks: Iterable[tuple[np.ndarray, pd.DataFrame]],
+                        geometry: Union[RegularGeometry, TensorGeometry], blockmodel_name: str,
+                        spill_dir: Optional[Path] = None) -> Union[RegularBlockModel, TensorGridBlockModel]:
+    """Create a BlockModel by scattering chunks of blocks into full-length attribute arrays.
+
+    Args:
+        positioned_chunks (Iterable[tuple[np.ndarray, pd.DataFrame]]): The chunks, with the (C order) cell
+            positions of their rows.
+        geometry (Union[RegularGeometry, TensorGeometry]): The geometry of the BlockModel.
+        blockmodel_name (str): The name of the BlockModel.
+        spill_dir (Optional[Path]): If provided, the attribute arrays are memory-mapped files in a temporary
+            directory within spill_dir.
+
+    Returns:
+        The RegularBlockModel|TensorGridBlockModel.
+    """
+    blockmodel = geometry_to_blockmodel(geometry, blockmodel_name)
     blockmodel.validate()
 
+    spill_path: Optional[Path] = None
+    if spill_dir is not None:
+        spill_path = Path(tempfile.mkdtemp(prefix=f"{blockmodel_name}.", dir=spill_dir))
+        weakref.finalize(blockmodel, shutil.rmtree, spill_path, True)
+
+    arrays: dict[str, np.ndarray] = {}
+    categories: dict[str, dict] = {}
+    # the integer columns with nulls, i.e. nullable in a chunk, or with cells not in any chunk
+    nullable: set[str] = set()
+    written_cells: dict[str, int] = {}
+
+    def allocate(dtype: np.dtype, fill_value) -> np.ndarray:
+        if spill_path is None:
+            values = np.empty(geometry.num_cells, dtype=dtype)
+        else:
+            values = np.lib.format.open_memmap(spill_path / f"{len(arrays)}.npy", mode='w+', dtype=dtype,
+                                               shape=(geometry.num_cells,))
+        values[:] = fill_value
+        return values
+
+    for positions, chunk in positioned_chunks:
+        for name in chunk.columns:
+            series: pd.Series = chunk[name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                if name not in arrays:
+                    arrays[name], categories[name] = allocate(np.dtype(np.int32), -1), {}
+                # map the codes of the chunk to the codes of the categories of all chunks
+                lookup = np.array([categories[name].setdefault(category, len(categories[name]))
+                                   for category in series.cat.categories] + [-1], dtype=np.int32)
+                values = lookup[series.cat.codes.to_numpy()]
+            elif is_nullable_integer_dtype(series):
+                values = series.fillna(SENTINEL_VALUE).pipe(to_numpy_integer_dtype).to_numpy()
+                nullable.add(name)
+            elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf':
+                values = series.to_numpy()
+            else:
+                raise ValueError(f"Column '{name}' has an unsupported dtype: {series.dtype}")
+
+            if name not in arrays:
+                fill_value = {'f': np.nan, 'b': False}.get(values.dtype.kind, SENTINEL_VALUE)
+                arrays[name] = allocate(values.dtype, fill_value)
+            elif not np.can_cast(values.dtype, arrays[name].dtype, casting='same_kind'):
+                raise ValueError(f"Column '{name}' has dtype {values.dtype} in a chunk, "
+                                 f"inconsistent with {arrays[name].dtype}.")
+            arrays[name][positions] = values
+            written_cells[name] = written_cells.get(name, 0) + len(positions)
+
+    attributes: list[Union[NumericAttribute, CategoryAttribute]] = []
+    for name, values in arrays.items():
+        if name in categories:
+            series = pd.Series(pd.Categorical.from_codes(values, categories=list(categories[name])), name=name)
+        else:
+            series = pd.Series(values, name=name, copy=False)
+        has_nulls: bool = name in nullable or written_cells[name] < geometry.num_cells
+        attributes.append(series_to_attribute(series, null_value=SENTINEL_VALUE if has_nulls else None))
+    blockmodel.attributes = attributes
     return blockmodel
 
 
+def df_to_geometry_bm(df: pd.DataFrame, geometry: Union[RegularGeometry, TensorGeometry],
+                      blockmodel_name: str) -> Union[RegularBlockModel, TensorGridBlockModel]:
+    """Convert a DataFrame to a BlockModel with a known geometry.
+
+    The geometry is not inferred from the index.  The cell of each row is located from the position of its
+    centroid, or is the index value if the index is of flat (C order) cell positions (named 'position').  A
+    DataFrame of all cells in C order is written as is, otherwise the rows are scattered into full-length arrays,
+    so rows may be in any order, and cells without a row (e.g. air) are null: NaN for floats, the SENTINEL_VALUE
+    for integers and a null category for categories.  The DataFrame is not modified.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert, with at most one row per cell, indexed by centroid (x, y, z)
+            or by cell position.
+        geometry (Union[RegularGeometry, TensorGeometry]): The geometry of the BlockModel.
+        blockmodel_name (str): The name of the BlockModel.
+
+    Returns:
+        The RegularBlockModel|TensorGridBlockModel representing the DataFrame.
+
+    Raises:
+        ValueError: If a row is not a cell of the geometry, or a cell has more than one row.
+    """
+    if len(df) > geometry.num_cells:
+        raise ValueError(f"The DataFrame has {len(df)} rows, but the geometry has {geometry.num_cells} cells.")
+    if df.index.names == [POSITION_INDEX_NAME]:
+        # indexed by cell position, e.g. as read with a positional_index
+        positions: np.ndarray = df.index.to_numpy()
+        if len(positions) and (positions.min() < 0 or positions.max() >= geometry.num_cells):
+            raise ValueError(f"The DataFrame has positions outside the {geometry.num_cells} cells of the geometry.")
+    else:
+        positions = geometry.centroid_positions(*(df.index.get_level_values(level).to_numpy()
+                                                  for level in ['x', 'y', 'z']))
+    if len(df) == geometry.num_cells and np.array_equal(positions, np.arange(geometry.num_cells)):
+        blockmodel = geometry_to_blockmodel(geometry, blockmodel_name)
+        blockmodel.attributes = [series_to_attribute(df[variable]) for variable in df.columns]
+        blockmodel.validate()
+        return blockmodel
+
+    is_written: np.ndarray = np.zeros(geometry.num_cells, dtype=bool)
+    is_written[positions] = True
+    if np.count_nonzero(is_written) != len(positions):
+        raise ValueError("The DataFrame has more than one row for a cell of the geometry.")
+    return _scatter_blockmodel([(positions, df)], geometry, blockmodel_name)
+
+
+def df_to_regular_bm(df: pd.DataFrame, blockmodel_name: str) -> RegularBlockModel:
+    """Convert a DataFrame to a RegularBlockModel.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert to a RegularBlockModel.
+        blockmodel_name (str): The name of the RegularBlockModel.
+
+    Returns:
+        RegularBlockModel: The RegularBlockModel representing the DataFrame.
+    """
+
+    # the rows are located in the inferred geometry, so they need not be sorted, nor include every cell
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(df.index)
+    return df_to_geometry_bm(df=df, geometry=geometry, blockmodel_name=blockmodel_name)
+
+
 def df_to_tensor_bm(df: pd.DataFrame, blockmodel_name: str) -> BM:
     """Write a DataFrame to a BlockModel.
 
@@ -106,7 +329,7 @@ def df_to_tensor_bm(df: pd.DataFrame, blockmodel_name: str) -> BM:
     """
 
     # Sort the dataframe to align with the omf spec - 'C' order
-    df.sort_index(level=['x', 'y', 'z'], inplace=True)
+    df = df.sort_index(level=['x', 'y', 'z'])
 
     # Create the blockmodel and geometry
 
@@ -1,8 +1,11 @@
+import hashlib
 import json
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Union, Optional
+from typing import Union, Optional, Callable
 
 import numpy as np
 import pandas as pd
@@ -14,6 +17,115 @@ Vector = Union[tuple[float, float, float], list[float, float, float]]
 Point = Union[tuple[float, float, float], list[float, float, float]]
 Triple = Union[tuple[float, float, float], list[float, float, float]]
 MinMax = Union[tuple[float, float], list[float, float]]
+Range = tuple[int, int]
+
+MULTI_INDEX_CACHE_BYTES: int = 256 * 1024 ** 2  # the default byte budget of the cached geometry MultiIndexes
+CENTROID_TOLERANCE: float = 1e-3  # the tolerance of a centroid coordinate, as a fraction of the cell size
+POSITION_INDEX_NAME: str = "position"  # the name of an index of flat (C order) cell positions
+GEOMETRY_ATTR: str = "omf_geometry"  # the DataFrame.attrs key of the geometry of a positional index
+
+
+def _codes(n: int) -> np.ndarray:
+    """Return the MultiIndex codes 0..n-1, in the smallest (signed) integer dtype, as pandas stores codes."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dtype).max:
+            return np.arange(n, dtype=dtype)
+    return np.arange(n, dtype=np.int64)
+
+
+class MultiIndexCache:
+    """A least-recently-used cache of geometry MultiIndexes keyed by the geometry fingerprint, under a byte budget.
+
+    Models that share a grid have the same fingerprint, so the index is built once and reused.
+    Copies of the cached index are returned, so renaming the levels of a returned index does not affect the cache.
+    The module level multi_index_cache is used by to_multi_index.  Call multi_index_cache.clear() to release the
+    cached indexes, or multi_index_cache.resize(0) to disable caching.
+
+    Attributes:
+        max_bytes (int): The byte budget of the cached indexes.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups not found in the cache.
+        evictions (int): The number of indexes evicted to respect the budget.
+    """
+
+    def __init__(self, max_bytes: int = MULTI_INDEX_CACHE_BYTES):
+        """Instantiate the MultiIndexCache.
+
+        Args:
+            max_bytes (int): The byte budget of the cached indexes.  Zero disables caching.  Default is 256 MiB.
+        """
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be a non-negative integer.")
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._indexes: OrderedDict[str, tuple[pd.MultiIndex, int]] = OrderedDict()
+        self._size_bytes: int = 0
+        self._lock = threading.Lock()
+
+    def get(self, geometry: "Geometry", build: Callable[[], pd.MultiIndex]) -> pd.MultiIndex:
+        """Return the cached MultiIndex for the geometry, building and caching it on a miss.
+
+        Indexes larger than the budget are not cached.
+
+        Args:
+            geometry (Geometry): The geometry to get the index for.
+            build (Callable[[], pd.MultiIndex]): The function that builds the index.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the geometry.
+        """
+        key: str = geometry.fingerprint
+        with self._lock:
+            if key in self._indexes:
+                self.hits += 1
+                self._indexes.move_to_end(key)
+                return self._indexes[key][0].copy()
+            self.misses += 1
+        index: pd.MultiIndex = build()
+        size: int = int(index.memory_usage())
+        with self._lock:
+            if key not in self._indexes and size <= self.max_bytes:
+                self._indexes[key] = (index, size)
+                self._size_bytes += size
+                self._evict()
+        return index.copy()
+
+    def resize(self, max_bytes: int):
+        """Set the byte budget, evicting the least recently used indexes to respect it.  Zero disables caching.
+
+        Args:
+            max_bytes (int): The byte budget of the cached indexes.
+        """
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be a non-negative integer.")
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Clear the cached indexes and reset the counters."""
+        with self._lock:
+            self._indexes.clear()
+            self._size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._indexes),
+                "size_bytes": self._size_bytes, "max_bytes": self.max_bytes}
+
+    def _evict(self):
+        while self._size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._indexes.popitem(last=False)
+            self._size_bytes -= evicted_size
+            self.evictions += 1
+
+
+multi_index_cache: MultiIndexCache = MultiIndexCache()
 
 
 # class CustomEncoder(json.JSONEncoder):
@@ -96,6 +208,21 @@ class Geometry(ABC):
     def centroid_w(self) -> np.ndarray[float]:
         pass
 
+    @property
+    def fingerprint(self) -> str:
+        """A canonical hash of the geometry definition, equal for geometries that define the same grid."""
+        digest = hashlib.sha1(self.__class__.__name__.encode())
+        for values in self._fingerprint_arrays():
+            values = np.asarray(values, dtype=np.float64).ravel()
+            # the length separates the arrays, so different splits of the same values differ
+            digest.update(np.int64(len(values)).tobytes())
+            digest.update(values.tobytes())
+        return digest.hexdigest()
+
+    @abstractmethod
+    def _fingerprint_arrays(self) -> list[FloatArray]:
+        pass
+
     @property
     def num_cells(self) -> int:
         return int(np.prod(self.shape))
@@ -138,6 +265,261 @@ class Geometry(ABC):
     def to_multi_index(self) -> pd.MultiIndex:
         pass
 
+    @abstractmethod
+    def window_multi_index(self, i_range: Range, j_range: Range, k_range: Range) -> pd.MultiIndex:
+        pass
+
+    @abstractmethod
+    def extent_to_ijk_ranges(self, extent: tuple[MinMax, MinMax, MinMax]) -> tuple[Range, Range, Range]:
+        pass
+
+    def slab_multi_index(self, i_start: int, i_stop: int) -> pd.MultiIndex:
+        """Return the MultiIndex for the cells in the slab of x (i) positions [i_start, i_stop).
+
+        Cells are stored in C order (x slowest), so the slab is a contiguous range of cells, and the index
+        is returned in that (C) order.
+
+        Args:
+            i_start (int): The first i position of the slab.
+            i_stop (int): The i position after the last slab position.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the slab cells.
+        """
+        return self.window_multi_index((i_start, min(i_stop, self.shape[0])), (0, self.shape[1]),
+                                       (0, self.shape[2]))
+
+    def window_positions(self, i_range: Range, j_range: Range, k_range: Range) -> np.ndarray:
+        """Return the flat (C order) cell positions of the window of i, j, k ranges.
+
+        Args:
+            i_range (Range): The [start, stop) range of i positions.
+            j_range (Range): The [start, stop) range of j positions.
+            k_range (Range): The [start, stop) range of k positions.
+
+        Returns:
+            np.ndarray: The positions, in C order.
+        """
+        ii, jj, kk = np.meshgrid(np.arange(*i_range), np.arange(*j_range), np.arange(*k_range), indexing="ij")
+        return self.ijk_to_position(ii.ravel(), jj.ravel(), kk.ravel())
+
+    def extent_window(self, extent: tuple[MinMax, MinMax, MinMax]) -> tuple[np.ndarray, pd.MultiIndex]:
+        """Return the cells with centroids within an extent, without building the full index.
+
+        The i, j, k ranges are calculated from the geometry, and only the cells in that window are indexed.
+        Centroids on the extent boundary are included.
+
+        Args:
+            extent: The ((xmin, xmax), (ymin, ymax), (zmin, zmax)) extent.
+
+        Returns:
+            tuple[np.ndarray, pd.MultiIndex]: The flat (C order) positions of the cells and their MultiIndex.
+        """
+        ijk_ranges: tuple[Range, Range, Range] = self.extent_to_ijk_ranges(extent)
+        positions: np.ndarray = self.window_positions(*ijk_ranges)
+        index: pd.MultiIndex = self.window_multi_index(*ijk_ranges)
+        if not np.allclose(np.array([self.axis_u, self.axis_v, self.axis_w], dtype=float), np.eye(3)):
+            # the window bounds the rotated extent, so test the centroids
+            mask = np.ones(len(index), dtype=bool)
+            for level, (min_value, max_value) in zip(["x", "y", "z"], extent):
+                values = index.get_level_values(level)
+                mask &= (values >= min_value) & (values <= max_value)
+            positions, index = positions[mask], index[mask]
+        return positions, index
+
+    @abstractmethod
+    def _axis_edges(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The cell boundaries along each axis, in the unrotated frame of the grid."""
+        pass
+
+    @property
+    def rotation_matrix(self) -> np.ndarray:
+        """The rotation matrix of the grid, with columns axis_u, axis_v and axis_w."""
+        return np.array([self.axis_u, self.axis_v, self.axis_w], dtype=float).T
+
+    def _to_grid_frame(self, points: np.ndarray) -> np.ndarray:
+        """Transform (3, n) points to the unrotated frame of the grid."""
+        # the rotation matrix is orthonormal, so its inverse is its transpose
+        return self.rotation_matrix.T @ points
+
+    def _from_grid_frame(self, points: np.ndarray) -> np.ndarray:
+        """Transform (3, n) points from the unrotated frame of the grid."""
+        return self.rotation_matrix @ points
+
+    def ijk_to_position(self, i: np.ndarray, j: np.ndarray, k: np.ndarray) -> np.ndarray:
+        """Return the flat (C order) positions of cells from their (i, j, k) indices.
+
+        Raises:
+            ValueError: If an index is outside the grid.
+        """
+        return np.ravel_multi_index((np.asarray(i), np.asarray(j), np.asarray(k)),
+                                    dims=tuple(int(n) for n in self.shape))
+
+    def position_to_ijk(self, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (i, j, k) indices of cells from their flat (C order) positions.
+
+        Raises:
+            ValueError: If a position is outside the grid.
+        """
+        i, j, k = np.unravel_index(np.asarray(positions), shape=tuple(int(n) for n in self.shape))
+        return i, j, k
+
+    def ijk_to_world(self, i: np.ndarray, j: np.ndarray,
+                     k: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (x, y, z) world coordinates of the centroids of cells from their (i, j, k) indices."""
+        local: np.ndarray = np.vstack([centroids[np.asarray(cell)] for cell, centroids in
+                                       zip((i, j, k), self._axis_centroids())])
+        x, y, z = self._from_grid_frame(local)
+        return x, y, z
+
+    def positions_multi_index(self, positions: np.ndarray) -> pd.MultiIndex:
+        """Return the MultiIndex of the cells at flat (C order) positions, without building the full index.
+
+        The index is equivalent to to_multi_index().take(positions), built in O(len(positions)).
+
+        Args:
+            positions (np.ndarray): The flat (C order) positions of the cells.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the cells, in the order of the positions.
+        """
+        ijk = self.position_to_ijk(positions)
+        x, y, z = self.ijk_to_world(*ijk)
+        cell_sizes: dict[str, np.ndarray] = {name: sizes[cell] for (name, sizes), cell in
+                                             zip(self._axis_cell_sizes().items(), ijk)}
+        return pd.MultiIndex.from_arrays([x, y, z, *cell_sizes.values()], names=["x", "y", "z", *cell_sizes])
+
+    def _axis_cell_sizes(self) -> dict[str, np.ndarray]:
+        """The cell sizes along each axis that are levels of the index, keyed by level name."""
+        return {}
+
+    @property
+    def _is_axis_aligned(self) -> bool:
+        """True if the grid is not rotated, so the index is a Cartesian product of the axis centroids."""
+        return np.array_equal(self.rotation_matrix, np.eye(3))
+
+    def _product_multi_index(self, i_range: Range, j_range: Range, k_range: Range) -> pd.MultiIndex:
+        """Return the MultiIndex of a window of an axis-aligned grid, in C order, from its levels and codes.
+
+        The window is a Cartesian product, so the levels are the (sorted, unique) centroids along each axis and
+        the codes follow from the C order, without factorizing the values of every cell.
+
+        Args:
+            i_range (Range): The [start, stop) range of i positions.
+            j_range (Range): The [start, stop) range of j positions.
+            k_range (Range): The [start, stop) range of k positions.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the window cells.
+        """
+        ranges: list[Range] = [i_range, j_range, k_range]
+        ni, nj, nk = (max(stop - start, 0) for start, stop in ranges)
+        # the codes of the cells along each axis, in C order (i slowest)
+        axis_codes: list[np.ndarray] = [np.repeat(_codes(ni), nj * nk), np.tile(np.repeat(_codes(nj), nk), ni),
+                                        np.tile(_codes(nk), ni * nj)]
+        levels: list[np.ndarray] = [centroids[slice(*r)] for centroids, r in zip(self._axis_centroids(), ranges)]
+        codes: list[np.ndarray] = list(axis_codes)
+        for (name, sizes), r, cell_codes in zip(self._axis_cell_sizes().items(), ranges, axis_codes):
+            # the cell sizes are not unique, so are factorized along the axis rather than over the cells
+            level, inverse = np.unique(np.asarray(sizes, dtype=float)[slice(*r)], return_inverse=True)
+            levels.append(level)
+            codes.append(inverse.astype(_codes(len(level)).dtype)[cell_codes])
+        names: list[str] = ["x", "y", "z", *self._axis_cell_sizes()]
+        return pd.MultiIndex(levels=levels, codes=codes, names=names, verify_integrity=False)
+
+    @abstractmethod
+    def _axis_centroids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The centroids along each axis, in the unrotated frame of the grid."""
+        pass
+
+    def world_to_ijk(self, x: np.ndarray, y: np.ndarray,
+                     z: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (i, j, k) indices of the cells containing points in world coordinates.
+
+        Use nearest_centroids to flag, rather than reject, points outside the grid.
+
+        Raises:
+            ValueError: If a point is outside the grid.
+        """
+        _, ijk, in_grid = self._locate(x, y, z)
+        if not in_grid.all():
+            raise ValueError(f"{int((~in_grid).sum())} points are outside the grid.")
+        return ijk[0], ijk[1], ijk[2]
+
+    def position_to_world(self, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (x, y, z) world coordinates of the centroids of cells from their flat (C order) positions."""
+        return self.ijk_to_world(*self.position_to_ijk(positions))
+
+    def world_to_position(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """Return the flat (C order) positions of the cells containing points in world coordinates.
+
+        Raises:
+            ValueError: If a point is outside the grid.
+        """
+        return self.ijk_to_position(*self.world_to_ijk(x, y, z))
+
+    def _axis_cells(self, points: np.ndarray) -> list[np.ndarray]:
+        """Return the cell index along each axis of (3, n) points in the grid frame, unbounded by the shape."""
+        return [np.searchsorted(edges, values, side="right") - 1 for values, edges in zip(points, self._axis_edges())]
+
+    def _locate(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, list[np.ndarray],
+                                                                            np.ndarray]:
+        """Return the points in the grid frame, the (clipped) cell index along each axis and the in-grid flags."""
+        points: np.ndarray = self._to_grid_frame(np.vstack([np.asarray(x, dtype=float).ravel(),
+                                                            np.asarray(y, dtype=float).ravel(),
+                                                            np.asarray(z, dtype=float).ravel()]))
+        ijk: list[np.ndarray] = []
+        in_grid: np.ndarray = np.ones(points.shape[1], dtype=bool)
+        for values, cell, edges in zip(points, self._axis_cells(points), self._axis_edges()):
+            in_grid &= (values >= edges[0]) & (values <= edges[-1])
+            ijk.append(np.clip(cell, 0, len(edges) - 2))
+        return points, ijk, in_grid
+
+    def centroid_positions(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """Return the flat (C order) positions of the cells with the given centroids.
+
+        Args:
+            x (np.ndarray): The x coordinates of the centroids.
+            y (np.ndarray): The y coordinates of the centroids.
+            z (np.ndarray): The z coordinates of the centroids.
+
+        Returns:
+            np.ndarray: The cell positions.
+
+        Raises:
+            ValueError: If a point is not the centroid of a cell, within CENTROID_TOLERANCE of the cell size.
+        """
+        points, ijk, _ = self._locate(x, y, z)
+        is_centroid: np.ndarray = np.ones(points.shape[1], dtype=bool)
+        for values, cell, edges in zip(points, ijk, self._axis_edges()):
+            sizes: np.ndarray = np.diff(edges)
+            centroids: np.ndarray = edges[cell] + sizes[cell] / 2
+            is_centroid &= np.abs(values - centroids) <= CENTROID_TOLERANCE * sizes[cell]
+        if not is_centroid.all():
+            first: int = int(np.flatnonzero(~is_centroid)[0])
+            raise ValueError(f"{int((~is_centroid).sum())} points are not centroids of the geometry, "
+                             f"e.g. ({x[first]}, {y[first]}, {z[first]}).")
+        return self.ijk_to_position(*ijk)
+
+    def nearest_centroids(self, x: np.ndarray, y: np.ndarray,
+                          z: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find the cells containing many points, e.g. to flag samples with the blocks they fall in.
+
+        Points outside the grid are assigned the nearest cell on the boundary of the grid, and flagged.
+
+        Args:
+            x (np.ndarray): The x coordinates of the points.
+            y (np.ndarray): The y coordinates of the points.
+            z (np.ndarray): The z coordinates of the points.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The (n, 3) centroids of the cells, the flat (C order)
+            positions of the cells and a boolean array flagging the points in the grid.
+        """
+        _, ijk, in_grid = self._locate(x, y, z)
+        centroids: np.ndarray = np.column_stack(self.ijk_to_world(*ijk))
+        return centroids, self.ijk_to_position(*ijk), in_grid
+
     @abstractmethod
     def nearest_centroid_lookup(self, x: float, y: float, z: float) -> Point:
         pass
@@ -276,9 +658,10 @@ class RegularGeometry(Geometry):
         if not {"x", "y", "z"}.issubset(index.names):
             raise ValueError("Index must contain the levels 'x', 'y', 'z'.")
 
-        x = index.get_level_values("x").unique()
-        y = index.get_level_values("y").unique()
-        z = index.get_level_values("z").unique()
+        # sorted, so the index need not be
+        x = np.sort(index.get_level_values("x").unique())
+        y = np.sort(index.get_level_values("y").unique())
+        z = np.sort(index.get_level_values("z").unique())
 
         # check the block sizes are unique
         dx = np.unique(np.diff(x))
@@ -378,14 +761,48 @@ class RegularGeometry(Geometry):
         Returns:
             pd.MultiIndex: The MultiIndex representing the blockmodel element geometry.
         """
+        # in C order, the order of the cells, which is sorted by x, y, z unless the geometry is rotated
+        return multi_index_cache.get(self, lambda: self.slab_multi_index(0, self.shape[0]))
+
+    def _fingerprint_arrays(self) -> list[FloatArray]:
+        return [self.corner, self.axis_u, self.axis_v, self.axis_w, self.block_size, self.shape]
+
+    def _axis_edges(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        edges = [self.corner[axis] + np.arange(int(self.shape[axis]) + 1) * self.block_size[axis] for axis in range(3)]
+        return edges[0], edges[1], edges[2]
+
+    def _axis_centroids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # centroid = corner + (n + 0.5) * size
+        centroids = [self.corner[axis] + (np.arange(int(self.shape[axis])) + 0.5) * self.block_size[axis]
+                     for axis in range(3)]
+        return centroids[0], centroids[1], centroids[2]
+
+    def _axis_cells(self, points: np.ndarray) -> list[np.ndarray]:
+        # the cells are uniform, so are located by rounding rather than searching the edges
+        return [np.floor((values - corner) / size).astype(np.int64)
+                for values, corner, size in zip(points, self.corner, self.block_size)]
+
+    def window_multi_index(self, i_range: Range, j_range: Range, k_range: Range) -> pd.MultiIndex:
+        """Return the MultiIndex for the cells in the window of i, j, k ranges, in C order.
+
+        Args:
+            i_range (Range): The [start, stop) range of i positions.
+            j_range (Range): The [start, stop) range of j positions.
+            k_range (Range): The [start, stop) range of k positions.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the window cells, with levels x, y, z.
+        """
+        if self._is_axis_aligned:
+            return self._product_multi_index(i_range, j_range, k_range)
+
         ox, oy, oz = self.corner
         dx, dy, dz = self.block_size
-        nx, ny, nz = self.shape
 
         # Calculate the coordinates of the block centers
-        x = ox + (np.arange(nx) + 0.5) * dx
-        y = oy + (np.arange(ny) + 0.5) * dy
-        z = oz + (np.arange(nz) + 0.5) * dz
+        x = ox + (np.arange(*i_range) + 0.5) * dx
+        y = oy + (np.arange(*j_range) + 0.5) * dy
+        z = oz + (np.arange(*k_range) + 0.5) * dz
 
         # Create a grid of coordinates
         xx, yy, zz = np.meshgrid(x, y, z, indexing="ij")
@@ -403,13 +820,35 @@ class RegularGeometry(Geometry):
         rotated_centroids = rotation_matrix @ centroids
 
         # Create a MultiIndex
-        index = pd.MultiIndex.from_arrays(
+        return pd.MultiIndex.from_arrays(
             [rotated_centroids[0], rotated_centroids[1], rotated_centroids[2]],
             names=["x", "y", "z"],
         )
 
-        # Sort the MultiIndex by x, y, z levels
-        return index.sortlevel(level=["x", "y", "z"])[0]
+    def extent_to_ijk_ranges(self, extent: tuple[MinMax, MinMax, MinMax]) -> tuple[Range, Range, Range]:
+        """Return the i, j, k ranges of the cells with centroids within the extent.
+
+        For a rotated geometry the ranges bound the extent, which is transformed to the unrotated frame.
+
+        Args:
+            extent: The ((xmin, xmax), (ymin, ymax), (zmin, zmax)) extent.
+
+        Returns:
+            tuple[Range, Range, Range]: The [start, stop) ranges of i, j and k positions.
+        """
+        # the extent corners in the unrotated frame, using the inverse (transpose) of the rotation matrix
+        corners = np.array(np.meshgrid(*extent, indexing="ij")).reshape(3, -1)
+        local_corners = self._to_grid_frame(corners)
+
+        ranges: list[Range] = []
+        for axis in range(3):
+            origin, size, count = self.corner[axis], self.block_size[axis], int(self.shape[axis])
+            # centroid = origin + (n + 0.5) * size
+            start = int(np.ceil((local_corners[axis].min() - origin) / size - 0.5))
+            stop = int(np.floor((local_corners[axis].max() - origin) / size - 0.5)) + 1
+            start, stop = min(max(start, 0), count), min(max(stop, 0), count)
+            ranges.append((start, max(start, stop)))
+        return ranges[0], ranges[1], ranges[2]
 
     def to_encoded_index(self) -> pd.Index:
         """Convert a RegularGeometry to an encoded integer index
@@ -488,7 +927,7 @@ class TensorGeometry(Geometry):
     def centroid_v(self) -> np.ndarray[float]:
         if self._centroid_v is None:
             self._centroid_v = (
-                self.corner[0] + np.cumsum(self.tensor_v) - self.tensor_v / 2
+                self.corner[1] + np.cumsum(self.tensor_v) - self.tensor_v / 2
             )
         return self._centroid_v
 
@@ -496,7 +935,7 @@ class TensorGeometry(Geometry):
     def centroid_w(self) -> np.ndarray[float]:
         if self._centroid_w is None:
             self._centroid_w = (
-                self.corner[0] + np.cumsum(self.tensor_w) - self.tensor_w / 2
+                self.corner[2] + np.cumsum(self.tensor_w) - self.tensor_w / 2
             )
         return self._centroid_w
 
@@ -517,15 +956,15 @@ class TensorGeometry(Geometry):
         return (
             (
                 float(self.centroid_u[0] - self.tensor_u[0] / 2),
-                float(self.centroid_u[-1] + self.tensor_u[0] / 2),
+                float(self.centroid_u[-1] + self.tensor_u[-1] / 2),
             ),
             (
                 float(self.centroid_v[0] - self.tensor_v[0] / 2),
-                float(self.centroid_v[-1] + self.tensor_v[0] / 2),
+                float(self.centroid_v[-1] + self.tensor_v[-1] / 2),
             ),
             (
                 float(self.centroid_w[0] - self.tensor_w[0] / 2),
-                float(self.centroid_w[-1] + self.tensor_w[0] / 2),
+                float(self.centroid_w[-1] + self.tensor_w[-1] / 2),
             ),
         )
 
@@ -647,34 +1086,87 @@ class TensorGeometry(Geometry):
         Returns:
             pd.MultiIndex: The MultiIndex representing the blockmodel element geometry.
         """
-        ox, oy, oz = self.corner
+        # in C order, the order of the cells, which is sorted by x, y, z unless the geometry is rotated
+        return multi_index_cache.get(self, lambda: self.slab_multi_index(0, len(self.tensor_u)))
 
-        # Make coordinates (points) along each axis, i, j, k
-        i = ox + np.cumsum(self.tensor_u)
-        i = np.insert(i, 0, ox)
-        j = oy + np.cumsum(self.tensor_v)
-        j = np.insert(j, 0, oy)
-        k = oz + np.cumsum(self.tensor_w)
-        k = np.insert(k, 0, oz)
+    def _fingerprint_arrays(self) -> list[FloatArray]:
+        return [self.corner, self.axis_u, self.axis_v, self.axis_w, self.tensor_u, self.tensor_v, self.tensor_w]
 
-        # convert to centroids
-        x, y, z = (i[1:] + i[:-1]) / 2, (j[1:] + j[:-1]) / 2, (k[1:] + k[:-1]) / 2
-        xx, yy, zz = np.meshgrid(x, y, z, indexing="ij")
+    def _axis_cell_sizes(self) -> dict[str, np.ndarray]:
+        return {"dx": np.asarray(self.tensor_u), "dy": np.asarray(self.tensor_v), "dz": np.asarray(self.tensor_w)}
+
+    def _axis_edges(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        edges = [origin + np.concatenate([[0.0], np.cumsum(np.asarray(tensor, dtype=float))])
+                 for origin, tensor in zip(self.corner, [self.tensor_u, self.tensor_v, self.tensor_w])]
+        return edges[0], edges[1], edges[2]
+
+    def window_multi_index(self, i_range: Range, j_range: Range, k_range: Range) -> pd.MultiIndex:
+        """Return the MultiIndex for the cells in the window of i, j, k ranges, in C order.
+
+        Args:
+            i_range (Range): The [start, stop) range of i positions.
+            j_range (Range): The [start, stop) range of j positions.
+            k_range (Range): The [start, stop) range of k positions.
+
+        Returns:
+            pd.MultiIndex: The MultiIndex of the window cells, with levels x, y, z, dx, dy, dz.
+        """
+        if self._is_axis_aligned:
+            return self._product_multi_index(i_range, j_range, k_range)
+
+        i_slice, j_slice, k_slice = slice(*i_range), slice(*j_range), slice(*k_range)
+        x, y, z = self._axis_centroids()
+        xx, yy, zz = np.meshgrid(x[i_slice], y[j_slice], z[k_slice], indexing="ij")
 
         # Calculate dx, dy, dz
         dxx, dyy, dzz = np.meshgrid(
-            self.tensor_u, self.tensor_v, self.tensor_w, indexing="ij"
+            self.tensor_u[i_slice], self.tensor_v[j_slice], self.tensor_w[k_slice], indexing="ij"
         )
 
-        # TODO: consider rotation
+        # the centroids are rotated, while the cell sizes are along the axes of the grid
+        centroids = self._from_grid_frame(np.vstack([xx.ravel(), yy.ravel(), zz.ravel()]))
 
-        index: pd.MultiIndex = pd.MultiIndex.from_arrays(
-            [xx.ravel(), yy.ravel(), zz.ravel(), dxx.ravel(), dyy.ravel(), dzz.ravel()],
+        return pd.MultiIndex.from_arrays(
+            [centroids[0], centroids[1], centroids[2], dxx.ravel(), dyy.ravel(), dzz.ravel()],
             names=["x", "y", "z", "dx", "dy", "dz"],
         )
 
-        # Sort the MultiIndex by x, y, z levels
-        return index.sortlevel(level=["x", "y", "z"])[0]
+    def extent_to_ijk_ranges(self, extent: tuple[MinMax, MinMax, MinMax]) -> tuple[Range, Range, Range]:
+        """Return the i, j, k ranges of the cells with centroids within the extent.
+
+        For a rotated geometry the ranges bound the extent, which is transformed to the unrotated frame.
+
+        Args:
+            extent: The ((xmin, xmax), (ymin, ymax), (zmin, zmax)) extent.
+
+        Returns:
+            tuple[Range, Range, Range]: The [start, stop) ranges of i, j and k positions.
+        """
+        # the extent corners in the unrotated frame, which the ranges bound
+        corners = np.array(np.meshgrid(*extent, indexing="ij")).reshape(3, -1)
+        local_corners = self._to_grid_frame(corners)
+
+        ranges: list[Range] = []
+        for centroids, values in zip(self._axis_centroids(), local_corners):
+            start = int(np.searchsorted(centroids, values.min(), side="left"))
+            stop = int(np.searchsorted(centroids, values.max(), side="right"))
+            ranges.append((start, max(start, stop)))
+        return ranges[0], ranges[1], ranges[2]
+
+    def _axis_centroids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The centroids along each axis, from the corner and the tensors."""
+        ox, oy, oz = self.corner
+
+        # Make coordinates (points) along each axis, i, j, k
+        i = ox + np.cumsum(self.tensor_u)
+        i = np.insert(i, 0, ox)
+        j = oy + np.cumsum(self.tensor_v)
+        j = np.insert(j, 0, oy)
+        k = oz + np.cumsum(self.tensor_w)
+        k = np.insert(k, 0, oz)
+
+        # convert to centroids
+        return (i[1:] + i[:-1]) / 2, (j[1:] + j[:-1]) / 2, (k[1:] + k[:-1]) / 2
 
     def nearest_centroid_lookup(self, x: float, y: float, z: float) -> Point:
         """Find the nearest centroid for provided x, y, z points.
@@ -688,11 +1180,10 @@ class TensorGeometry(Geometry):
             Point3: The coordinates of the nearest centroid.
         """
 
-        # This only works for regular geometries in a tensor format - needs to be extended.
         if not self.is_regular:
-            raise ValueError(
-                "TensorGeometry is not regular. Cannot perform nearest centroid lookup."
-            )
+            # the cells containing the point, located by searching the tensor edges
+            centroids, _, _ = self.nearest_centroids([x], [y], [z])
+            return tuple(float(c) for c in centroids[0])
 
         reference_centroid: Point = (
             self.centroid_u[0],
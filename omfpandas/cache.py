@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+
+PathLike = Union[str, Path, os.PathLike]
+CacheKey = tuple[str, int, str, str]
+
+
+class AttributeCache:
+    """An in-process cache of decoded attribute Series, evicted least-recently-used under a byte budget.
+
+    Entries are keyed by (file path, mtime, element, attribute), so a file that has been modified on disk does not
+    return stale values.  A cache can be shared by several readers, including readers of different files.
+
+    Attributes:
+        max_bytes (int): The byte budget of the cached Series.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups not found in the cache.
+        evictions (int): The number of entries evicted to respect the budget.
+    """
+
+    def __init__(self, max_bytes: int = 1024 ** 3):
+        """Instantiate the AttributeCache.
+
+        Args:
+            max_bytes (int): The byte budget of the cached Series.  Default is 1 GiB.
+        """
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be a non-negative integer.")
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: OrderedDict[CacheKey, tuple[pd.Series, int]] = OrderedDict()
+        self._size_bytes: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(filepath: PathLike, element_name: str, attribute_name: str) -> CacheKey:
+        """Return the cache key of an attribute in the persisted file."""
+        filepath = Path(filepath).resolve()
+        return str(filepath), os.stat(filepath).st_mtime_ns, element_name, attribute_name
+
+    def get(self, key: CacheKey) -> Optional[pd.Series]:
+        """Return the cached Series, or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: CacheKey, series: pd.Series):
+        """Cache the Series, evicting the least recently used entries to respect the budget.
+
+        Series larger than the budget are not cached.
+        """
+        size: int = int(series.memory_usage(index=False, deep=True))
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (series, size)
+            self._size_bytes += size
+            while self._size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+                self.evictions += 1
+
+    def discard(self, key: CacheKey):
+        """Remove an entry from the cache, if present."""
+        with self._lock:
+            self._discard(key)
+
+    def invalidate(self, filepath: Optional[PathLike] = None, element_name: Optional[str] = None):
+        """Remove the cached entries of a file (and element), or all entries if filepath is None.
+
+        Args:
+            filepath (Optional[PathLike]): The file to invalidate.  If None, the cache is cleared.
+            element_name (Optional[str]): The element to invalidate.  If None, all elements of the file are removed.
+        """
+        path: Optional[str] = None if filepath is None else str(Path(filepath).resolve())
+        with self._lock:
+            for key in list(self._entries):
+                if (path is None or key[0] == path) and (element_name is None or key[2] == element_name):
+                    self._discard(key)
+
+    def element_view(self, filepath: PathLike, element_name: str) -> "ElementCacheView":
+        """Return a mapping of attribute name to cached Series for an element of the persisted file."""
+        return ElementCacheView(self, filepath, element_name)
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._entries),
+                "size_bytes": self._size_bytes, "max_bytes": self.max_bytes}
+
+    def _discard(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size_bytes -= entry[1]
+
+
+class ElementCacheView(MutableMapping):
+    """The cached Series of one element, keyed by attribute name.
+
+    Series looked up through the view are retained by the view, so they remain available for the duration of a
+    read even if evicted from the cache by the Series stored during that read.
+    """
+
+    def __init__(self, cache: AttributeCache, filepath: PathLike, element_name: str):
+        self._cache: AttributeCache = cache
+        # the file state is captured once, so all attributes of a read are keyed to the same file version
+        self._key_prefix: tuple[str, int, str] = cache.make_key(filepath, element_name, '')[:3]
+        self._retained: dict[str, pd.Series] = {}
+
+    def _key(self, attribute_name: str) -> CacheKey:
+        return *self._key_prefix, attribute_name
+
+    def __getitem__(self, attribute_name: str) -> pd.Series:
+        if attribute_name not in self._retained:
+            series: Optional[pd.Series] = self._cache.get(self._key(attribute_name))
+            if series is None:
+                raise KeyError(attribute_name)
+            self._retained[attribute_name] = series
+        return self._retained[attribute_name]
+
+    def __contains__(self, attribute_name: object) -> bool:
+        try:
+            self[attribute_name]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, attribute_name: str, series: pd.Series):
+        self._retained[attribute_name] = series
+        self._cache.put(self._key(attribute_name), series)
+
+    def __delitem__(self, attribute_name: str):
+        self._retained.pop(attribute_name, None)
+        self._cache.discard(self._key(attribute_name))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._retained)
+
+    def __len__(self) -> int:
+        return len(self._retained)
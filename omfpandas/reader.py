@@ -1,16 +1,23 @@
 import os
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Union, Iterator, TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
 
 from omfpandas.base import OMFPandas, SUPPORTED_BM_TYPES
 from omfpandas.blockmodel import OMFBlockModel
 from omfpandas.blockmodels import multiindex_to_encoded_index
-from omfpandas.blockmodels.convert_blockmodel import blockmodel_to_df
-from omfpandas.blockmodels.geometry import Geometry
+from omfpandas.blockmodels.attributes import iter_blockmodel_attributes
+from omfpandas.blockmodels.calculated import stored_dependencies, valid_materializations, is_materialized
+from omfpandas.blockmodels.convert_blockmodel import blockmodel_to_df, blockmodel_to_table
+from omfpandas.blockmodels.geometry import Geometry, MinMax
+from omfpandas.cache import AttributeCache, ElementCacheView
 from omfpandas.utils.pandas_utils import parse_vars_from_expr
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 PathLike = Union[str, Path, os.PathLike]
 
 
@@ -22,18 +29,22 @@ class OMFPandasReader(OMFPandas):
 
     """
 
-    def __init__(self, filepath: PathLike):
+    def __init__(self, filepath: PathLike, lazy: bool = False, attribute_cache: Optional[AttributeCache] = None):
         """Instantiate the OMFPandasReader object
 
         Args:
             filepath: Path to the OMF file.
+            lazy: If True, only the headers are loaded on open, and attribute arrays are loaded when first read.
+            attribute_cache: An optional cache of decoded attributes, reused by repeated reads.  The cache can be
+                shared by several readers.
         """
         if not isinstance(filepath, Path):
             filepath = Path(filepath)
 
         if not filepath.exists():
             raise FileNotFoundError(f"File does not exist: {filepath}")
-        super().__init__(filepath)
+        self.attribute_cache: Optional[AttributeCache] = attribute_cache
+        super().__init__(filepath, lazy=lazy)
 
     def read_blockmodel(
             self,
@@ -42,6 +53,10 @@ class OMFPandasReader(OMFPandas):
             query: Optional[str] = None,
             index_filter: Optional[list[int]] = None,
             encode_index: bool = False,
+            mmap: bool = False,
+            extent: Optional[tuple[MinMax, MinMax, MinMax]] = None,
+            max_workers: Optional[int] = None,
+            positional_index: bool = False,
     ) -> pd.DataFrame:
         """Return a DataFrame from a BlockModel.
 
@@ -54,23 +69,159 @@ class OMFPandasReader(OMFPandas):
             query (Optional[str]): A query string to filter the DataFrame. Default is None.
             index_filter (Optional[list[int]]): A list of indexes to filter the DataFrame. Default is None.
             encode_index (bool): If True, encode the index to a single integer.
+            mmap (bool): If True, attribute arrays stored uncompressed in the OMF file are memory-mapped rather
+                than loaded into memory.  Unfiltered numeric columns of the result are then read-only views of the
+                file.  Attributes that cannot be mapped (e.g. compressed arrays) are reported and loaded as usual.
+                Arrays are stored uncompressed by an OMFPandasWriter with compress_arrays=False.
+            extent (Optional[tuple[MinMax, MinMax, MinMax]]): The ((xmin, xmax), (ymin, ymax), (zmin, zmax))
+                extent to read.  Only blocks with centroids within the extent (inclusive) are read, and the cells
+                are located from the geometry without building the full index.  The index_filter is then relative
+                to the blocks in the extent.
+            max_workers (Optional[int]): The number of threads used to decode the attributes concurrently.  Array
+                decompression and conversion release the GIL, so reads of models with many attributes scale with the
+                number of cores.  If None or 1, the attributes are decoded serially.
+            positional_index (bool): If True, the geometry MultiIndex is not built.  The DataFrame is indexed by the
+                flat (C order) positions of the cells, and coordinates are calculated on demand by the df.omf
+                accessor, e.g. df.omf.x or df.omf.to_multi_index().  The DataFrame can be written with
+                create_blockmodel.  Cannot be used with encode_index.
+
+        If the reader has an attribute_cache, decoded attributes are reused from, and added to, the cache.  The cache
+        is not used for mmap or extent reads.
 
         Returns:
             pd.DataFrame: The DataFrame representing the BlockModel.
         """
+        if positional_index and encode_index:
+            raise ValueError("Cannot use both positional_index and encode_index.")
         bm = self.get_element_by_name(blockmodel_name)
-        # check the element retrieved is the expected type
-        if bm.__class__.__name__ not in ["RegularBlockModel", "TensorGridBlockModel"]:
-            raise ValueError(
-                f"Element '{bm}' is not a supported BlockModel in the OMF file: {self.filepath}"
-            )
+        decoded: Optional[ElementCacheView] = None
+        if not mmap and extent is None:
+            decoded = self._attribute_cache_view(blockmodel_name)
+        arrays: dict[str, np.ndarray] = self._prepare_arrays(blockmodel_name, bm, attributes=attributes,
+                                                             query=query, mmap=mmap, max_workers=max_workers,
+                                                             decoded=decoded)
         res: pd.DataFrame = blockmodel_to_df(
-            bm, variables=attributes, query=query, index_filter=index_filter
+            bm, variables=attributes, query=query, index_filter=index_filter, arrays=arrays, extent=extent,
+            max_workers=max_workers, decoded=decoded, positional_index=positional_index
         )
         if encode_index:
             res.index = multiindex_to_encoded_index(res.index)
         return res
 
+    def read_blockmodel_arrow(
+            self,
+            blockmodel_name: str,
+            attributes: Optional[list[str]] = None,
+            query: Optional[str] = None,
+            index_filter: Optional[list[int]] = None,
+            centroids: bool = True,
+            mmap: bool = False,
+    ) -> "pa.Table":
+        """Return a pyarrow Table from a BlockModel, without a round trip through pandas.
+
+        Numeric attributes are wrapped without copying the OMF arrays, and category attributes are returned as
+        dictionary arrays of the stored codes and categories.
+
+        Args:
+            blockmodel_name (str): The name of the BlockModel to read. Use dot notation for composite (e.g., Composite.BlockModel).
+            attributes (Optional[list[str]]): The attributes/variables to include in the Table. If None, all
+                variables are included.
+            query (Optional[str]): A query string to filter the Table. Default is None.
+            index_filter (Optional[list[int]]): A list of indexes to filter the Table. Default is None.
+            centroids (bool): If True, the centroid columns (x, y, z, and dx, dy, dz for a tensor) are included.
+            mmap (bool): If True, attribute arrays stored uncompressed in the OMF file are memory-mapped.
+
+        Returns:
+            pa.Table: The Table representing the BlockModel.
+        """
+        bm = self.get_element_by_name(blockmodel_name)
+        arrays: dict[str, np.ndarray] = self._prepare_arrays(blockmodel_name, bm, attributes=attributes,
+                                                             query=query, mmap=mmap)
+        return blockmodel_to_table(bm, variables=attributes, query=query, index_filter=index_filter, arrays=arrays,
+                                   centroids=centroids)
+
+    def iter_blockmodel(
+            self,
+            blockmodel_name: str,
+            attributes: Optional[list[str]] = None,
+            query: Optional[str] = None,
+            chunk_cells: int = 1_000_000,
+            mmap: bool = False,
+    ) -> Iterator[pd.DataFrame]:
+        """Iterate over a BlockModel in chunks of DataFrames.
+
+        Each chunk is a slab of whole x (i) positions, being a contiguous range of the C ordered cells, with the
+        index built for the slab only.  Combined with lazy opening and mmap, this enables processing of models
+        larger than memory.
+
+        Args:
+            blockmodel_name (str): The name of the BlockModel to read. Use dot notation for composite (e.g., Composite.BlockModel).
+            attributes (Optional[list[str]]): The attributes/variables to include in the DataFrame. If None, all
+                variables are included.
+            query (Optional[str]): A query string to filter each chunk. Default is None.
+            chunk_cells (int): The target number of cells per chunk, rounded down to whole slabs.
+            mmap (bool): If True, attribute arrays stored uncompressed in the OMF file are memory-mapped.
+
+        Yields:
+            pd.DataFrame: The DataFrame for each chunk.  Chunks with no cells remaining after the query are skipped.
+        """
+        bm = self.get_element_by_name(blockmodel_name)
+        arrays: dict[str, np.ndarray] = self._prepare_arrays(blockmodel_name, bm, attributes=attributes,
+                                                             query=query, mmap=mmap)
+        yield from iter_blockmodel_attributes(bm, attributes=attributes, query=query, chunk_cells=chunk_cells,
+                                              arrays=arrays)
+
+    def _prepare_arrays(self, blockmodel_name: str, bm, attributes: Optional[list[str]] = None,
+                        query: Optional[str] = None, mmap: bool = False,
+                        max_workers: Optional[int] = None,
+                        decoded: Optional[ElementCacheView] = None) -> dict[str, np.ndarray]:
+        """Map and/or load the arrays required to read a BlockModel.
+
+        When opened lazily, the arrays of attributes already decoded (cached) are not loaded.
+
+        Returns:
+            dict[str, np.ndarray]: The memory-mapped arrays keyed by attribute name, empty if mmap is False.
+        """
+        # check the element retrieved is the expected type
+        if bm.__class__.__name__ not in ["RegularBlockModel", "TensorGridBlockModel"]:
+            raise ValueError(
+                f"Element '{bm}' is not a supported BlockModel in the OMF file: {self.filepath}"
+            )
+        attributes_in_scope: Optional[list[str]] = self._attributes_in_scope(bm, attributes=attributes, query=query)
+        arrays: dict[str, np.ndarray] = {}
+        if mmap:
+            arrays = self._map_attribute_arrays(blockmodel_name, attributes_in_scope)
+        if self.lazy:
+            if attributes_in_scope is None:
+                attributes_in_scope = [a.name for a in bm.attributes]
+            self._load_attribute_arrays(blockmodel_name,
+                                        [a for a in attributes_in_scope
+                                         if a not in arrays and (decoded is None or a not in decoded)],
+                                        max_workers=max_workers)
+        return arrays
+
+    def _attribute_cache_view(self, blockmodel_name: str) -> Optional[ElementCacheView]:
+        """The cached attributes of a BlockModel, or None if the reader has no cache."""
+        if self.attribute_cache is None:
+            return None
+        return self.attribute_cache.element_view(self.filepath, blockmodel_name)
+
+    @staticmethod
+    def _attributes_in_scope(bm, attributes: Optional[list[str]] = None,
+                             query: Optional[str] = None) -> Optional[list[str]]:
+        """The stored attributes required to read the requested attributes and query.
+
+        Calculated attributes are replaced by the stored attributes their expressions (transitively) reference, or
+        by their hidden materialization if valid.  Returns None when all stored attributes are required.
+        """
+        calculated_attributes: dict[str, str] = bm.metadata.get('calculated_attributes', {})
+        if attributes is None:
+            return None
+        required: list[str] = list(attributes)
+        if query is not None:
+            required.extend(parse_vars_from_expr(query))
+        return stored_dependencies(calculated_attributes, required, valid_materializations(bm))
+
     def read_block_models(
             self,
             blockmodel_attributes: dict[str, list[str]],
@@ -79,6 +230,9 @@ class OMFPandasReader(OMFPandas):
     ) -> pd.DataFrame:
         """Return a DataFrame from multiple BlockModels.
 
+        The BlockModels must share the same geometry, which is compared by fingerprint.  The query is evaluated
+        once on the positional attributes, which may be from any of the BlockModels, and the index is built once.
+
         Args:
             blockmodel_attributes (dict[str, list[str]]): A dictionary of BlockModel names and the variables to include.
                 If the dict value is None, all attributes in the blockmodel (key) are included.
@@ -87,36 +241,41 @@ class OMFPandasReader(OMFPandas):
 
         Returns:
             pd.DataFrame: The DataFrame representing the merged BlockModels.
+
+        Raises:
+            ValueError: If the BlockModels have different geometries, or the attributes are not found.
         """
-        block_models: dict[str, pd.DataFrame] = {}
-        geometry_indexes: dict[str, pd.MultiIndex] = {}
-        index_filter = None
+        block_models: dict = {bm_name: self.get_element_by_name(bm_name) for bm_name in blockmodel_attributes}
+        available_attributes: dict[str, list[str]] = {
+            bm_name: [a.name for a in bm.attributes if not is_materialized(a)] +
+                     list(bm.metadata.get('calculated_attributes', {}).keys())
+            for bm_name, bm in block_models.items()}
+
+        # validate the geometries are equivalent
+        geometries: dict[str, Geometry] = {bm_name: self.get_bm_geometry(bm_name) for bm_name in block_models}
+        first_name, first_geometry = next(iter(geometries.items()))
+        for bm_name, geometry in geometries.items():
+            if geometry.fingerprint != first_geometry.fingerprint:
+                raise ValueError(f"Geometry of '{bm_name}' is different from the geometry of '{first_name}'.")
+
+        index_filter: Optional[np.ndarray] = None
         if query:
-            # we use the query to generate an index_filter to filter the block models since they may not have
-            # the query attributes available in the given model.
-            query_attrs: list[str] = parse_vars_from_expr(query)
-            # extract the attributes for the query_attributes, noting that they may be in different block models
-            chunks: list[pd.Series] = []
-            for bm_name in blockmodel_attributes:
-                for attr in query_attrs:
-                    if attr in self.blockmodel_attributes[bm_name]:
-                        chunks.append(
-                            self.read_blockmodel(blockmodel_name=bm_name,
-                                                 attributes=[attr], encode_index=encode_index)[attr])
-            tmp_df: pd.DataFrame = pd.concat(chunks, axis=1).query(query)
-            # get the index locations of the filtered index relative to the full index
-            filtered_index = tmp_df.index
-            # full_index = geometry_to_index(self.get_element_by_name(self._elements[0].name).geometry)
-            full_index: pd.MultiIndex = self.get_bm_geometry(
-                blockmodel_name=list(blockmodel_attributes.keys())[0]
-            ).to_multi_index()
-            # Find the intersection of the two MultiIndex objects
-            intersection = full_index.intersection(filtered_index)
-            index_filter = full_index.get_indexer(intersection)
-
+            # the query attributes may be in any of the block models, so the query is evaluated on the positional
+            # attributes to generate an index_filter that applies to all block models.
+            query_series: list[pd.Series] = []
+            for attr in parse_vars_from_expr(query):
+                bm_name: Optional[str] = next((name for name, attrs in available_attributes.items() if attr in attrs),
+                                              None)
+                if bm_name is None:
+                    raise ValueError(f"Query variable '{attr}' not found in the BlockModels: "
+                                     f"{list(blockmodel_attributes.keys())}")
+                query_series.append(self._read_positional(bm_name, [attr])[attr])
+            index_filter = pd.concat(query_series, axis=1).query(query).index.to_numpy()
+
+        chunks: list[pd.DataFrame] = []
         for bm_name, requested_attrs in blockmodel_attributes.items():
             # check that the requested attrs exist in the specified bm
-            available_attrs = self.blockmodel_attributes[bm_name]
+            available_attrs = available_attributes[bm_name]
             if requested_attrs is None:
                 requested_attrs = available_attrs
             else:
@@ -126,32 +285,27 @@ class OMFPandasReader(OMFPandas):
                         f"Attributes {missing_attrs} not found in BlockModel '{bm_name}'. "
                         f"Available attributes are: {available_attrs}"
                     )
+            chunks.append(self._read_positional(bm_name, requested_attrs, index_filter=index_filter))
+
+        res: pd.DataFrame = pd.concat(chunks, axis=1)
+        if index_filter is None:
+            res.index = first_geometry.to_multi_index()
+        else:
+            # only the filtered cells are indexed, from their positions in the geometry
+            res.index = first_geometry.positions_multi_index(np.asarray(index_filter))
+        if encode_index:
+            res.index = multiindex_to_encoded_index(res.index)
+        return res
 
-            block_models[bm_name] = self.read_blockmodel(
-                blockmodel_name=bm_name,
-                attributes=requested_attrs,
-                index_filter=index_filter if query else None,
-            )
-            # geometry_indexes[bm_name] = geometry_to_index(self.get_bm_geometry(bm_name))
-            geometry_indexes[bm_name] = self.get_bm_geometry(
-                blockmodel_name=bm_name
-            ).to_multi_index()
-
-        # validate the indexes are equivalent
-        def ensure_identical_indexes(index_dict: dict[str, pd.MultiIndex]) -> None:
-            if not index_dict:
-                return
-
-            first_index = next(iter(index_dict.values()))
-            for name, index in index_dict.items():
-                if not first_index.equals(index):
-                    raise ValueError(
-                        f"Index for '{name}' is different from the first index."
-                    )
-
-        ensure_identical_indexes(geometry_indexes)
-
-        return pd.concat(block_models.values(), axis=1)
+    def _read_positional(self, blockmodel_name: str, attributes: list[str],
+                         index_filter: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Read the attributes of a BlockModel with a positional index, without building the geometry index."""
+        bm = self.get_element_by_name(blockmodel_name)
+        decoded: Optional[ElementCacheView] = self._attribute_cache_view(blockmodel_name)
+        arrays: dict[str, np.ndarray] = self._prepare_arrays(blockmodel_name, bm, attributes=attributes,
+                                                             decoded=decoded)
+        return blockmodel_to_df(bm, variables=attributes, index_filter=index_filter, arrays=arrays, decoded=decoded,
+                                index=False)
 
     def plot_blockmodel(
             self,
@@ -173,6 +327,7 @@ class OMFPandasReader(OMFPandas):
         Returns:
             pv.Plotter: The PyVista plotter object.
         """
+        self._load_attribute_arrays(blockmodel_name, [scalar])
         block_model = OMFBlockModel(self.get_element_by_name(blockmodel_name))
         return block_model.plot(
             scalar=scalar,
@@ -197,7 +352,37 @@ class OMFPandasReader(OMFPandas):
             Tuple[float, float, float]: The coordinates of the nearest centroid.
         """
 
-        # get the geometry for the first block model if not provided
+        geometry: Geometry = self._lookup_geometry(blockmodel_name)
+        # perform the lookup
+        nearest_x, nearest_y, nearest_z = geometry.nearest_centroid_lookup(x, y, z)
+
+        return nearest_x, nearest_y, nearest_z
+
+    def find_nearest_centroids(self, x: np.ndarray, y: np.ndarray, z: np.ndarray,
+                               blockmodel_name: Optional[str] = None) -> pd.DataFrame:
+        """Find the blocks containing many points, e.g. to flag drillhole samples with the blocks they fall in.
+
+        The points are located in a single vectorized pass, for regular and irregular (tensor) geometries.
+
+        Args:
+            x (np.ndarray): The x coordinates of the points.
+            y (np.ndarray): The y coordinates of the points.
+            z (np.ndarray): The z coordinates of the points.
+            blockmodel_name: The optional block model name.  If not provided, the geometry for the first
+             block model is used.
+
+        Returns:
+            pd.DataFrame: A row per point, with the centroid of the block (x, y, z), the flat (C order) position of
+            the block (position) and whether the point is in the grid (in_grid).  Points outside the grid are
+            assigned the nearest block on its boundary.
+        """
+        geometry: Geometry = self._lookup_geometry(blockmodel_name)
+        centroids, positions, in_grid = geometry.nearest_centroids(x, y, z)
+        return pd.DataFrame({'x': centroids[:, 0], 'y': centroids[:, 1], 'z': centroids[:, 2],
+                             'position': positions, 'in_grid': in_grid})
+
+    def _lookup_geometry(self, blockmodel_name: Optional[str] = None) -> Geometry:
+        """Return the geometry of a BlockModel, or of the first BlockModel if the name is not provided."""
         if blockmodel_name is None:
             blockmodel_names = [
                 element_name
@@ -207,12 +392,4 @@ class OMFPandasReader(OMFPandas):
             if not blockmodel_names:
                 raise ValueError("No BlockModel found in the OMF file.")
             blockmodel_name = blockmodel_names[0]
-
-        # get the geometry for the block model
-        geometry: Geometry = OMFBlockModel(
-            self.get_element_by_name(blockmodel_name)
-        ).geometry
-        # perform the lookup
-        nearest_x, nearest_y, nearest_z = geometry.nearest_centroid_lookup(x, y, z)
-
-        return nearest_x, nearest_y, nearest_z
+        return self.get_bm_geometry(blockmodel_name)
@@ -0,0 +1,187 @@
+"""
+Incremental persistence of an omf project into an existing OMF archive.
+
+An OMF file is a zip archive of the project json and one entry per binary array, keyed by uuid.  omf.save serializes
+every array from memory and the writer then reloads the project.  Here, the arrays unchanged since they were read or
+last saved keep their existing entries, which are copied from the file, and only the new or changed arrays are
+written from memory.  An array is unchanged if it is the Array that was read or last saved, and the CRC-32 of its
+values matches that of its entry, so values replaced or changed in place are detected.  The archive is rewritten to
+a temporary file that replaces the original, so entries no longer referenced are dropped.  Arrays may also be stored
+uncompressed, so they can be memory-mapped when read.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+import numpy as np
+import properties
+from omf.attribute import Array
+from omf.fileio import OMF_VERSION
+from omf.texture import Image
+
+COPY_BUFFER_SIZE = 1 << 20  # the bytes read at a time when copying an entry
+
+# the Arrays with a payload in the archive, keyed by id: (the Array, the name of its entry)
+ArrayReferences = dict[int, tuple[Array, str]]
+
+
+def iter_binary_references(obj: Any, obj_json: Any) -> Iterator[tuple[Union[Array, Image], dict]]:
+    """Yield the Arrays and Images of an omf object, with their serialized json.
+
+    Args:
+        obj: The omf object, e.g. a Project.
+        obj_json: The serialized json of the object.
+
+    Yields:
+        tuple[Union[Array, Image], dict]: The Array or Image, and its serialized json, which references the payload.
+    """
+    if isinstance(obj, (Array, Image)):
+        if isinstance(obj_json, dict):
+            yield obj, obj_json
+    elif isinstance(obj, properties.HasProperties) and isinstance(obj_json, dict):
+        for key, value_json in obj_json.items():
+            if key in obj._props:
+                yield from iter_binary_references(getattr(obj, key), value_json)
+    elif isinstance(obj, (list, tuple)) and isinstance(obj_json, list):
+        for item, item_json in zip(obj, obj_json):
+            yield from iter_binary_references(item, item_json)
+
+
+def read_array_references(project, filepath: Path) -> ArrayReferences:
+    """Return the payload entries of the Arrays of a project, as persisted in the OMF file.
+
+    The project must be as loaded from, or last saved to, the file, so its structure matches the project json.
+
+    Args:
+        project: The omf Project.
+        filepath: The OMF file.
+
+    Returns:
+        ArrayReferences: The Arrays with a payload in the archive.
+    """
+    with zipfile.ZipFile(filepath, mode='r') as zf:
+        project_json: dict = json.loads(zf.read('project.json').decode('utf-8'))
+        entries: set[str] = set(zf.namelist())
+    return {id(obj): (obj, obj_json['array'])
+            for obj, obj_json in iter_binary_references(project, project_json)
+            if isinstance(obj, Array) and obj.array is not None and obj_json.get('array') in entries}
+
+
+def array_payload(array: Array) -> Union[bytes, memoryview]:
+    """Return the binary payload of an Array, as serialized by omf.  Numeric arrays are not copied."""
+    if array.data_type == "BooleanArray":
+        return np.packbits(array.array, axis=None).tobytes()
+    return memoryview(np.ascontiguousarray(array.array)).cast('B')
+
+
+def is_unchanged(array: Array, info: zipfile.ZipInfo) -> bool:
+    """True if the payload of an Array matches the size and CRC-32 of its entry in the archive directory.
+
+    The CRC is computed from the Array values in memory, so the entry is not read.  Values replaced in place on the
+    same Array, e.g. `array.array = new_values`, do not match.
+    """
+    payload: Union[bytes, memoryview] = array_payload(array)
+    return len(payload) == info.file_size and zlib.crc32(payload) == info.CRC
+
+
+def save_project(project, filepath: Path, compression: int = zipfile.ZIP_DEFLATED) -> ArrayReferences:
+    """Save a project to a new OMF file, as omf.save, with the arrays compressed or stored.
+
+    Arrays stored uncompressed (zipfile.ZIP_STORED) can be memory-mapped when read.
+
+    Args:
+        project: The omf Project.
+        filepath: The OMF file, which is overwritten if it exists.
+        compression: The zipfile compression of the arrays, e.g. zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED.
+
+    Returns:
+        ArrayReferences: The Arrays with a payload in the archive.
+    """
+    with zipfile.ZipFile(filepath, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        return _write_project(zf, None, project, {}, compression)
+
+
+def update_project(project, filepath: Path, references: ArrayReferences,
+                   compression: int = zipfile.ZIP_DEFLATED) -> ArrayReferences:
+    """Persist a project into its existing OMF file, copying the entries of the unchanged arrays.
+
+    The file is rewritten to a temporary file alongside, which then replaces the original, so the entries no longer
+    referenced (including the previous project json) are dropped.  The Arrays read or last saved from the file whose
+    payload is unchanged are copied from their existing entries.  Other Arrays, e.g. those of new or overwritten
+    attributes, are written from memory.
+
+    Args:
+        project: The omf Project.
+        filepath: The existing OMF file of the project.
+        references: The Arrays with a payload in the archive, see read_array_references.
+        compression: The zipfile compression of the written arrays.
+
+    Returns:
+        ArrayReferences: The Arrays with a payload in the archive once the project is persisted.
+    """
+    filepath = Path(filepath)
+    fd, temp_name = tempfile.mkstemp(suffix='.tmp', prefix=filepath.name, dir=filepath.parent)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(filepath, mode='r') as source, \
+                zipfile.ZipFile(temp_name, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            updated: ArrayReferences = _write_project(zf, source, project, references, compression)
+        os.replace(temp_name, filepath)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    return updated
+
+
+def _write_project(zf: zipfile.ZipFile, source: Optional[zipfile.ZipFile], project, references: ArrayReferences,
+                   compression: int) -> ArrayReferences:
+    """Write the project json and the arrays, copying the unchanged entries of the source archive, if any."""
+    project.validate()
+    # serialized without the binary payloads, which are resolved below
+    project_json: dict = project.serialize(include_class=False)
+    project_json["version"] = OMF_VERSION
+
+    entries: dict[str, zipfile.ZipInfo] = {info.filename: info for info in source.infolist()} if source else {}
+    copied: list[zipfile.ZipInfo] = []
+    payloads: dict[str, Any] = {}
+    updated: ArrayReferences = {}
+    for obj, obj_json in iter_binary_references(project, project_json):
+        if isinstance(obj, Image):
+            payloads[obj_json['image']] = obj
+            continue
+        reference = references.get(id(obj))
+        info: Optional[zipfile.ZipInfo] = entries.get(reference[1]) if reference is not None else None
+        if info is not None and reference[0] is obj and is_unchanged(obj, info):
+            entry: str = info.filename
+            copied.append(info)
+        else:
+            entry = str(uuid.uuid4())
+            payloads[entry] = obj
+        obj_json['array'] = entry
+        updated[id(obj)] = (obj, entry)
+
+    date_time = datetime.datetime.now(datetime.timezone.utc).timetuple()[:6]
+    zf.writestr(zipfile.ZipInfo(filename="project.json", date_time=date_time),
+                json.dumps(project_json).encode("utf-8"), compress_type=zipfile.ZIP_DEFLATED)
+    for info in copied:
+        target = zipfile.ZipInfo(filename=info.filename, date_time=info.date_time)
+        target.compress_type = info.compress_type
+        target.file_size = info.file_size  # so zip64 is used for large entries
+        with source.open(info) as src, zf.open(target, mode='w') as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    for entry, obj in payloads.items():
+        if isinstance(obj, Image):
+            obj.image.seek(0)
+            payload: Union[bytes, memoryview] = obj.image.read()
+        else:
+            payload = array_payload(obj)
+        zf.writestr(zipfile.ZipInfo(filename=entry, date_time=date_time), payload, compress_type=compression)
+    return updated
@@ -0,0 +1,211 @@
+"""
+Element-wise evaluation of query and calculated attribute expressions over numpy arrays.
+
+Expressions are compiled once, and evaluated with numexpr when it is installed, which evaluates in cache-sized
+blocks using multiple threads.  Otherwise, the expression is evaluated with numpy in chunks of cells, concurrently,
+so temporaries are chunk-sized rather than the size of the model.
+"""
+
+import ast
+import os
+import re
+import tokenize
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from io import StringIO
+from types import CodeType
+from typing import Optional, Mapping, Callable
+
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+EVALUATION_CHUNK_CELLS = 262_144  # the number of cells evaluated per chunk by the numpy backend
+
+# functions supported by numexpr, and their numpy equivalents
+FUNCTIONS: dict[str, Callable] = {'where': np.where, 'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log,
+                                  'log10': np.log10}
+
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name, ast.Load, ast.Constant, ast.Call,
+          ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.UAdd,
+          ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class _ElementWise(ast.NodeTransformer):
+    """Rewrite boolean operators and chained comparisons as element-wise operators."""
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result: ast.AST = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        self.generic_visit(node)
+        operands: list[ast.AST] = [node.left] + node.comparators
+        result: Optional[ast.AST] = None
+        for left, op, right in zip(operands[:-1], node.ops, operands[1:]):
+            pair = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = pair if result is None else ast.BinOp(left=result, op=ast.BitAnd(), right=pair)
+        return result
+
+
+@dataclass(frozen=True)
+class CompiledExpression:
+    """An expression compiled for element-wise evaluation over arrays.
+
+    Attributes:
+        expression (str): The element-wise expression, with the variables renamed to identifiers.
+        variables (dict[str, str]): The variable names, keyed by their identifier in the expression.
+        code (CodeType): The compiled expression, evaluated by the numpy backend.
+    """
+
+    expression: str
+    variables: dict[str, str]
+    code: CodeType
+
+    def evaluate(self, values: Mapping[str, np.ndarray], chunk_cells: int = EVALUATION_CHUNK_CELLS,
+                 max_workers: Optional[int] = None) -> Optional[np.ndarray]:
+        """Evaluate the expression.
+
+        Args:
+            values (Mapping[str, np.ndarray]): The arrays of the variables, keyed by variable name.
+            chunk_cells (int): The number of cells evaluated per chunk by the numpy backend.
+            max_workers (Optional[int]): The number of threads used by the numpy backend.  If None, the number of
+                cpus is used.
+
+        Returns:
+            Optional[np.ndarray]: The result, e.g. a boolean mask for a query, or None if the arrays cannot be
+            evaluated, e.g. a bitwise operator applied to floats, in which case the caller falls back to pandas.
+        """
+        arrays: dict[str, np.ndarray] = {identifier: np.asarray(values[name])
+                                         for identifier, name in self.variables.items()}
+        if numexpr is not None:
+            try:
+                return numexpr.evaluate(self.expression, local_dict=arrays, global_dict={})
+            except (KeyError, TypeError, ValueError, NotImplementedError):
+                # e.g. an operation on a dtype numexpr does not support
+                pass
+
+        try:
+            return self._evaluate_chunks(arrays, chunk_cells, max_workers)
+        except (TypeError, ValueError, NotImplementedError):
+            # e.g. an operation numpy does not support on the dtypes of the arrays
+            return None
+
+    def _evaluate_chunks(self, arrays: dict[str, np.ndarray], chunk_cells: int,
+                         max_workers: Optional[int]) -> np.ndarray:
+        """Evaluate the expression with numpy, in chunks of cells."""
+        num_cells: int = len(next(iter(arrays.values()))) if arrays else 0
+        if num_cells <= chunk_cells:
+            return np.asarray(eval(self.code, dict(FUNCTIONS), arrays))
+
+        def evaluate_chunk(start: int) -> np.ndarray:
+            chunk: dict[str, np.ndarray] = {k: v[start:start + chunk_cells] for k, v in arrays.items()}
+            return np.asarray(eval(self.code, dict(FUNCTIONS), chunk))
+
+        starts = range(0, num_cells, chunk_cells)
+        max_workers = os.cpu_count() if max_workers is None else max_workers
+        if max_workers < 2:
+            return np.concatenate([evaluate_chunk(start) for start in starts])
+        # numpy releases the GIL, so the chunks are evaluated concurrently
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(starts))) as executor:
+            return np.concatenate(list(executor.map(evaluate_chunk, starts)))
+
+
+def _replace_booleans(expr: str) -> str:
+    """Replace the & and | operators with and / or, so they bind more loosely than comparisons, as in pandas."""
+    replacements: dict[str, str] = {'&': 'and', '|': 'or'}
+    tokens = tokenize.generate_tokens(StringIO(expr).readline)
+    return tokenize.untokenize((tokenize.NAME, replacements[token.string])
+                               if token.type == tokenize.OP and token.string in replacements
+                               else (token.type, token.string) for token in tokens)
+
+
+def parse_expression(expr: str, query: bool = False) -> Optional[tuple[ast.Expression, dict[str, str]]]:
+    """Parse a pandas query or calculated attribute expression.
+
+    Backtick quoted variables are replaced with valid identifiers.  A query follows the pandas precedence, where
+    & and | bind more loosely than comparisons, so `a > 1 & b > 1` is `(a > 1) and (b > 1)` rather than the python
+    chained comparison `a > (1 & b) > 1`.
+
+    Args:
+        expr: The expression string.
+        query: If True, the expression is a pandas query, otherwise it follows the python precedence.
+
+    Returns:
+        Optional[tuple[ast.Expression, dict[str, str]]]: The parsed expression and the variable names keyed by
+        their placeholder identifier, or None if the expression cannot be parsed.
+    """
+    names: dict[str, str] = {}
+
+    def _substitute(match: re.Match) -> str:
+        placeholder: str = f"__backtick_{len(names)}__"
+        names[placeholder] = match.group(1)
+        return placeholder
+
+    source: str = re.sub(r"`([^`]*)`", _substitute, expr)
+    try:
+        return ast.parse(_replace_booleans(source) if query else source, mode='eval'), names
+    except (SyntaxError, tokenize.TokenError):
+        return None
+
+
+@lru_cache(maxsize=256)
+def compile_expression(expr: str, query: bool = False) -> Optional[CompiledExpression]:
+    """Compile a pandas query or calculated attribute expression for element-wise evaluation over arrays.
+
+    The python boolean operators (and, or, not) and chained comparisons are rewritten as element-wise operators,
+    and backtick quoted variables are supported.
+
+    Args:
+        expr: The expression string.
+        query: If True, the expression is a pandas query, where & and | bind more loosely than comparisons.
+            Otherwise, e.g. a calculated attribute evaluated by python, the python precedence applies.
+
+    Returns:
+        Optional[CompiledExpression]: The compiled expression, or None if the expression cannot be evaluated over
+        numeric arrays, e.g. it contains strings, attribute access or unsupported functions.
+    """
+    parsed = parse_expression(expr, query=query)
+    if parsed is None:
+        return None
+    tree, names = parsed
+    tree = ast.fix_missing_locations(_ElementWise().visit(tree))
+
+    renamed: set[int] = set()  # the ids of the function name nodes, and the variable nodes once renamed
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            return None
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            return None
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                return None
+            renamed.add(id(node.func))
+
+    # rename the variables, noting the operands of chained comparisons are shared by the comparison pairs
+    identifiers: dict[str, str] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and id(node) not in renamed:
+            name: str = names.get(node.id, node.id)
+            identifiers.setdefault(name, f"v{len(identifiers)}")
+            renamed.add(id(node))
+            node.id = identifiers[name]
+    variables: dict[str, str] = {identifier: name for name, identifier in identifiers.items()}
+
+    expression: str = ast.unparse(tree)
+    return CompiledExpression(expression=expression, variables=variables,
+                              code=compile(expression, '<expression>', 'eval'))
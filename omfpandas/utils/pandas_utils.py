@@ -1,12 +1,15 @@
+import ast
 import tokenize
 from io import StringIO
 from token import STRING
-from typing import Literal
+from typing import Literal, Union
 
 import pandas as pd
 import numpy as np
 from pandas import CategoricalDtype
 
+from omfpandas.utils.expression_utils import parse_expression
+
 
 def is_nullable_integer_dtype(series: pd.Series) -> bool:
     """
@@ -78,6 +81,61 @@ def parse_vars_from_expr(expr: str) -> list[str]:
     return list(variables)
 
 
+def parse_comparisons_from_expr(expr: str) -> list[tuple[str, str, Union[int, float]]]:
+    """ Parse the simple comparisons that must all be True for a pandas query expression to be True.
+
+    Only comparisons of a variable with a numeric literal (e.g. `cu > 2.5`) that are combined with `and` / `&`
+    are returned.  Other terms (e.g. `or`, `not`, string comparisons) are ignored, so the comparisons are necessary
+    but not sufficient conditions.
+
+    Args:
+        expr: The expression string
+
+    Returns:
+        list[tuple[str, str, Union[int, float]]]: The (variable, operator, value) comparisons, with the variable on
+        the left-hand side.
+    """
+    # & and | bind more loosely than comparisons, as in a pandas query
+    parsed = parse_expression(expr, query=True)
+    if parsed is None:
+        return []
+    tree, names = parsed
+
+    reversed_ops: dict[str, str] = {'>': '<', '>=': '<=', '<': '>', '<=': '>=', '==': '==', '!=': '!='}
+    op_symbols: dict[type, str] = {ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==',
+                                   ast.NotEq: '!='}
+
+    def _literal(node: ast.AST):
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = _literal(node.operand)
+            return None if value is None else (-value if isinstance(node.op, ast.USub) else value)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            return node.value
+        return None
+
+    comparisons: list[tuple[str, str, Union[int, float]]] = []
+
+    def _visit(node: ast.AST):
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            for value in node.values:
+                _visit(value)
+        elif isinstance(node, ast.Compare):
+            # chained comparisons (e.g. 1 < cu < 2) are split into pairs
+            operands = [node.left] + node.comparators
+            for left, op, right in zip(operands[:-1], node.ops, operands[1:]):
+                symbol = op_symbols.get(type(op))
+                if symbol is None:
+                    continue
+                if isinstance(left, ast.Name) and _literal(right) is not None:
+                    comparisons.append((names.get(left.id, left.id), symbol, _literal(right)))
+                elif isinstance(right, ast.Name) and _literal(left) is not None:
+                    comparisons.append((names.get(right.id, right.id), reversed_ops[symbol], _literal(left)))
+
+    _visit(tree.body)
+    return comparisons
+
+
 def create_test_blockmodel(shape: tuple[int, int, int],
                            block_size: tuple[float, float, float],
                            corner: tuple[float, float, float],
@@ -1,8 +1,12 @@
 import json
 import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Literal, Union
+from typing import Optional, Literal, Union, Iterator, Iterable
 
+import numpy as np
 import omf
 import pandas as pd
 import ydata_profiling
@@ -10,11 +14,17 @@ import ydata_profiling
 from omfpandas import OMFPandasReader
 from omfpandas.audit import ChangeMessage
 from omfpandas.base import OMFPandas
-from omfpandas.blockmodels.convert_blockmodel import df_to_blockmodel, blockmodel_to_df
+from omfpandas.cache import AttributeCache, ElementCacheView
+from omfpandas.blockmodels.calculated import calculation_order, stored_dependencies, valid_materializations, \
+    calculated_fingerprint, array_fingerprint, is_materialized, MATERIALIZED_PREFIX
+from omfpandas.blockmodels.attributes import series_to_attribute
+from omfpandas.blockmodels.convert_blockmodel import df_to_blockmodel, blockmodel_to_df, chunks_to_blockmodel
+from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry, POSITION_INDEX_NAME
 
 from omfpandas.extras import _import_ydata_profiling, _import_pandera, _import_pandera_io
 from omfpandas.utils.pandas_utils import parse_vars_from_expr
 from omfpandas.utils.pandera_utils import DataFrameMetaProcessor, load_schema_from_yaml
+from omfpandas.utils.archive_utils import ArrayReferences, update_project, save_project, read_array_references
 from omfpandas.utils import log_timer
 
 def get_username():
@@ -38,13 +48,32 @@ class OMFPandasWriter(OMFPandasReader):
         filepath (Path): Path to the OMF file.
     """
 
-    def __init__(self, filepath: PathLike):
+    def __init__(self, filepath: PathLike, attribute_cache: Optional[AttributeCache] = None,
+                 incremental: bool = False, compress_arrays: bool = True):
         """Instantiate the OMFPandasWriter object.
 
         Args:
             filepath (Path): Path to the OMF file.
+            attribute_cache (Optional[AttributeCache]): An optional cache of decoded attributes.  The entries of the
+                file are invalidated when the project is persisted.
+            incremental (bool): If True, the project is persisted by copying the entries of the unchanged arrays
+                from the existing file and writing only the new or changed arrays, and the project is not reloaded.
+                Default is False.
+            compress_arrays (bool): If True, the arrays are compressed, as by omf.save.  If False, the arrays are
+                stored uncompressed, so they can be memory-mapped when read, see read_blockmodel(mmap=True), at the
+                cost of a larger file.  Default is True.
         """
         OMFPandas.__init__(self, filepath)
+        self.attribute_cache: Optional[AttributeCache] = attribute_cache
+        self.incremental: bool = incremental
+        self.compression: int = zipfile.ZIP_DEFLATED if compress_arrays else zipfile.ZIP_STORED
+        # the arrays persisted in the file, reused by incremental saves
+        self._array_references: ArrayReferences = {}
+        # elements modified in memory since the project was persisted
+        self._modified_elements: set[str] = set()
+        # the depth of nested transactions, and whether a transaction has changes to persist on commit
+        self._transaction_depth: int = 0
+        self._persist_pending: bool = False
         self.user_id = get_username()
 
         if not isinstance(filepath, Path):
@@ -62,31 +91,35 @@ class OMFPandasWriter(OMFPandasReader):
             # save the (now modified) project to the omf file
             self.persist_project()
 
-        super().__init__(filepath)
+        super().__init__(filepath, attribute_cache=attribute_cache)
+        self._track_array_references()
 
     @log_timer()
     def create_blockmodel(self, blocks: pd.DataFrame, blockmodel_name: str,
                           pd_schema: Optional[Union[Path, dict]] = None,
-                          allow_overwrite: bool = False):
+                          allow_overwrite: bool = False,
+                          geometry: Optional[Union[RegularGeometry, TensorGeometry]] = None):
         """Create an omf BlockModel from a dataframe.
 
         Only dataframes with centroid (x, y, z) and block dims (dx, dy, dz) indexes are supported.
 
+        If the geometry is provided it is not inferred from the index, and the blocks are reordered only if they are
+        not in C order, which avoids sorting and inspecting the index.  The blocks must be the cells of the geometry.
+
         Args:
             blocks (pd.DataFrame): The dataframe to write to the BlockModel.
             blockmodel_name (str): The name of the BlockModel to write to. Use dot notation for composite (e.g., Composite.BlockModel).
             pd_schema (Optional[Union[Path, dict]]): The path to the Pandera schema file or a dict of the schema.
              Default is None.  If provided, the schema will be used to validate the dataframe before writing.
             allow_overwrite (bool): If True, overwrite the existing BlockModel. Default is False.
+            geometry (Optional[Union[RegularGeometry, TensorGeometry]]): The geometry of the BlockModel.  If None,
+             the geometry is inferred from the index.
 
         Raises:
-            ValueError: If the element retrieved is not a BlockModel.
+            ValueError: If the element retrieved is not a BlockModel, or the blocks are not the cells of the geometry.
         """
-        composite_name = None
         full_blockmodel_name = blockmodel_name
-
-        if '.' in blockmodel_name:
-            composite_name, blockmodel_name = blockmodel_name.split('.', 1)
+        blockmodel_name = blockmodel_name.split('.', 1)[-1]
 
         calculation_map: dict = {}
         if pd_schema is not None:
@@ -113,71 +146,134 @@ class OMFPandasWriter(OMFPandasReader):
             blocks = dfmp.validate(blocks, return_calculated_columns=False)
 
             self._logger.info(f"Creating BlockModel from dataframe: {blockmodel_name}")
-            bm = df_to_blockmodel(blocks, blockmodel_name)
+            bm = df_to_blockmodel(blocks, blockmodel_name, geometry=geometry)
 
             # persist the schema inside the omf file
             bm.description = pd_schema.description
             bm.metadata['pd_schema'] = pd_schema.to_json()
         else:
             self._logger.info(f"Creating BlockModel from dataframe: {blockmodel_name}")
-            bm = df_to_blockmodel(blocks, blockmodel_name)
+            bm = df_to_blockmodel(blocks, blockmodel_name, geometry=geometry)
+
+        self._add_blockmodel(bm, full_blockmodel_name, allow_overwrite=allow_overwrite)
+        if pd_schema is not None:
+            # write the calculated variables to the omf block model metadata, persisted with the BlockModel
+            self.create_calculated_blockmodel_attributes(full_blockmodel_name, calc_definitions=calculation_map)
+        else:
+            self.persist_project()
+
+    @log_timer()
+    def create_blockmodel_from_chunks(self, blockmodel_name: str, geometry: Union[RegularGeometry, TensorGeometry],
+                                      chunks: Iterable[pd.DataFrame], spill_dir: Optional[Path] = None,
+                                      allow_overwrite: bool = False):
+        """Create an omf BlockModel from chunks of blocks, e.g. the slabs produced by an estimation run.
+
+        The blocks are not assembled in one DataFrame.  Each chunk is scattered into the attribute arrays at the
+        (C order) cell positions of its centroids, which are calculated from the geometry.
+
+        Args:
+            blockmodel_name (str): The name of the BlockModel to write to. Use dot notation for composite
+                (e.g., Composite.BlockModel).
+            geometry (Union[RegularGeometry, TensorGeometry]): The geometry of the BlockModel.
+            chunks (Iterable[pd.DataFrame]): The chunks of blocks, indexed by centroid (x, y, z), with a column per
+                attribute.  Cells not in any chunk are null.
+            spill_dir (Optional[Path]): If provided, the attribute arrays are accumulated in memory-mapped files
+                within this directory, rather than in memory.
+            allow_overwrite (bool): If True, overwrite the existing BlockModel. Default is False.
+
+        Raises:
+            ValueError: If the BlockModel exists and allow_overwrite is False, or a chunk is invalid.
+        """
+        name: str = blockmodel_name.split('.', 1)[-1]
+        self._logger.info(f"Creating BlockModel from chunks: {name}")
+        bm = chunks_to_blockmodel(chunks, geometry, name, spill_dir=spill_dir)
+        self._add_blockmodel(bm, blockmodel_name, allow_overwrite=allow_overwrite)
+        self.persist_project()
+
+    def _add_blockmodel(self, bm, blockmodel_name: str, allow_overwrite: bool = False):
+        """Add a BlockModel to the project (or a composite), recording the change.
+
+        Args:
+            bm: The BlockModel.
+            blockmodel_name (str): The name of the BlockModel. Use dot notation for composite
+                (e.g., Composite.BlockModel).
+            allow_overwrite (bool): If True, overwrite the existing BlockModel. Default is False.
 
-        if bm.name in [element.name for element in self.project.elements]:
+        Raises:
+            ValueError: If the BlockModel exists and allow_overwrite is False.
+        """
+        composite_name: Optional[str] = blockmodel_name.split('.', 1)[0] if '.' in blockmodel_name else None
+        composite = None
+        if composite_name in [element.name for element in self.project.elements]:
+            composite = self.get_element_by_name(composite_name)
+        # the elements the BlockModel is added to, once the composite is created if required
+        siblings: list = self.project.elements if composite_name is None else \
+            (composite.elements if composite is not None else [])
+
+        if bm.name in [element.name for element in siblings]:
             if not allow_overwrite:
                 raise ValueError(f"BlockModel '{blockmodel_name}' already exists in the OMF file: {self.filepath}.  "
                                  f"If you want to overwrite, set allow_overwrite=True.")
             else:
                 # remove the existing volume from the project
-                volume_to_remove = [element for element in self.project.elements if element.name == bm.name][0]
-                self.project.elements.remove(volume_to_remove)
+                volume_to_remove = [element for element in siblings if element.name == bm.name][0]
+                siblings.remove(volume_to_remove)
 
         log_description: str = f"BlockModel written with {len(bm.attributes)} attributes"
         if composite_name:
-            # get the composite if it exists or create it if it does not
-            if composite_name not in [element.name for element in self.project.elements]:
+            # create the composite if it does not exist
+            if composite is None:
                 composite = omf.Composite(name=composite_name)
                 self.project.elements.append(composite)
-            else:
-                composite = self.get_element_by_name(composite_name)
             composite.elements.append(bm)
             log_description += f" in composite {composite_name}"
         else:
             self.project.elements.append(bm)
+        self._modified_elements.add(blockmodel_name)
 
         # create the audit record
         self.write_to_changelog(element=bm.name, action='create', description=log_description)
-        # write the omf project to file
-        self.persist_project()
 
-        # write the calculated variables to the omf block model metadata
-        if pd_schema is not None:
-            self.create_calculated_blockmodel_attributes(full_blockmodel_name, calc_definitions=calculation_map)
-
-    def create_calculated_blockmodel_attributes(self, blockmodel_name: str, calc_definitions: dict[str, str]):
+    def create_calculated_blockmodel_attributes(self, blockmodel_name: str, calc_definitions: dict[str, str],
+                                                materialize: bool = False):
         """Create a calculated attribute for a BlockModel.
 
         Calculated attributes reduce storage space by storing the calculation expression instead of the data.
         When the attribute is accessed, the expression is evaluated and the result returned.
         The calculation expression must be a valid pandas expression, and is stored in the metadata of the
-        blockmodel object.  Only OMF2 supports this feature.
+        blockmodel object.  Expressions may reference other calculated attributes, provided the references do not
+        form a cycle.  Only OMF2 supports this feature.
 
         Args:
             blockmodel_name (str): The name of the BlockModel.
             calc_definitions (dict[str, str]): A dictionary of attribute names and calculation expressions.
+            materialize (bool): If True, the results are also stored, see materialize_calculated_attributes.
+                Default is False.
+
+        Raises:
+            ValueError: If an attribute already exists, an expression references an unknown attribute or fails
+                to evaluate, or the calculated attributes reference each other in a cycle.
         """
         bm = self.get_element_by_name(blockmodel_name)
 
         # confirm the element is a BlockModel
         if bm.__class__.__name__ not in ['RegularBlockModel', 'TensorGridBlockModel']:
             raise ValueError(f"Element '{bm}' is not a supported BlockModel in the OMF file: {self.filepath}")
-        for attr_name, expr in calc_definitions.items():
+
+        # reject cycles before any definition is added, and add the definitions in dependency order
+        all_definitions: dict[str, str] = {**bm.metadata.get('calculated_attributes', {}), **calc_definitions}
+        calc_order: list[str] = [attr_name for attr_name in calculation_order(all_definitions)
+                                 if attr_name in calc_definitions]
+
+        for attr_name in calc_order:
+            expr: str = calc_definitions[attr_name]
             # check the attribute does not already exist
             if attr_name in self.get_element_attribute_names(blockmodel_name):
                 raise ValueError(f"Attribute '{attr_name}' already exists in BlockModel '{blockmodel_name}'.")
             attrs_in_scope = list(set(parse_vars_from_expr(expr)))
-            # validate that the attributes in the expression are in the schema
+            # validate that the attributes in the expression are in the schema, or are calculated attributes
             for attr in attrs_in_scope:
-                if attr not in self.get_element_attribute_names(blockmodel_name):
+                if attr not in self.get_element_attribute_names(blockmodel_name) and attr not in all_definitions:
                     raise ValueError(f"Expression attribute '{attr}' not found in BlockModel '{blockmodel_name}'.")
 
             # Load the head dataset containing the attributes in the expression to validate the expression is valid,
@@ -206,8 +302,78 @@ class OMFPandasWriter(OMFPandasReader):
             self.write_to_changelog(element=blockmodel_name, action='create',
                                     description=f"Calculated attribute [{attr_name}] added with expression {expr}")
 
+        if materialize:
+            self.materialize_calculated_attributes(blockmodel_name, attributes=calc_order)
+        else:
+            self.persist_project()
+
+    def materialize_calculated_attributes(self, blockmodel_name: str, attributes: Optional[list[str]] = None):
+        """Materialize calculated attributes, storing the results as hidden attributes in the OMF file.
+
+        A materialization is tagged with a fingerprint of the expression and the content of its inputs, and is read
+        in place of evaluating the expression while the fingerprint matches.  Writing or deleting an input
+        invalidates the materialization, which is refreshed when the project is persisted, so an expensive
+        calculated attribute is evaluated once per change of its inputs rather than once per read.
+
+        Args:
+            blockmodel_name (str): The name of the BlockModel.
+            attributes (Optional[list[str]]): The calculated attributes to materialize.  If None, all calculated
+                attributes are materialized.
+
+        Raises:
+            ValueError: If an attribute is not a calculated attribute of the BlockModel.
+        """
+        bm = self.get_element_by_name(blockmodel_name)
+        calculated_attributes: dict[str, str] = bm.metadata.get('calculated_attributes', {})
+        attributes = list(calculated_attributes) if attributes is None else attributes
+        unknown: list[str] = [attr_name for attr_name in attributes if attr_name not in calculated_attributes]
+        if unknown:
+            raise ValueError(f"Calculated attributes {unknown} not found in BlockModel '{blockmodel_name}'.")
+
+        bm.metadata['materialized_attributes'] = list(dict.fromkeys(bm.metadata.get('materialized_attributes', [])
+                                                                    + attributes))
+        self._refresh_materializations(blockmodel_name)
+        self.write_to_changelog(element=blockmodel_name, action='create',
+                                description=f"Calculated attributes {attributes} materialized")
         self.persist_project()
 
+    def _refresh_materializations(self, blockmodel_name: str):
+        """Re-evaluate the materialized calculated attributes of a BlockModel that are no longer valid.
+
+        Materializations of calculated attributes that can no longer be evaluated, e.g. since an input was
+        deleted, are removed.
+        """
+        bm = self.get_element_by_name(blockmodel_name)
+        calculated_attributes: dict[str, str] = bm.metadata.get('calculated_attributes', {})
+        valid: dict[str, str] = valid_materializations(bm)
+        stale: list[str] = [attr_name for attr_name in bm.metadata.get('materialized_attributes', [])
+                            if attr_name in calculated_attributes and attr_name not in valid]
+        if not stale:
+            return
+
+        stored: dict = {a.name: a for a in bm.attributes if a.location == 'cells' and not is_materialized(a)}
+        hidden: dict = {a.metadata['materialized'].get('attribute'): a for a in bm.attributes if is_materialized(a)}
+        for attr_name in stale:
+            inputs: list[str] = stored_dependencies(calculated_attributes, [attr_name])
+            if attr_name in hidden:
+                bm.attributes.remove(hidden.pop(attr_name))
+            if not set(inputs).issubset(stored):
+                self._logger.info(f"Materialization of '{attr_name}' removed, its inputs are not all available.")
+                continue
+            # fingerprint the content of the inputs, once
+            for input_name in inputs:
+                if 'fingerprint' not in stored[input_name].metadata:
+                    stored[input_name].metadata['fingerprint'] = array_fingerprint(stored[input_name].array.array)
+
+            series: pd.Series = blockmodel_to_df(bm, variables=[attr_name], index=False)[attr_name]
+            attribute = series_to_attribute(series.rename(f"{MATERIALIZED_PREFIX}{attr_name}"))
+            if isinstance(series.dtype, np.dtype):
+                # the evaluated values have no null sentinel
+                attribute.metadata.pop('null_value', None)
+            attribute.metadata['materialized'] = {'attribute': attr_name,
+                                                  'fingerprint': calculated_fingerprint(bm, attr_name)}
+            bm.attributes.append(attribute)
+
     def write_to_changelog(self, element: str, action: Literal['create', 'update', 'delete'], description: str):
         """Write a change message to the OMF file.
 
@@ -225,10 +391,90 @@ class OMFPandasWriter(OMFPandasReader):
         msg = ChangeMessage(element=element, user=self.user_id, action=action, description=description)
         self.project.metadata['changelog'].append(str(msg))
 
+    @contextmanager
+    def transaction(self) -> Iterator['OMFPandasWriter']:
+        """Batch changes to the OMF file, persisting once on commit.
+
+        Within the transaction, operations that would persist the project (creates, attribute writes, deletes,
+        schema writes and changelog entries) change the project in memory only.  On leaving the block, the project
+        is saved once, without reloading it, unless nothing changed.  If an exception is raised, the changes are
+        discarded by reloading the project from file, and the exception is re-raised.  Transactions may be nested,
+        in which case the outermost transaction commits.
+
+        Example:
+            with writer.transaction():
+                writer.write_blockmodel_attribute('BlockModel1', series_1)
+                writer.write_blockmodel_attribute('BlockModel1', series_2)
+
+        Yields:
+            OMFPandasWriter: The writer.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._rollback()
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0 and (self._persist_pending or self._modified_elements):
+            self._save_project()
+
     def persist_project(self):
-        """Persist the omf project to file and reload the project property"""
-        omf.save(project=self.project, filename=str(self.filepath), mode='w')
+        """Persist the omf project to file and reload the project property.
+
+        Within a transaction, the project is persisted when the transaction commits.  When incremental, the project
+        is not reloaded, and only the changed arrays are serialized from memory.
+        """
+        if self._transaction_depth > 0:
+            self._persist_pending = True
+            return
+        self._save_project()
+        if not self.incremental:
+            self.project = omf.load(str(self.filepath))
+
+    def _save_project(self):
+        """Save the omf project to file, refreshing the materialized calculated attributes of modified BlockModels.
+
+        When incremental, the unchanged arrays are copied from the existing file.
+        """
+        for blockmodel_name in sorted(self._modified_elements):
+            self._refresh_materializations(blockmodel_name)
+        if self.incremental and self.filepath.exists():
+            self._array_references = update_project(self.project, self.filepath, self._array_references,
+                                                    compression=self.compression)
+            self._logger.debug(f"Updated the changes in {self.filepath.name}")
+        else:
+            if self.compression == zipfile.ZIP_DEFLATED:
+                omf.save(project=self.project, filename=str(self.filepath), mode='w')
+            else:
+                save_project(self.project, self.filepath, compression=self.compression)
+            self._track_array_references()
+        # the array references of the previous file are no longer valid
+        self._element_headers = {}
+        if self.attribute_cache is not None:
+            self.attribute_cache.invalidate(self.filepath)
+        self._modified_elements = set()
+        self._persist_pending = False
+
+    def _track_array_references(self):
+        """Record the arrays persisted in the file, so incremental saves can reuse them."""
+        self._array_references = read_array_references(self.project, self.filepath) if self.incremental else {}
+
+    def _rollback(self):
+        """Discard the changes made in memory, reloading the project from file."""
         self.project = omf.load(str(self.filepath))
+        self._track_array_references()
+        self._element_headers = {}
+        self._modified_elements = set()
+        self._persist_pending = False
+
+    def _attribute_cache_view(self, blockmodel_name: str) -> Optional[ElementCacheView]:
+        """The cached attributes of a BlockModel, or None if it has changes that are not persisted."""
+        if blockmodel_name in self._modified_elements:
+            return None
+        return super()._attribute_cache_view(blockmodel_name)
 
     def write_blockmodel_attribute(self, blockmodel_name: str, series: pd.Series,
                                    allow_overwrite: bool = False):
@@ -239,51 +485,143 @@ class OMFPandasWriter(OMFPandasReader):
             series (pd.Series): The data to write to the attribute.
             allow_overwrite (bool): If True, overwrite the existing attribute. Default is False.
         """
-        from omfpandas.blockmodels.attributes import series_to_attribute
+        self.write_blockmodel_attributes(blockmodel_name, series.to_frame(), allow_overwrite=allow_overwrite)
+
+    def write_blockmodel_attributes(self, blockmodel_name: str, df: pd.DataFrame, allow_overwrite: bool = False,
+                                    max_workers: Optional[int] = None):
+        """Write the columns of a DataFrame to attributes of a BlockModel.
+
+        The columns are validated against the schema in one pass, the alignment with the BlockModel geometry is
+        checked once, and a single changelog entry is recorded.
 
+        Args:
+            blockmodel_name (str): The name of the BlockModel.
+            df (pd.DataFrame): The data to write, with a column per attribute.  If indexed by centroid (a
+                MultiIndex with x, y and z levels), the rows are aligned to the BlockModel cells.  If indexed by
+                cell position (named 'position') or a RangeIndex, the rows are positional, in the (C) order of the
+                cells for a RangeIndex.
+            allow_overwrite (bool): If True, overwrite existing attributes. Default is False.
+            max_workers (Optional[int]): The number of threads used to convert the columns concurrently.
+                If None or 1, the columns are converted serially.
+
+        Raises:
+            ValueError: If an attribute exists and allow_overwrite is False, the rows are not aligned with the
+                BlockModel cells, or the index is neither positional nor of centroids.
+        """
         bm = self.get_element_by_name(blockmodel_name)
         if bm.metadata.get('pd_schema'):
             pa = _import_pandera()
             # validate the data
             schema = pa.io.from_json(bm.metadata['pd_schema'])
-            series = schema.validate(series.to_frame())
-            series = series.iloc[:, 0]  # back to series
+            df = schema.validate(df)
+
+        df = self._align_to_blockmodel(blockmodel_name, df)
 
         attrs: list[str] = self.get_element_attribute_names(blockmodel_name)
-        if series.name in attrs:
-            if allow_overwrite:
-                # get the index in the list
-                attr_pos = attrs.index(str(series.name))
-                bm.attributes[attr_pos] = series_to_attribute(series)
-            else:
-                raise ValueError(f"Attribute '{series.name}' already exists in BlockModel '{blockmodel_name}'.  "
-                                 f"If you want to overwrite, set allow_overwrite=True.")
+        existing: list[str] = [str(col) for col in df.columns if col in attrs]
+        if existing and not allow_overwrite:
+            raise ValueError(f"Attributes {existing} already exist in BlockModel '{blockmodel_name}'.  "
+                             f"If you want to overwrite, set allow_overwrite=True.")
+
+        columns: list[pd.Series] = [df[col] for col in df.columns]
+        if max_workers is None or max_workers < 2 or len(columns) < 2:
+            attributes: list = [series_to_attribute(series) for series in columns]
         else:
-            bm.attributes.append(series_to_attribute(series))
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(columns))) as executor:
+                attributes = list(executor.map(series_to_attribute, columns))
+
+        # the positions in the list, which may include hidden materializations
+        positions: dict[str, int] = {a.name: i for i, a in enumerate(bm.attributes)}
+        for attribute in attributes:
+            if attribute.name in existing:
+                bm.attributes[positions[attribute.name]] = attribute
+            else:
+                bm.attributes.append(attribute)
+        self._modified_elements.add(blockmodel_name)
 
         self._delete_profile_report(blockmodel_name)
 
         # todo: re-profile...
 
-        self.write_to_changelog(element=bm.name, action='create', description=f"Attribute [{series.name}] written")
+        names: str = ', '.join(str(col) for col in df.columns)
+        self.write_to_changelog(element=bm.name, action='create',
+                                description=f"Attribute{'s' if len(df.columns) > 1 else ''} [{names}] written")
+
+    def _align_to_blockmodel(self, blockmodel_name: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the rows of the DataFrame in the order of the BlockModel cells.
+
+        Rows indexed by cell position (named 'position'), or with a RangeIndex, are positional.  Rows with a
+        MultiIndex of x, y and z levels (in any order, with or without other levels) are located by centroid.
+
+        Raises:
+            ValueError: If the rows are not aligned with the BlockModel cells, or the index is neither positional
+                nor has x, y and z levels.
+        """
+        geometry = self.get_bm_geometry(blockmodel_name)
+        if len(df) != geometry.num_cells:
+            raise ValueError(f"The data has {len(df)} rows, but BlockModel '{blockmodel_name}' has "
+                             f"{geometry.num_cells} cells.")
+        if df.index.names == [POSITION_INDEX_NAME]:
+            # indexed by cell position, e.g. as read with a positional_index
+            if df.index.equals(pd.RangeIndex(geometry.num_cells)):
+                return df
+            return self._rows_of_cells(blockmodel_name, df, df.index.to_numpy(), geometry.num_cells)
+        if isinstance(df.index, pd.RangeIndex):
+            # positional, in the order of the cells
+            return df
+        if not isinstance(df.index, pd.MultiIndex) or not {'x', 'y', 'z'}.issubset(df.index.names):
+            raise ValueError(f"The data index {list(df.index.names)} is neither positional nor has x, y and z "
+                             f"levels, so it cannot be aligned with the cells of BlockModel '{blockmodel_name}'.")
+        geometry_index: pd.MultiIndex = geometry.to_multi_index()
+        if list(df.index.names) == list(geometry_index.names) and df.index.equals(geometry_index):
+            return df
+        # the cells of the rows are located by integer arithmetic, rather than by looking up float keys
+        try:
+            positions: np.ndarray = geometry.centroid_positions(*(df.index.get_level_values(level).to_numpy()
+                                                                  for level in ['x', 'y', 'z']))
+        except ValueError as e:
+            raise ValueError(f"The data index is not aligned with the cells of BlockModel '{blockmodel_name}'. "
+                             f"{e}") from e
+        return self._rows_of_cells(blockmodel_name, df, positions, geometry.num_cells)
+
+    @staticmethod
+    def _rows_of_cells(blockmodel_name: str, df: pd.DataFrame, positions: np.ndarray, num_cells: int) -> pd.DataFrame:
+        """Return the rows of the DataFrame in the order of the cells, from the cell position of each row.
+
+        Raises:
+            ValueError: If the rows are not one per cell.
+        """
+        rows: np.ndarray = np.full(num_cells, -1, dtype=np.int64)
+        if len(positions) and (positions.min() < 0 or positions.max() >= num_cells):
+            raise ValueError(f"The data index is not aligned with the cells of BlockModel '{blockmodel_name}'.")
+        rows[positions] = np.arange(len(positions))
+        if (rows < 0).any():
+            raise ValueError(f"The data index is not aligned with the cells of BlockModel '{blockmodel_name}'.")
+        return df.iloc[rows]
 
     def delete_blockmodel_attribute(self, blockmodel_name: str, attribute_name: str):
         """Delete an attribute from a BlockModel.
 
+        The hidden materialization of the attribute, if any, is also deleted.  Materializations of calculated
+        attributes that depend on the attribute are removed when the BlockModel is refreshed.
+
         Args:
             blockmodel_name (str): The name of the BlockModel.
             attribute_name (str): The name of the attribute.
+
+        Raises:
+            ValueError: If the attribute is not found in the BlockModel.
         """
         bm = self.get_element_by_name(blockmodel_name)
-        attrs: list[str] = self.get_element_attribute_names(bm)
-        if attribute_name in attrs:
-            del bm.attributes[attribute_name]
-        else:
+        if attribute_name not in self.get_element_attribute_names(blockmodel_name):
             raise ValueError(f"Attribute '{attribute_name}' not found in BlockModel '{blockmodel_name}'.")
+        names: set[str] = {attribute_name, f"{MATERIALIZED_PREFIX}{attribute_name}"}
+        bm.attributes = [a for a in bm.attributes if a.name not in names]
+        self._modified_elements.add(blockmodel_name)
+        self._refresh_materializations(blockmodel_name)
 
         self._delete_profile_report(blockmodel_name)
 
-        # create the audit record, which also saves the file
         self.write_to_changelog(element=bm.name, action='delete', description=f"{attribute_name} deleted")
 
     @log_timer()
@@ -302,7 +640,8 @@ class OMFPandasWriter(OMFPandasReader):
 
         _import_ydata_profiling()
 
-        df: pd.DataFrame = OMFPandasReader(self.filepath).read_blockmodel(blockmodel_name, query=query)
+        # read from the project in memory, which may have changes that are not yet persisted
+        df: pd.DataFrame = self.read_blockmodel(blockmodel_name, query=query)
         el = self.get_element_by_name(blockmodel_name)
         bm_type = str(type(el)).split('.')[-1].rstrip("'>")
         dataset: dict = {"description": f"{el.description} Filter: {query if query else 'no_filter'}",
@@ -0,0 +1,70 @@
+"""
+Benchmark MultiIndex Construction
+=================================
+
+This script compares the construction of the full geometry MultiIndex of a model:
+
+- raveled: MultiIndex.from_arrays on the raveled centroids (and cell sizes) of every cell, which factorizes every
+  level, followed by sortlevel.  This was the construction prior to the codes-based constructor.
+- codes: the codes-based constructor of an axis-aligned geometry, where the levels are the centroids along each axis
+  and the codes follow from the C order, so there is no factorization or sort.
+
+Usage: python benchmark_multi_index.py [cells ...], e.g. python benchmark_multi_index.py 1e6 1e7 5e7
+
+The 50M cell tensor model requires several GB of memory for the raveled construction.
+"""
+
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry, Geometry
+
+
+def create_geometries(num_cells: int) -> dict[str, Geometry]:
+    """Create regular and tensor geometries of approximately num_cells cells, with shape (2n, 2n, n)."""
+    n: int = max(int(round((num_cells / 4) ** (1 / 3))), 1)
+    shape = (2 * n, 2 * n, n)
+    axes = dict(axis_u=(1.0, 0.0, 0.0), axis_v=(0.0, 1.0, 0.0), axis_w=(0.0, 0.0, 1.0))
+    rng = np.random.default_rng(0)
+    return {'regular': RegularGeometry(corner=(0.0, 0.0, 0.0), block_size=(5.0, 5.0, 2.5), shape=shape, **axes),
+            'tensor': TensorGeometry(corner=(0.0, 0.0, 0.0), tensor_u=rng.choice([2.5, 5.0, 10.0], shape[0]),
+                                     tensor_v=rng.choice([2.5, 5.0, 10.0], shape[1]),
+                                     tensor_w=rng.choice([1.25, 2.5], shape[2]), **axes)}
+
+
+def raveled_multi_index(geometry: Geometry) -> pd.MultiIndex:
+    """The MultiIndex from the raveled values of every cell, factorized and sorted."""
+    positions: np.ndarray = np.arange(geometry.num_cells)
+    ijk = geometry.position_to_ijk(positions)
+    arrays: list[np.ndarray] = list(geometry.ijk_to_world(*ijk))
+    arrays += [sizes[cell] for sizes, cell in zip(geometry._axis_cell_sizes().values(), ijk)]
+    names: list[str] = ['x', 'y', 'z', *geometry._axis_cell_sizes()]
+    return pd.MultiIndex.from_arrays(arrays, names=names).sortlevel(level=['x', 'y', 'z'])[0]
+
+
+def codes_multi_index(geometry: Geometry) -> pd.MultiIndex:
+    """The MultiIndex from the axis levels and the codes of the C order."""
+    return geometry.window_multi_index((0, geometry.shape[0]), (0, geometry.shape[1]), (0, geometry.shape[2]))
+
+
+def time_it(func: Callable[[], pd.MultiIndex]) -> tuple[float, pd.MultiIndex]:
+    start: float = time.perf_counter()
+    index: pd.MultiIndex = func()
+    return time.perf_counter() - start, index
+
+
+if __name__ == '__main__':
+    sizes: list[int] = [int(float(arg)) for arg in sys.argv[1:]] or [1_000_000, 10_000_000, 50_000_000]
+    print(f"{'model':>8} {'cells':>12} {'raveled (s)':>12} {'codes (s)':>10} {'speedup':>8} {'memory (MB)':>12}")
+    for num_cells in sizes:
+        for name, geometry in create_geometries(num_cells).items():
+            raveled_seconds, raveled = time_it(lambda: raveled_multi_index(geometry))
+            del raveled
+            codes_seconds, index = time_it(lambda: codes_multi_index(geometry))
+            memory_mb: float = index.memory_usage(deep=True) / 1e6
+            print(f"{name:>8} {geometry.num_cells:>12,} {raveled_seconds:>12.2f} {codes_seconds:>10.3f} "
+                  f"{raveled_seconds / codes_seconds:>8.0f} {memory_mb:>12.1f}")
@@ -1,8 +1,10 @@
 import sys
 import time
 
+import pandas as pd
 import pytest
 
+from omfpandas.blockmodels import multiindex_to_encoded_index
 from omfpandas.reader import OMFPandasReader
 
 
@@ -86,3 +88,26 @@ def test_read_block_models_with_query(temp_congruent_omf_file):
     # assert relative_execution_time < 1.0
 
     temp_omf_path.unlink()
+
+
+def test_read_block_models_matches_single_reads(temp_congruent_omf_file):
+    reader = OMFPandasReader(temp_congruent_omf_file)
+    blockmodel_attributes = {'BlockModel1': ['attr1'], 'BlockModel2': None}
+    expected = pd.concat([reader.read_blockmodel('BlockModel1', attributes=['attr1']),
+                          reader.read_blockmodel('BlockModel2')], axis=1)
+
+    pd.testing.assert_frame_equal(reader.read_block_models(blockmodel_attributes), expected)
+
+    # the query variables may be from any block model, including those not in the result
+    query = 'attr2 > 0.5 and attr4 < 0.5'
+    df = reader.read_block_models(blockmodel_attributes, query=query)
+    attr2 = reader.read_blockmodel('BlockModel1', attributes=['attr2'])['attr2']
+    pd.testing.assert_frame_equal(df, expected[(attr2 > 0.5) & (expected['attr4'] < 0.5)])
+
+    df_encoded = reader.read_block_models(blockmodel_attributes, query=query, encode_index=True)
+    pd.testing.assert_index_equal(df_encoded.index, multiindex_to_encoded_index(df.index))
+
+    with pytest.raises(ValueError, match="Query variable 'attr9'"):
+        reader.read_block_models(blockmodel_attributes, query='attr9 > 0.5')
+
+    temp_congruent_omf_file.unlink()
@@ -4,9 +4,11 @@ from pathlib import Path
 import numpy as np
 import omf
 import pandas as pd
+import pytest
 from omf import Project
 
 from omfpandas import OMFPandasReader
+from omfpandas.blockmodels.calculated import calculation_order, stored_dependencies, valid_materializations
 from omfpandas.writer import OMFPandasWriter
 from conftest import get_test_schema
 
@@ -84,3 +86,88 @@ def test_add_calculated_blockmodel_attributes_from_schema():
     assert np.allclose(df['attr1'], df['calc_attr2'])
 
     temp_omf_path.unlink()
+
+
+def test_calculated_attributes_decode_referenced_only():
+    temp_omf_path = create_test_omf2_file()
+    writer = OMFPandasWriter(temp_omf_path)
+    writer.create_calculated_blockmodel_attributes('TensorModel1', {'calc_attr2': 'attr1 * 2'})
+
+    reader = OMFPandasReader(temp_omf_path, lazy=True)
+    df: pd.DataFrame = reader.read_blockmodel('TensorModel1', attributes=['calc_attr2'], query='calc_attr2 > 1')
+
+    attrs = {a.name: a for a in reader.get_element_by_name('TensorModel1').attributes}
+    assert attrs['attr1'].array.array is not None
+    assert attrs['attr2'].array.array is None
+
+    expected: pd.DataFrame = OMFPandasReader(temp_omf_path).read_blockmodel('TensorModel1')
+    pd.testing.assert_series_equal(df['calc_attr2'], expected.query('calc_attr2 > 1')['calc_attr2'])
+    temp_omf_path.unlink()
+
+
+def test_calculation_order():
+    definitions = {'revenue': 'metal_eq * 10', 'ore': 'metal_eq > 1', 'metal_eq': 'attr1 + attr2 * 0.5'}
+    assert calculation_order(definitions) == ['metal_eq', 'revenue', 'ore']
+    assert calculation_order(definitions, ['ore', 'attr1']) == ['metal_eq', 'ore']
+    assert sorted(stored_dependencies(definitions, ['ore', 'attr3'])) == ['attr1', 'attr2', 'attr3']
+
+    with pytest.raises(ValueError, match='cycle: a -> b -> a'):
+        calculation_order({'a': 'b + 1', 'b': 'a * 2'})
+
+
+def test_calculated_attributes_on_calculated_attributes():
+    temp_omf_path = create_test_omf2_file()
+    writer = OMFPandasWriter(temp_omf_path)
+
+    # defined before the attribute they reference
+    writer.create_calculated_blockmodel_attributes('TensorModel1', {'revenue': 'metal_eq * 10',
+                                                                    'ore': 'metal_eq > 1',
+                                                                    'metal_eq': 'attr1 + attr2 * 0.5'})
+    with pytest.raises(ValueError, match='cycle'):
+        writer.create_calculated_blockmodel_attributes('TensorModel1', {'x1': 'x2 + 1', 'x2': 'x1 * 2'})
+    with pytest.raises(ValueError, match='cycle'):
+        writer.create_calculated_blockmodel_attributes('TensorModel1', {'metal_eq': 'revenue / 10'})
+
+    reader = OMFPandasReader(temp_omf_path, lazy=True)
+    df: pd.DataFrame = reader.read_blockmodel('TensorModel1', attributes=['revenue', 'ore'], query='ore')
+
+    expected: pd.DataFrame = OMFPandasReader(temp_omf_path).read_blockmodel('TensorModel1',
+                                                                            attributes=['attr1', 'attr2'])
+    metal_eq: pd.Series = expected['attr1'] + expected['attr2'] * 0.5
+    pd.testing.assert_series_equal(df['revenue'], (metal_eq * 10).rename('revenue')[metal_eq > 1])
+    assert df['ore'].all()
+    temp_omf_path.unlink()
+
+
+def test_materialized_calculated_attributes():
+    temp_omf_path = create_test_omf2_file()
+    writer = OMFPandasWriter(temp_omf_path)
+    writer.create_calculated_blockmodel_attributes('TensorModel1', {'metal_eq': 'attr1 + attr2 * 0.5',
+                                                                    'revenue': 'metal_eq * 10'},
+                                                   materialize=True)
+    assert writer.blockmodel_attributes == {'TensorModel1': ['attr1', 'attr2']}
+    assert set(valid_materializations(writer.get_element_by_name('TensorModel1'))) == {'metal_eq', 'revenue'}
+
+    # the materialization is read in place of the inputs
+    reader = OMFPandasReader(temp_omf_path, lazy=True)
+    df: pd.DataFrame = reader.read_blockmodel('TensorModel1', attributes=['revenue'], query='metal_eq > 1')
+    attrs = {a.name: a for a in reader.get_element_by_name('TensorModel1').attributes}
+    assert attrs['attr1'].array.array is None and attrs['attr2'].array.array is None
+
+    expected: pd.DataFrame = OMFPandasReader(temp_omf_path).read_blockmodel('TensorModel1',
+                                                                            attributes=['attr1', 'attr2'])
+    metal_eq: pd.Series = expected['attr1'] + expected['attr2'] * 0.5
+    pd.testing.assert_series_equal(df['revenue'], (metal_eq * 10).rename('revenue')[metal_eq > 1])
+
+    # a change to an input invalidates the materializations, which are refreshed when persisted
+    writer.write_blockmodel_attribute('TensorModel1', (expected['attr1'] * 2).rename('attr1'), allow_overwrite=True)
+    assert valid_materializations(writer.get_element_by_name('TensorModel1')) == {}
+    df = writer.read_blockmodel('TensorModel1', attributes=['metal_eq'])
+    pd.testing.assert_series_equal(df['metal_eq'], (expected['attr1'] * 2 + expected['attr2'] * 0.5).rename('metal_eq'))
+
+    writer.persist_project()
+    assert set(valid_materializations(writer.get_element_by_name('TensorModel1'))) == {'metal_eq', 'revenue'}
+    df = OMFPandasReader(temp_omf_path, lazy=True).read_blockmodel('TensorModel1', attributes=['revenue'])
+    pd.testing.assert_series_equal(df['revenue'],
+                                   ((expected['attr1'] * 2 + expected['attr2'] * 0.5) * 10).rename('revenue'))
+    temp_omf_path.unlink()
@@ -5,10 +5,12 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pytest
 
 import yaml
 
 from omfpandas import OMFPandasWriter
+from omfpandas.blockmodels.geometry import RegularGeometry
 from conftest import get_test_schema
 
 
@@ -85,3 +87,100 @@ def test_create_blockmodel_from_df_with_schema_dict():
         assert writer.project.elements[0].attributes[0].name == 'attr1'
         assert writer.project.elements[0].attributes[1].name == 'attr2'
         assert writer.project.elements[0].description == 'A modified test dataset schema.'
+
+
+def test_create_blockmodel_from_chunks(tmp_path):
+    blocks: pd.DataFrame = create_dataframe_blockmodel()
+    blocks['code'] = pd.Categorical(np.where(blocks['attr1'] > 0.5, 'high', 'low'))
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(blocks.index)
+
+    # shuffled slabs, with the categories of each slab differing in order
+    slabs: list[pd.DataFrame] = [slab.sample(frac=1.0, random_state=0) for _, slab in blocks.groupby(level='z')]
+    slabs = [slab.assign(code=slab['code'].cat.reorder_categories(['low', 'high'])) if i % 2 else slab
+             for i, slab in enumerate(slabs)]
+
+    for spill_dir in [None, tmp_path]:
+        writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'chunks.omf')
+        writer.create_blockmodel_from_chunks(blockmodel_name='Block Model', geometry=geometry,
+                                             chunks=iter(slabs[::-1]), spill_dir=spill_dir, allow_overwrite=True)
+        df: pd.DataFrame = writer.read_blockmodel('Block Model')
+        pd.testing.assert_frame_equal(df.reset_index(drop=True), blocks.reset_index(drop=True),
+                                      check_categorical=False)
+        assert df.index.equals(geometry.to_multi_index())
+
+
+def test_create_blockmodel_from_partial_chunks(tmp_path):
+    blocks: pd.DataFrame = create_dataframe_blockmodel()
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(blocks.index)
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'chunks.omf')
+    writer.create_blockmodel_from_chunks(blockmodel_name='Composite.Block Model', geometry=geometry,
+                                         chunks=[blocks.iloc[:100]])
+    df: pd.DataFrame = writer.read_blockmodel('Composite.Block Model')
+    assert df['attr1'].iloc[:100].tolist() == blocks['attr1'].iloc[:100].tolist()
+    assert df['attr1'].iloc[100:].isna().all()
+
+    with pytest.raises(ValueError, match='already exists'):
+        writer.create_blockmodel_from_chunks(blockmodel_name='Composite.Block Model', geometry=geometry, chunks=[])
+
+
+def test_create_blockmodel_from_chunks_outside_geometry(tmp_path):
+    blocks: pd.DataFrame = create_dataframe_blockmodel()
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(blocks.index)
+    shifted: pd.DataFrame = blocks.rename(index=lambda x: x + 0.25, level='x')
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'chunks.omf')
+    with pytest.raises(ValueError, match='not centroids of the geometry'):
+        writer.create_blockmodel_from_chunks(blockmodel_name='Block Model', geometry=geometry, chunks=[shifted])
+    assert 'Block Model' not in [element.name for element in writer.project.elements]
+
+
+def test_create_blockmodel_with_geometry(tmp_path):
+    blocks: pd.DataFrame = create_dataframe_blockmodel()
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(blocks.index)
+    shuffled: pd.DataFrame = blocks.sample(frac=1.0, random_state=0)
+    shuffled_copy: pd.DataFrame = shuffled.copy()
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'geometry.omf')
+    writer.create_blockmodel(blocks=blocks, blockmodel_name='ordered', geometry=geometry)
+    writer.create_blockmodel(blocks=shuffled, blockmodel_name='shuffled', geometry=geometry)
+    # the geometry is inferred, and the (regular) blocks sorted
+    writer.create_blockmodel(blocks=shuffled.droplevel(['dx', 'dy', 'dz']), blockmodel_name='inferred')
+
+    # the caller's frame is not modified
+    pd.testing.assert_frame_equal(shuffled, shuffled_copy)
+    expected: pd.DataFrame = writer.read_blockmodel('ordered')
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), blocks.reset_index(drop=True))
+    for name in ['shuffled', 'inferred']:
+        pd.testing.assert_frame_equal(writer.read_blockmodel(name), expected)
+
+    with pytest.raises(ValueError, match='not centroids of the geometry'):
+        writer.create_blockmodel(blocks=blocks.rename(index=lambda z: z + 0.5, level='z'),
+                                 blockmodel_name='shifted', geometry=geometry)
+    duplicated: pd.DataFrame = pd.concat([blocks.iloc[:1], blocks.iloc[:-1]])
+    with pytest.raises(ValueError, match='more than one row'):
+        writer.create_blockmodel(blocks=duplicated, blockmodel_name='duplicated', geometry=geometry)
+
+
+def test_create_blockmodel_from_sparse_df(tmp_path):
+    blocks: pd.DataFrame = create_dataframe_blockmodel()
+    blocks['count'] = pd.Series(np.arange(len(blocks)), index=blocks.index, dtype='Int64')
+    geometry: RegularGeometry = RegularGeometry.from_multi_index(blocks.index)
+    # e.g. air blocks omitted from the export
+    is_exported: np.ndarray = np.random.default_rng(0).random(len(blocks)) < 0.4
+    sparse: pd.DataFrame = blocks.loc[is_exported].sample(frac=1.0, random_state=0)
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'sparse.omf')
+    writer.create_blockmodel(blocks=sparse, blockmodel_name='explicit', geometry=geometry)
+    writer.create_blockmodel(blocks=sparse.droplevel(['dx', 'dy', 'dz']), blockmodel_name='inferred')
+
+    for name in ['explicit', 'inferred']:
+        df: pd.DataFrame = writer.read_blockmodel(name)
+        assert len(df) == geometry.num_cells
+        assert df['attr1'].isna().to_numpy().tolist() == (~is_exported).tolist()
+        assert df['attr1'].to_numpy()[is_exported].tolist() == blocks['attr1'].to_numpy()[is_exported].tolist()
+        assert df['count'].isna().to_numpy().tolist() == (~is_exported).tolist()
+
+    with pytest.raises(ValueError, match='more than one row'):
+        writer.create_blockmodel(blocks=pd.concat([sparse, sparse.iloc[:1]]), blockmodel_name='duplicated',
+                                 geometry=geometry)
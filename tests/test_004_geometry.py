@@ -8,7 +8,7 @@ import numpy as np
 import pandas as pd
 from omf import Project
 
-from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry
+from omfpandas.blockmodels.geometry import RegularGeometry, TensorGeometry, MultiIndexCache, multi_index_cache
 
 from omfpandas import OMFPandasReader
 from conftest import get_omf_file
@@ -309,3 +309,201 @@ def test_centroid_lookup():
     # Test the lookup
     centroid = geom.nearest_centroid_lookup(0.3, 0.4, 0.6)
     assert centroid == (0.5, 0.5, 0.5)
+
+
+def test_nearest_centroids_regular():
+    angle = np.deg2rad(30)
+    geometry = RegularGeometry(corner=(0.0, 0.0, 0.0), axis_u=(np.cos(angle), np.sin(angle), 0.0),
+                               axis_v=(-np.sin(angle), np.cos(angle), 0.0), axis_w=(0.0, 0.0, 1.0),
+                               block_size=(1.0, 2.0, 1.0), shape=(20, 10, 5))
+    index: pd.MultiIndex = geometry.to_multi_index()
+    # offset the centroids within their blocks, in the grid frame
+    rng = np.random.default_rng(0)
+    offsets = geometry._from_grid_frame((rng.random((3, len(index))) - 0.5) * 0.98 *
+                                        np.array(geometry.block_size)[:, None])
+    x, y, z = (index.get_level_values(level).to_numpy() + offset for level, offset in zip('xyz', offsets))
+
+    centroids, positions, in_grid = geometry.nearest_centroids(x, y, z)
+    expected = geometry.centroid_positions(*(index.get_level_values(level).to_numpy() for level in 'xyz'))
+    assert np.array_equal(positions, expected)
+    assert in_grid.all()
+    assert np.allclose(centroids, index.to_frame().to_numpy())
+
+    # points outside the grid are flagged, and assigned a block on the boundary
+    _, positions, in_grid = geometry.nearest_centroids([-0.5, 0.5], [0.5, 0.5], [0.5, 6.0])
+    assert in_grid.tolist() == [False, False]
+    assert positions.tolist() == [0, 4]
+
+
+def test_nearest_centroids_irregular_tensor():
+    geometry = TensorGeometry(corner=(10.0, 0.0, 0.0), axis_u=(1.0, 0.0, 0.0), axis_v=(0.0, 1.0, 0.0),
+                              axis_w=(0.0, 0.0, 1.0), tensor_u=np.array([1.0, 2.0, 4.0]),
+                              tensor_v=np.array([5.0, 1.0]), tensor_w=np.array([1.0, 1.0, 3.0]))
+    centroids, positions, in_grid = geometry.nearest_centroids([10.2, 14.5, 16.9], [4.9, 5.5, 5.1],
+                                                               [0.1, 4.0, 2.0])
+    assert positions.tolist() == [0, 2 * 6 + 1 * 3 + 2, 2 * 6 + 1 * 3 + 2]
+    assert in_grid.all()
+    assert np.allclose(centroids, [[10.5, 2.5, 0.5], [15.0, 5.5, 3.5], [15.0, 5.5, 3.5]])
+    assert geometry.nearest_centroid_lookup(14.5, 5.5, 4.0) == (15.0, 5.5, 3.5)
+
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    df: pd.DataFrame = omfp.find_nearest_centroids(np.array([10.3, 0.8]), np.array([10.4, 11.2]),
+                                                   np.array([-9.4, 10.1]), blockmodel_name='tensor')
+    assert list(df.columns) == ['x', 'y', 'z', 'position', 'in_grid']
+    assert df['in_grid'].tolist() == [True, False]
+    assert tuple(df.iloc[0][['x', 'y', 'z']]) == omfp.find_nearest_centroid(10.3, 10.4, -9.4, 'tensor')
+
+
+def test_nearest_centroid_lookup_regular_tensor():
+    # the corner components differ, so each axis is offset from its own corner component
+    geometry = TensorGeometry(corner=(1.0, 20.0, -300.0), axis_u=(1.0, 0.0, 0.0), axis_v=(0.0, 1.0, 0.0),
+                              axis_w=(0.0, 0.0, 1.0), tensor_u=np.full(4, 2.0), tensor_v=np.full(3, 4.0),
+                              tensor_w=np.full(2, 5.0))
+    assert geometry.is_regular
+    assert geometry.extents == ((1.0, 9.0), (20.0, 32.0), (-300.0, -290.0))
+    assert geometry.nearest_centroid_lookup(4.9, 29.0, -291.0) == (4.0, 30.0, -292.5)
+    centroids, _, _ = geometry.nearest_centroids([4.9], [29.0], [-291.0])
+    assert tuple(centroids[0]) == geometry.nearest_centroid_lookup(4.9, 29.0, -291.0)
+
+
+@pytest.mark.parametrize('geometry_type', ['regular', 'tensor'])
+def test_ijk_position_world_conversions(geometry_type):
+    angle = np.deg2rad(30)
+    axes = dict(axis_u=(np.cos(angle), np.sin(angle), 0.0), axis_v=(-np.sin(angle), np.cos(angle), 0.0),
+                axis_w=(0.0, 0.0, 1.0))
+    if geometry_type == 'regular':
+        geometry = RegularGeometry(corner=(10.0, 20.0, 0.0), block_size=(1.0, 2.0, 0.5), shape=(6, 5, 4), **axes)
+    else:
+        geometry = TensorGeometry(corner=(10.0, 20.0, 0.0), tensor_u=np.array([1.0, 2.0, 1.0, 3.0, 1.0, 1.0]),
+                                  tensor_v=np.array([2.0, 1.0, 1.0, 4.0, 2.0]),
+                                  tensor_w=np.array([0.5, 0.5, 1.0, 2.0]), **axes)
+
+    positions = np.arange(geometry.num_cells)
+    i, j, k = geometry.position_to_ijk(positions)
+    assert np.array_equal(geometry.ijk_to_position(i, j, k), positions)
+
+    # the centroids match the (rotated) index, in C order
+    x, y, z = geometry.position_to_world(positions)
+    index: pd.MultiIndex = geometry.slab_multi_index(0, geometry.shape[0])
+    assert np.allclose(np.column_stack([x, y, z]), index.to_frame()[['x', 'y', 'z']].to_numpy())
+    assert np.array_equal(geometry.world_to_position(x, y, z), positions)
+    assert all(np.array_equal(a, b) for a, b in zip(geometry.world_to_ijk(x, y, z), (i, j, k)))
+
+    with pytest.raises(ValueError, match='outside the grid'):
+        geometry.world_to_ijk(np.array([0.0]), np.array([0.0]), np.array([0.0]))
+
+
+@pytest.mark.parametrize('bm_name', ['tensor', 'regular'])
+def test_filtered_index_from_positions(bm_name):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    geometry = omfp.get_bm_geometry(bm_name)
+    positions = np.array([geometry.num_cells - 1, 0, 17, 5])
+    assert geometry.positions_multi_index(positions).equals(geometry.to_multi_index().take(positions))
+
+    full: pd.DataFrame = omfp.read_blockmodel(bm_name)
+    df: pd.DataFrame = omfp.read_blockmodel(bm_name, query='`random attr` > 0.9')
+    pd.testing.assert_frame_equal(df, full.query('`random attr` > 0.9'))
+    df = omfp.read_blockmodel(bm_name, index_filter=list(positions))
+    pd.testing.assert_frame_equal(df, full.iloc[positions])
+
+
+@pytest.mark.parametrize('geometry_type', ['regular', 'tensor'])
+def test_product_multi_index(geometry_type):
+    axes = dict(axis_u=(1.0, 0.0, 0.0), axis_v=(0.0, 1.0, 0.0), axis_w=(0.0, 0.0, 1.0))
+    if geometry_type == 'regular':
+        geometry = RegularGeometry(corner=(10.0, 20.0, 0.0), block_size=(1.0, 2.0, 0.5), shape=(6, 5, 4), **axes)
+    else:
+        geometry = TensorGeometry(corner=(10.0, 20.0, 0.0), tensor_u=np.array([1.0, 2.0, 1.0, 3.0, 1.0, 1.0]),
+                                  tensor_v=np.array([2.0, 1.0, 1.0, 4.0, 2.0]),
+                                  tensor_w=np.array([0.5, 0.5, 1.0, 2.0]), **axes)
+
+    for ranges in [((0, 6), (0, 5), (0, 4)), ((1, 4), (2, 5), (1, 2)), ((2, 2), (0, 5), (0, 4))]:
+        index: pd.MultiIndex = geometry.window_multi_index(*ranges)
+        positions = geometry.window_positions(*ranges)
+        # equivalent to factorizing the raveled centroids (and cell sizes)
+        expected: pd.MultiIndex = pd.MultiIndex.from_frame(geometry.positions_multi_index(positions).to_frame())
+        assert index.equals(expected)
+        assert list(index.names) == list(expected.names)
+        assert index.is_monotonic_increasing
+    index = geometry.to_multi_index()
+    assert index.get_loc(index[7]) == 7
+
+
+@pytest.mark.parametrize('bm_name', ['tensor', 'regular'])
+def test_read_blockmodel_extent(bm_name):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    extent = ((12.0, 15.5), (11.2, 20.0), (-8.5, 0.0))
+
+    df: pd.DataFrame = omfp.read_blockmodel(bm_name, extent=extent)
+    expected: pd.DataFrame = omfp.read_blockmodel(bm_name).query(
+        'x >= 12.0 and x <= 15.5 and y >= 11.2 and y <= 20.0 and z >= -8.5 and z <= 0.0')
+    assert len(df) == 4 * 9 * 9
+    pd.testing.assert_frame_equal(df, expected)
+
+    # an extent outside the model returns no blocks
+    assert omfp.read_blockmodel(bm_name, extent=((0.0, 5.0), (0.0, 5.0), (0.0, 5.0))).empty
+
+
+def test_rotated_extent_window():
+    angle = np.deg2rad(30)
+    geometry = RegularGeometry(corner=(0.0, 0.0, 0.0), axis_u=(np.cos(angle), np.sin(angle), 0.0),
+                               axis_v=(-np.sin(angle), np.cos(angle), 0.0), axis_w=(0.0, 0.0, 1.0),
+                               block_size=(1.0, 1.0, 1.0), shape=(20, 20, 5))
+    extent = ((2.0, 8.0), (3.0, 9.0), (0.0, 2.0))
+    positions, index = geometry.extent_window(extent)
+
+    full_index: pd.MultiIndex = geometry.slab_multi_index(0, 20)
+    x, y, z = (full_index.get_level_values(level) for level in ['x', 'y', 'z'])
+    mask = (x >= 2.0) & (x <= 8.0) & (y >= 3.0) & (y <= 9.0) & (z >= 0.0) & (z <= 2.0)
+    assert np.array_equal(positions, np.flatnonzero(mask))
+    assert index.equals(full_index[mask])
+
+
+def test_multi_index_cache():
+    multi_index_cache.clear()
+    geometry = TensorGeometry((0.0, 0.0, 0.0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
+                              np.full(4, 10.0), np.full(3, 10.0), np.full(2, 10.0))
+    sibling = TensorGeometry((0.0, 0.0, 0.0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
+                             np.full(4, 10, dtype='float32'), np.full(3, 10.0), np.full(2, 10.0))
+    assert geometry.fingerprint == sibling.fingerprint
+
+    index: pd.MultiIndex = geometry.to_multi_index()
+    assert multi_index_cache.stats == {'hits': 0, 'misses': 1, 'evictions': 0, 'entries': 1,
+                                       'size_bytes': index.memory_usage(), 'max_bytes': 256 * 1024 ** 2}
+    assert sibling.to_multi_index().equals(index)
+    assert multi_index_cache.hits == 1
+
+    # renaming a returned index does not modify the cached index
+    index.names = ['a', 'b', 'c', 'd', 'e', 'f']
+    assert list(sibling.to_multi_index().names) == ['x', 'y', 'z', 'dx', 'dy', 'dz']
+
+    regular = RegularGeometry((0.0, 0.0, 0.0), (1, 0, 0), (0, 1, 0), (0, 0, 1), (10.0, 10.0, 10.0), (4, 3, 2))
+    assert regular.fingerprint != geometry.fingerprint
+    assert regular.to_multi_index().equals(index.droplevel(['d', 'e', 'f']).set_names(['x', 'y', 'z']))
+    assert multi_index_cache.misses == 2
+
+
+def test_multi_index_cache_eviction():
+    geometries = [RegularGeometry((float(i), 0.0, 0.0), (1, 0, 0), (0, 1, 0), (0, 0, 1), (1.0, 1.0, 1.0), (2, 2, 2))
+                  for i in range(3)]
+    index_bytes: int = geometries[0].to_multi_index().memory_usage()
+    cache = MultiIndexCache(max_bytes=2 * index_bytes)
+    for geometry in geometries:
+        cache.get(geometry, geometry.to_multi_index)
+    assert (cache.stats['entries'], cache.stats['size_bytes'], cache.evictions) == (2, 2 * index_bytes, 1)
+    # the least recently used geometry was evicted
+    cache.get(geometries[0], geometries[0].to_multi_index)
+    assert (cache.hits, cache.misses) == (0, 4)
+    cache.get(geometries[2], geometries[2].to_multi_index)
+    assert cache.hits == 1
+
+    # indexes larger than the budget are not cached, and a zero budget disables the cache
+    cache.resize(index_bytes - 1)
+    assert cache.stats['entries'] == 0
+    cache.get(geometries[0], geometries[0].to_multi_index)
+    assert cache.stats['size_bytes'] == 0
+    with pytest.raises(ValueError):
+        cache.resize(-1)
+    cache.resize(0)
+    cache.get(geometries[0], geometries[0].to_multi_index)
+    assert cache.stats['entries'] == 0
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+import pytest
 from pathlib import Path
 from omfpandas.writer import OMFPandasWriter
 from omfpandas.utils import create_test_blockmodel
@@ -31,3 +33,247 @@ def test_write_regular_blockmodel(tmp_path):
     ), "BlockModel type is not RegularBlockModel."
 
 
+
+
+def test_transaction_persists_once(tmp_path, monkeypatch):
+    import omf
+
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    writer = OMFPandasWriter(filepath=omf_file_path)
+
+    saves: list[str] = []
+    save = omf.save
+    monkeypatch.setattr(omf, 'save', lambda *args, **kwargs: saves.append(kwargs['filename']) or save(*args, **kwargs))
+
+    with writer.transaction():
+        writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+        with writer.transaction():
+            for i in range(3):
+                writer.write_blockmodel_attribute("TestBlockModel", blocks['depth'].rename(f"attr{i}") * i)
+        writer.create_calculated_blockmodel_attributes("TestBlockModel", {'calc': 'attr1 + attr2'})
+        # nothing is persisted until the transaction commits
+        assert saves == []
+    assert len(saves) == 1
+
+    from omfpandas import OMFPandasReader
+    df: pd.DataFrame = OMFPandasReader(omf_file_path).read_blockmodel("TestBlockModel")
+    assert {'attr0', 'attr1', 'attr2', 'calc'}.issubset(df.columns)
+    pd.testing.assert_series_equal(df['calc'], (df['attr1'] + df['attr2']).rename('calc'))
+
+
+def test_transaction_rollback(tmp_path):
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    writer = OMFPandasWriter(filepath=omf_file_path)
+    writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+
+    try:
+        with writer.transaction():
+            writer.write_blockmodel_attribute("TestBlockModel", blocks['depth'].rename('new_attr'))
+            raise RuntimeError("failed mid-transaction")
+    except RuntimeError:
+        pass
+    assert 'new_attr' not in writer.get_element_attribute_names("TestBlockModel")
+    assert 'new_attr' not in OMFPandasWriter(filepath=omf_file_path).get_element_attribute_names("TestBlockModel")
+
+
+def test_incremental_write(tmp_path):
+    import zipfile
+    from omfpandas import OMFPandasReader
+
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(20, 20, 20), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    OMFPandasWriter(filepath=omf_file_path).create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+    with zipfile.ZipFile(omf_file_path) as zf:
+        entries: set[str] = set(zf.namelist()) - {'project.json'}
+
+    writer = OMFPandasWriter(filepath=omf_file_path, incremental=True)
+    writer.write_blockmodel_attribute("TestBlockModel", (blocks['depth'] * 2).rename('depth2'))
+    writer.persist_project()
+
+    # the existing entries are kept, and only the new array is added
+    with zipfile.ZipFile(omf_file_path) as zf:
+        names: set[str] = set(zf.namelist())
+    assert entries < names
+    assert len(names) == len(entries) + 2
+
+    df: pd.DataFrame = OMFPandasReader(omf_file_path).read_blockmodel("TestBlockModel")
+    pd.testing.assert_series_equal(df['depth2'], (df['depth'] * 2).rename('depth2'))
+
+    # replaced arrays are dropped from the file
+    for i in range(4):
+        random_values: pd.Series = pd.Series(np.random.rand(len(blocks)), index=blocks.index, name='depth2')
+        writer.write_blockmodel_attribute("TestBlockModel", random_values, allow_overwrite=True)
+        writer.persist_project()
+        df = OMFPandasReader(omf_file_path).read_blockmodel("TestBlockModel")
+        np.testing.assert_array_equal(df['depth2'].values, random_values.values)
+    with zipfile.ZipFile(omf_file_path) as zf:
+        assert len(zf.namelist()) == len(entries) + 2
+    assert list(tmp_path.iterdir()) == [omf_file_path]
+    assert_valid_archive(omf_file_path)
+
+
+def assert_valid_archive(omf_file_path: Path):
+    """Assert the archive directory is consistent, reading every entry with its CRC and local header checked."""
+    import zipfile
+    import omf
+
+    with zipfile.ZipFile(omf_file_path, mode='r') as zf:
+        names: list[str] = zf.namelist()
+        assert len(names) == len(set(names))
+        assert zf.testzip() is None
+        for name in names:
+            with zf.open(name) as entry:
+                entry.read()
+    assert omf.load(str(omf_file_path)).validate()
+
+
+def test_incremental_save_reuses_unchanged(tmp_path):
+    import zipfile
+
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(10, 10, 10), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    OMFPandasWriter(filepath=omf_file_path).create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+    writer = OMFPandasWriter(filepath=omf_file_path, incremental=True)
+    writer.write_blockmodel_attribute("TestBlockModel", (blocks['depth'] * 2).rename('depth2'))
+    writer.persist_project()
+
+    def array_entries() -> dict[str, str]:
+        """The archive entry of each attribute array of the block model."""
+        element = writer.get_element_by_name("TestBlockModel")
+        return {attr.name: writer._array_references[id(attr.array)][1] for attr in element.attributes}
+
+    with zipfile.ZipFile(omf_file_path) as zf:
+        entries: set[str] = set(zf.namelist())
+
+    # values replaced on the same Array are detected by their CRC, and written to a new entry
+    previous: dict[str, str] = array_entries()
+    attribute = next(attr for attr in writer.get_element_by_name("TestBlockModel").attributes
+                     if attr.name == 'depth2')
+    attribute.array.array = blocks['depth'].values * 3
+    writer.persist_project()
+    current: dict[str, str] = array_entries()
+    assert current['depth2'] != previous['depth2']
+    assert {k: v for k, v in current.items() if k != 'depth2'} == {k: v for k, v in previous.items() if k != 'depth2'}
+
+    # a deleted attribute is dropped from the file
+    writer.delete_blockmodel_attribute("TestBlockModel", 'depth')
+    writer.persist_project()
+    with zipfile.ZipFile(omf_file_path) as zf:
+        assert previous['depth'] not in zf.namelist()
+        assert previous['depth2'] not in zf.namelist()
+        assert len(zf.namelist()) == len(entries) - 1
+    assert_valid_archive(omf_file_path)
+    df: pd.DataFrame = OMFPandasWriter(filepath=omf_file_path).read_blockmodel("TestBlockModel")
+    assert 'depth' not in df.columns
+    np.testing.assert_array_equal(df['depth2'].values, blocks['depth'].values * 3)
+
+
+def test_write_blockmodel_attributes(tmp_path):
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    writer = OMFPandasWriter(filepath=omf_file_path)
+    writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+    num_changes: int = len(writer.changelog)
+
+    estimates: pd.DataFrame = pd.DataFrame({f"grade{i}": blocks['depth'] * i for i in range(4)}, index=blocks.index)
+    # rows indexed by the geometry are aligned to the cells
+    writer.write_blockmodel_attributes("TestBlockModel", estimates.sample(frac=1.0, random_state=0), max_workers=2)
+    assert len(writer.changelog) == num_changes + 1
+
+    df: pd.DataFrame = writer.read_blockmodel("TestBlockModel", attributes=list(estimates.columns))
+    pd.testing.assert_frame_equal(df, estimates, check_names=False)
+
+    with pytest.raises(ValueError, match='already exist'):
+        writer.write_blockmodel_attributes("TestBlockModel", estimates)
+    with pytest.raises(ValueError, match='rows'):
+        writer.write_blockmodel_attributes("TestBlockModel", estimates.iloc[1:], allow_overwrite=True)
+
+    # positional rows are in the order of the cells
+    writer.write_blockmodel_attributes("TestBlockModel", (estimates * 2).reset_index(drop=True), allow_overwrite=True)
+    df = writer.read_blockmodel("TestBlockModel", attributes=list(estimates.columns))
+    np.testing.assert_array_equal(df.values, (estimates * 2).values)
+
+
+def test_write_blockmodel_attributes_alignment(tmp_path):
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 2.0, 0.5), corner=(100.0, 200.0, 300.0),
+                                    is_tensor=True)
+    writer = OMFPandasWriter(filepath=omf_file_path)
+    writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+    expected: pd.Series = blocks['depth'].rename('grade') * 2
+
+    # an index of the centroids only, or with the levels in another order, is located by centroid
+    shuffled: pd.DataFrame = expected.to_frame().sample(frac=1.0, random_state=0)
+    writer.write_blockmodel_attributes("TestBlockModel", shuffled.droplevel(['dx', 'dy', 'dz']))
+    writer.write_blockmodel_attributes("TestBlockModel", shuffled.reorder_levels(['z', 'dz', 'y', 'x', 'dy', 'dx']),
+                                       allow_overwrite=True)
+    df: pd.DataFrame = writer.read_blockmodel("TestBlockModel", attributes=['grade'])
+    np.testing.assert_array_equal(df['grade'].values, expected.values)
+
+    # an index that is neither positional nor of centroids cannot be aligned
+    with pytest.raises(ValueError, match='x, y and z'):
+        writer.write_blockmodel_attributes("TestBlockModel", shuffled.reset_index(drop=True).set_axis(
+            np.arange(len(shuffled))[::-1]), allow_overwrite=True)
+    with pytest.raises(ValueError, match='x, y and z'):
+        writer.write_blockmodel_attributes("TestBlockModel", shuffled.droplevel(['x']), allow_overwrite=True)
+
+
+def test_delete_blockmodel_attribute(tmp_path):
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    writer = OMFPandasWriter(filepath=omf_file_path)
+    writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+    inputs: pd.DataFrame = pd.DataFrame({'a1': blocks['depth'], 'a2': blocks['depth'] * 2}, index=blocks.index)
+    writer.write_blockmodel_attributes("TestBlockModel", inputs)
+    writer.create_calculated_blockmodel_attributes("TestBlockModel", {'calc': 'a1 + a2'}, materialize=True)
+    assert '__materialized__.calc' in [a.name for a in writer.get_element_by_name("TestBlockModel").attributes]
+
+    with pytest.raises(ValueError, match='not found'):
+        writer.delete_blockmodel_attribute("TestBlockModel", 'missing')
+
+    # deleting an input removes the materialization, which is no longer valid
+    writer.delete_blockmodel_attribute("TestBlockModel", 'a1')
+    writer.persist_project()
+    for omf_writer in [writer, OMFPandasWriter(filepath=omf_file_path)]:
+        bm = omf_writer.get_element_by_name("TestBlockModel")
+        assert [a.name for a in bm.attributes] == ['c_style_xyz', 'f_style_zyx', 'depth', 'a2']
+        df: pd.DataFrame = omf_writer.read_blockmodel("TestBlockModel", attributes=['depth', 'a2'])
+        pd.testing.assert_series_equal(df['a2'], (df['depth'] * 2).rename('a2'))
+        with pytest.raises(ValueError, match="variable 'a1' is not available"):
+            omf_writer.read_blockmodel("TestBlockModel", attributes=['calc'])
+
+
+def test_transaction_delete(tmp_path, monkeypatch):
+    import omf
+
+    omf_file_path = tmp_path / "test.omf"
+    blocks = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5), corner=(100.0, 200.0, 300.0))
+    writer = OMFPandasWriter(filepath=omf_file_path)
+    writer.create_blockmodel(blocks, blockmodel_name="TestBlockModel")
+
+    saves: list[str] = []
+    save = omf.save
+    monkeypatch.setattr(omf, 'save', lambda *args, **kwargs: saves.append(kwargs['filename']) or save(*args, **kwargs))
+
+    # a transaction without changes is not saved
+    with writer.transaction():
+        writer.read_blockmodel("TestBlockModel")
+    assert saves == []
+
+    # a rolled back delete is restored
+    try:
+        with writer.transaction():
+            writer.delete_blockmodel_attribute("TestBlockModel", 'depth')
+            assert 'depth' not in writer.get_element_attribute_names("TestBlockModel")
+            raise RuntimeError("failed mid-transaction")
+    except RuntimeError:
+        pass
+    assert saves == []
+    assert 'depth' in writer.get_element_attribute_names("TestBlockModel")
+
+    with writer.transaction():
+        writer.delete_blockmodel_attribute("TestBlockModel", 'depth')
+    assert len(saves) == 1
+    assert 'depth' not in OMFPandasWriter(filepath=omf_file_path).get_element_attribute_names("TestBlockModel")
@@ -0,0 +1,113 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from omfpandas import OMFPandasReader
+from conftest import get_omf_file
+
+
+def test_lazy_open_headers():
+    test_omf_path: Path = get_omf_file()
+    omfp: OMFPandasReader = OMFPandasReader(filepath=test_omf_path, lazy=True)
+
+    assert omfp.element_types == OMFPandasReader(filepath=test_omf_path).element_types
+    assert omfp.blockmodel_attributes == {'tensor': ['random attr'], 'regular': ['random attr']}
+
+    # no arrays are loaded on open
+    for el in omfp.project.elements:
+        assert all(attr.array.array is None for attr in el.attributes)
+
+
+def test_lazy_read_blockmodel():
+    test_omf_path: Path = get_omf_file()
+    omfp_lazy: OMFPandasReader = OMFPandasReader(filepath=test_omf_path, lazy=True)
+    omfp: OMFPandasReader = OMFPandasReader(filepath=test_omf_path)
+
+    for bm_name in ['tensor', 'regular']:
+        df_lazy: pd.DataFrame = omfp_lazy.read_blockmodel(bm_name, query='`random attr` > 0.5')
+        df: pd.DataFrame = omfp.read_blockmodel(bm_name, query='`random attr` > 0.5')
+        pd.testing.assert_frame_equal(df_lazy, df)
+
+    # only the elements read have their arrays loaded
+    assert omfp_lazy.get_element_by_name('regular').attributes[0].array.array is not None
+
+
+def test_lazy_read_only_requested_attributes(temp_congruent_omf_file):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=temp_congruent_omf_file, lazy=True)
+    df: pd.DataFrame = omfp.read_blockmodel('BlockModel1', attributes=['attr2'])
+    assert list(df.columns) == ['attr2']
+
+    attrs = {a.name: a for a in omfp.get_element_by_name('BlockModel1').attributes}
+    assert attrs['attr1'].array.array is None
+    assert attrs['attr2'].array.array is not None
+
+    temp_congruent_omf_file.unlink()
+
+
+def _store_uncompressed(omf_path: Path) -> Path:
+    """Rewrite the OMF archive with the arrays stored uncompressed."""
+    import zipfile
+    stored_path: Path = omf_path.with_name(f"{omf_path.stem}.stored.omf")
+    with zipfile.ZipFile(omf_path, 'r') as zin, zipfile.ZipFile(stored_path, 'w') as zout:
+        for info in zin.infolist():
+            compress_type = zipfile.ZIP_DEFLATED if info.filename == 'project.json' else zipfile.ZIP_STORED
+            zout.writestr(info.filename, zin.read(info.filename), compress_type=compress_type)
+    return stored_path
+
+
+def test_mmap_read_blockmodel(temp_congruent_omf_file):
+    stored_path: Path = _store_uncompressed(temp_congruent_omf_file)
+    try:
+        for lazy in [False, True]:
+            omfp: OMFPandasReader = OMFPandasReader(filepath=stored_path, lazy=lazy)
+            df: pd.DataFrame = omfp.read_blockmodel('BlockModel1', mmap=True)
+            expected: pd.DataFrame = OMFPandasReader(filepath=temp_congruent_omf_file).read_blockmodel('BlockModel1')
+            pd.testing.assert_frame_equal(df, expected)
+            # the mapped columns are read-only views of the file
+            assert not df['attr1'].values.flags.writeable
+
+            df_filtered: pd.DataFrame = omfp.read_blockmodel('BlockModel1', query='attr1 > 0.5', mmap=True)
+            pd.testing.assert_frame_equal(df_filtered, expected.query('attr1 > 0.5'))
+    finally:
+        stored_path.unlink()
+        temp_congruent_omf_file.unlink()
+
+
+def test_mmap_written_uncompressed(tmp_path):
+    from omfpandas.writer import OMFPandasWriter
+    from omfpandas.utils import create_test_blockmodel
+
+    blocks: pd.DataFrame = create_test_blockmodel(shape=(5, 4, 3), block_size=(1.0, 1.0, 0.5),
+                                                  corner=(100.0, 200.0, 300.0))
+    for incremental in [False, True]:
+        omf_file_path: Path = tmp_path / f"stored_{incremental}.omf"
+        writer = OMFPandasWriter(filepath=omf_file_path, incremental=incremental, compress_arrays=False)
+        writer.create_blockmodel(blocks, blockmodel_name='BlockModel1')
+        writer.write_blockmodel_attribute('BlockModel1', (blocks['depth'] * 2).rename('depth2'))
+        writer.persist_project()
+
+        df: pd.DataFrame = OMFPandasReader(filepath=omf_file_path, lazy=True).read_blockmodel('BlockModel1',
+                                                                                             mmap=True)
+        assert not df['depth2'].values.flags.writeable
+        np.testing.assert_array_equal(df['depth2'].values, blocks['depth'].values * 2)
+
+
+def test_mmap_compressed_is_reported(temp_congruent_omf_file, caplog):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=temp_congruent_omf_file, lazy=True)
+    df: pd.DataFrame = omfp.read_blockmodel('BlockModel1', attributes=['attr1'], mmap=True)
+    assert 'cannot be memory-mapped' in caplog.text
+    assert df['attr1'].values.flags.writeable
+    temp_congruent_omf_file.unlink()
+
+
+def test_parallel_read_blockmodel(temp_congruent_omf_file):
+    expected: pd.DataFrame = OMFPandasReader(filepath=temp_congruent_omf_file).read_blockmodel('BlockModel1')
+    for lazy in [False, True]:
+        omfp: OMFPandasReader = OMFPandasReader(filepath=temp_congruent_omf_file, lazy=lazy)
+        df: pd.DataFrame = omfp.read_blockmodel('BlockModel1', max_workers=4)
+        pd.testing.assert_frame_equal(df, expected)
+
+        df_filtered: pd.DataFrame = omfp.read_blockmodel('BlockModel1', query='attr1 > 0.5', max_workers=4)
+        pd.testing.assert_frame_equal(df_filtered, expected.query('attr1 > 0.5'))
+    temp_congruent_omf_file.unlink()
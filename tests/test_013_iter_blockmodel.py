@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from omfpandas import OMFPandasReader
+from omfpandas.writer import OMFPandasWriter
+from conftest import get_omf_file
+
+
+@pytest.mark.parametrize('bm_name', ['tensor', 'regular'])
+def test_iter_blockmodel(bm_name):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    expected: pd.DataFrame = omfp.read_blockmodel(bm_name)
+
+    chunks: list[pd.DataFrame] = list(omfp.iter_blockmodel(bm_name, chunk_cells=700))
+    # shape is (10, 15, 20) so each slab is 300 cells, and each chunk holds 2 slabs
+    assert [len(chunk) for chunk in chunks] == [600] * 5
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_iter_blockmodel_query():
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file(), lazy=True)
+    query: str = '`random attr` > 0.5'
+    expected: pd.DataFrame = OMFPandasReader(filepath=get_omf_file()).read_blockmodel('tensor', query=query)
+
+    chunks: list[pd.DataFrame] = list(omfp.iter_blockmodel('tensor', query=query, chunk_cells=1))
+    assert len(chunks) <= 10
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_iter_blockmodel_calculated(tmp_path):
+    omf_path: Path = tmp_path / 'test.omf'
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=omf_path)
+    blocks: pd.DataFrame = OMFPandasReader(filepath=get_omf_file()).read_blockmodel('tensor').rename(
+        columns={'random attr': 'grade'})
+    writer.create_blockmodel(blocks=blocks, blockmodel_name='tensor')
+    writer.create_calculated_blockmodel_attributes('tensor', calc_definitions={'double': 'grade * 2'})
+
+    expected: pd.DataFrame = writer.read_blockmodel('tensor', query='double > 1.0')
+    chunks: list[pd.DataFrame] = list(writer.iter_blockmodel('tensor', query='double > 1.0', chunk_cells=1000))
+    res: pd.DataFrame = pd.concat(chunks)
+    pd.testing.assert_frame_equal(res, expected)
+    assert np.allclose(res['double'], res['grade'] * 2)
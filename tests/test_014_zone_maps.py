@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from omf import NumericAttribute, TensorGridBlockModel
+
+from omfpandas.blockmodels.attributes import create_zone_map, zone_map_candidates, read_blockmodel_attributes, \
+    series_to_attribute, SENTINEL_VALUE, _subset_arrays
+from omfpandas.utils.pandas_utils import parse_comparisons_from_expr
+
+
+def create_blockmodel_with_zone_maps(chunk_cells: int = 100) -> TensorGridBlockModel:
+    grade = np.arange(1000, dtype=float)
+    grade[:100] = np.nan
+    domain = np.repeat(np.arange(10), 100)
+    attributes = []
+    for name, values in {'grade': grade, 'domain': domain}.items():
+        attribute = NumericAttribute(name=name, location="cells", array=values)
+        attribute.metadata['zone_map'] = create_zone_map(values, chunk_cells=chunk_cells)
+        attributes.append(attribute)
+    return TensorGridBlockModel(name='bm', tensor_u=np.full(10, 1.0), tensor_v=np.full(10, 1.0),
+                                tensor_w=np.full(10, 1.0), attributes=attributes)
+
+
+def test_parse_comparisons_from_expr():
+    assert parse_comparisons_from_expr('cu > 2.5') == [('cu', '>', 2.5)]
+    assert parse_comparisons_from_expr('(cu > 2.5) & (2 == domain)') == [('cu', '>', 2.5), ('domain', '==', 2)]
+    assert parse_comparisons_from_expr('0 < `cu pct` <= -1 and au > 1') == [('cu pct', '>', 0), ('cu pct', '<=', -1),
+                                                                              ('au', '>', 1)]
+    assert parse_comparisons_from_expr('cu > 2.5 or au > 1') == []
+    # & binds more loosely than the comparisons, as in pandas
+    assert parse_comparisons_from_expr('cu > 2.5 & au < 1') == [('cu', '>', 2.5), ('au', '<', 1)]
+    assert parse_comparisons_from_expr('cu > 2.5 | au < 1') == []
+
+
+def test_create_zone_map():
+    values = np.array([1, SENTINEL_VALUE, 3, SENTINEL_VALUE, SENTINEL_VALUE])
+    zone_map = create_zone_map(values, chunk_cells=2)
+    assert zone_map == {'chunk_cells': 2, 'min': [1, 3, None], 'max': [1, 3, None], 'null_count': [1, 1, 1]}
+
+    zone_map = create_zone_map(np.array([np.nan, 2.0, 0.5]), chunk_cells=2)
+    assert zone_map == {'chunk_cells': 2, 'min': [2.0, 0.5], 'max': [2.0, 0.5], 'null_count': [1, 0]}
+
+    attribute = series_to_attribute(pd.Series([1.0, 2.0], name='a'))
+    assert attribute.metadata['zone_map']['max'] == [2.0]
+
+
+def test_zone_map_candidates():
+    bm = create_blockmodel_with_zone_maps()
+    assert np.array_equal(np.flatnonzero(zone_map_candidates(bm, 'grade > 850')), np.arange(800, 1000))
+    assert np.array_equal(np.flatnonzero(zone_map_candidates(bm, 'grade < 250 and domain == 2')), np.arange(200, 300))
+    # the null chunk is pruned
+    assert np.array_equal(np.flatnonzero(zone_map_candidates(bm, 'grade < 250')), np.arange(100, 300))
+    assert not zone_map_candidates(bm, 'grade > 5000').any()
+    assert zone_map_candidates(bm, 'grade > 850 or domain == 1') is None
+    assert np.array_equal(np.flatnonzero(zone_map_candidates(bm, 'grade > 150 & domain < 3')), np.arange(100, 300))
+    # pruning is skipped when most chunks remain
+    assert zone_map_candidates(bm, 'grade > 350') is None
+    assert len(zone_map_candidates(bm, 'grade > 550')) == 1000
+
+
+def test_read_with_zone_maps():
+    bm = create_blockmodel_with_zone_maps()
+    full: pd.DataFrame = read_blockmodel_attributes(bm)
+    for query in ['grade > 850', 'grade < 250 and domain == 2', 'grade > 5000', 'domain != 3',
+                  'grade > 150 & domain < 3']:
+        pd.testing.assert_frame_equal(read_blockmodel_attributes(bm, query=query), full.query(query))
+
+
+def test_query_pruned_calculated():
+    bm = create_blockmodel_with_zone_maps()
+    bm.attributes.append(NumericAttribute(name='other', location="cells", array=np.arange(1000)))
+    bm.metadata['calculated_attributes'] = {'grade2': 'grade * 2'}
+    full: pd.DataFrame = read_blockmodel_attributes(bm)
+    query: str = 'grade2 > 1700 & domain > 7'
+    pd.testing.assert_frame_equal(read_blockmodel_attributes(bm, query=query), full.query(query))
+
+    # only the arrays the query depends on are restricted to the candidate cells
+    assert list(_subset_arrays(bm, {}, np.arange(10), names=['grade', 'domain'])) == ['grade', 'domain']
+
+
+def test_zone_map_integer_codes():
+    # -9 is a valid code of a (non-nullable) integer column, so it is not counted as null
+    df = pd.DataFrame({'code': np.repeat(np.arange(-10, 0), 100), 'grade': np.arange(1000, dtype=float)})
+    attributes = [series_to_attribute(df[name]) for name in df.columns]
+    assert 'null_value' not in attributes[0].metadata
+    assert attributes[0].metadata['zone_map']['null_count'] == [0]
+    assert series_to_attribute(df['code'], null_value=SENTINEL_VALUE).metadata['zone_map']['null_count'] == [100]
+    for attribute in attributes:
+        attribute.metadata['zone_map'] = create_zone_map(attribute.array.array, chunk_cells=100, null_value=None)
+    bm = TensorGridBlockModel(name='bm', tensor_u=np.full(10, 1.0), tensor_v=np.full(10, 1.0),
+                              tensor_w=np.full(10, 1.0), attributes=attributes)
+
+    full: pd.DataFrame = read_blockmodel_attributes(bm)
+    df = df.set_axis(full.index)
+    pd.testing.assert_frame_equal(full, df)
+    for query in ['code == -9', 'code < -8', 'code == -9 and grade > 150']:
+        result: pd.DataFrame = read_blockmodel_attributes(bm, query=query)
+        pd.testing.assert_frame_equal(result, df.query(query))
+        assert len(result) > 0
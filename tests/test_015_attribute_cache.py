@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from omfpandas import OMFPandasReader, OMFPandasWriter
+from omfpandas.cache import AttributeCache
+
+
+def test_attribute_cache_budget():
+    cache = AttributeCache(max_bytes=2000)
+    series = [pd.Series(np.arange(100, dtype='float64'), name=str(i)) for i in range(3)]
+    for i, s in enumerate(series):
+        cache.put(('file.omf', 0, 'bm', str(i)), s)
+    # each series is 800 bytes, so the first is evicted
+    assert cache.stats == {'hits': 0, 'misses': 0, 'evictions': 1, 'entries': 2, 'size_bytes': 1600,
+                           'max_bytes': 2000}
+    assert cache.get(('file.omf', 0, 'bm', '0')) is None
+    assert cache.get(('file.omf', 0, 'bm', '2')) is series[2]
+
+    # series larger than the budget are not cached
+    cache.put(('file.omf', 0, 'bm', 'big'), pd.Series(np.arange(1000, dtype='float64')))
+    assert cache.get(('file.omf', 0, 'bm', 'big')) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_read_blockmodel_with_cache(temp_congruent_omf_file):
+    expected: pd.DataFrame = OMFPandasReader(filepath=temp_congruent_omf_file).read_blockmodel('BlockModel1')
+    for lazy in [False, True]:
+        cache = AttributeCache()
+        omfp: OMFPandasReader = OMFPandasReader(filepath=temp_congruent_omf_file, lazy=lazy, attribute_cache=cache)
+        pd.testing.assert_frame_equal(omfp.read_blockmodel('BlockModel1', attributes=['attr1']), expected[['attr1']])
+        assert cache.stats['entries'] == 1
+
+        df: pd.DataFrame = omfp.read_blockmodel('BlockModel1', query='attr1 > 0.5')
+        pd.testing.assert_frame_equal(df, expected.query('attr1 > 0.5'))
+        assert cache.hits == 1
+        assert cache.stats['entries'] == 2
+
+        # modifying the result does not modify the cache
+        df = omfp.read_blockmodel('BlockModel1')
+        df['attr1'] = 0.0
+        pd.testing.assert_frame_equal(omfp.read_blockmodel('BlockModel1'), expected)
+        assert cache.stats['hits'] == 5
+    temp_congruent_omf_file.unlink()
+
+
+def test_cache_invalidated_on_persist(temp_congruent_omf_file):
+    cache = AttributeCache()
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=temp_congruent_omf_file, attribute_cache=cache)
+    df: pd.DataFrame = writer.read_blockmodel('BlockModel1', attributes=['attr1'])
+    assert cache.stats['entries'] == 1
+
+    # the modified element is read from memory, bypassing the cache, until persisted
+    writer.write_blockmodel_attribute('BlockModel1', (df['attr1'] * 2).rename('attr1'), allow_overwrite=True)
+    pd.testing.assert_series_equal(writer.read_blockmodel('BlockModel1', attributes=['attr1'])['attr1'],
+                                   df['attr1'] * 2)
+    assert cache.stats['entries'] == 1
+
+    writer.persist_project()
+    assert cache.stats['entries'] == 0
+    pd.testing.assert_series_equal(writer.read_blockmodel('BlockModel1', attributes=['attr1'])['attr1'],
+                                   df['attr1'] * 2)
+    assert cache.stats['entries'] == 1
+    temp_congruent_omf_file.unlink()
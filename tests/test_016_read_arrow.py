@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from omfpandas import OMFPandasReader, OMFPandasWriter
+from omfpandas.blockmodels.geometry import multi_index_cache
+from omfpandas.utils.pandas_utils import create_test_blockmodel
+from conftest import get_omf_file
+
+pa = pytest.importorskip("pyarrow", exc_type=ImportError)
+
+
+@pytest.mark.parametrize("bm_name", ["tensor", "regular"])
+def test_read_blockmodel_arrow(bm_name):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    expected: pd.DataFrame = omfp.read_blockmodel(bm_name)
+
+    table: pa.Table = omfp.read_blockmodel_arrow(bm_name)
+    pd.testing.assert_frame_equal(table.to_pandas().set_index(list(expected.index.names)), expected)
+    assert omfp.read_blockmodel_arrow(bm_name, centroids=False).column_names == list(expected.columns)
+
+    # the centroids of a filtered read are of the selected cells only, without building the index of all cells
+    multi_index_cache.clear()
+    query: str = '`random attr` > 0.5'
+    table = omfp.read_blockmodel_arrow(bm_name, query=query)
+    pd.testing.assert_frame_equal(table.to_pandas().set_index(list(expected.index.names)), expected.query(query))
+    table = omfp.read_blockmodel_arrow(bm_name, index_filter=[5, 1, 3])
+    pd.testing.assert_frame_equal(table.to_pandas().set_index(list(expected.index.names)), expected.iloc[[5, 1, 3]])
+    assert multi_index_cache.misses == 0
+
+
+def test_read_blockmodel_arrow_types(tmp_path: Path):
+    blocks: pd.DataFrame = create_test_blockmodel(shape=(4, 3, 2), block_size=(1.0, 1.0, 1.0),
+                                                  corner=(0.0, 0.0, 0.0))
+    blocks['grade'] = np.linspace(0, 1, len(blocks))
+    blocks['domain'] = pd.Categorical(np.where(blocks['grade'] > 0.5, 'high', 'low'))
+    blocks['count'] = pd.array(np.where(blocks['grade'] > 0.5, 1, pd.NA), dtype='Int64')
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'types.omf')
+    writer.create_blockmodel(blocks=blocks, blockmodel_name='bm')
+    table: pa.Table = writer.read_blockmodel_arrow('bm', attributes=['domain', 'count'], centroids=False)
+
+    assert pa.types.is_dictionary(table.schema.field('domain').type)
+    assert table.column('domain').to_pylist() == list(blocks['domain'].astype(str))
+    assert table.column('count').null_count == int(blocks['count'].isna().sum())
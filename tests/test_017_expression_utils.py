@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from omfpandas.blockmodels.attributes import read_blockmodel_attributes
+from omfpandas.utils.expression_utils import compile_expression
+from omf import NumericAttribute, TensorGridBlockModel
+
+
+def test_compile_expression():
+    compiled = compile_expression('`cu pct` > 1 and not 0 < au <= 2 or where(cu > 1, au, 0) * 2 > 1')
+    assert compiled.expression == '(v0 > 1) & ~((0 < v1) & (v1 <= 2)) | (where(v2 > 1, v1, 0) * 2 > 1)'
+    assert compiled.variables == {'v0': 'cu pct', 'v1': 'au', 'v2': 'cu'}
+
+    # expressions that cannot be evaluated over numeric arrays
+    assert compile_expression("domain == 'high'") is None
+    assert compile_expression('cu.abs() > 1') is None
+    assert compile_expression('cu in [1, 2]') is None
+    assert compile_expression('cu >') is None
+
+
+@pytest.mark.parametrize("chunk_cells", [7, 1_000])
+def test_evaluate_expression(chunk_cells):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'cu pct': rng.random(100), 'au': rng.random(100) * 3, 'cu': rng.random(100) * 2})
+    df.loc[::10, 'au'] = np.nan
+
+    query = '`cu pct` > 0.2 and not 0 < au <= 2 or cu > 1.5'
+    mask = compile_expression(query).evaluate(df, chunk_cells=chunk_cells, max_workers=2)
+    pd.testing.assert_frame_equal(df[mask], df.query(query))
+
+    expression = '`cu pct` * 2 + au / cu ** 2'
+    result = compile_expression(expression).evaluate(df, chunk_cells=chunk_cells)
+    np.testing.assert_allclose(result, df.eval(expression).to_numpy())
+
+
+def test_read_with_compiled_expressions():
+    values = np.arange(60, dtype=float)
+    blockmodel = TensorGridBlockModel(name='bm', tensor_u=np.ones(5), tensor_v=np.ones(4), tensor_w=np.ones(3),
+                                      attributes=[NumericAttribute(name='cu pct', location="cells", array=values),
+                                                  NumericAttribute(name='au', location="cells", array=values % 7)])
+    blockmodel.metadata['calculated_attributes'] = {'metal_eq': '`cu pct` + au * 2', 'ore': 'metal_eq > 40 and au > 1'}
+
+    df: pd.DataFrame = read_blockmodel_attributes(blockmodel, query='ore or `cu pct` < 3')
+    full: pd.DataFrame = read_blockmodel_attributes(blockmodel)
+    pd.testing.assert_series_equal(full['metal_eq'], (full['cu pct'] + full['au'] * 2).rename('metal_eq'))
+    pd.testing.assert_frame_equal(df, full[full['ore'] | (full['cu pct'] < 3)])
+
+
+@pytest.mark.parametrize("query", ['cu > 10 & au > 2', 'cu < 5 | au > 5', 'cu > 10 & au > 2 | cu < 3 & au < 1',
+                                   '(cu > 10 | au > 5) & ~(au == 6)'])
+@pytest.mark.parametrize("dtype", [float, np.int64])
+def test_query_precedence(query, dtype):
+    values = np.arange(60).astype(dtype)
+    blockmodel = TensorGridBlockModel(name='bm', tensor_u=np.ones(5), tensor_v=np.ones(4), tensor_w=np.ones(3),
+                                      attributes=[NumericAttribute(name='cu', location="cells", array=values),
+                                                  NumericAttribute(name='au', location="cells", array=values % 7)])
+    full: pd.DataFrame = read_blockmodel_attributes(blockmodel)
+    expected: pd.DataFrame = full.query(query)
+    assert len(expected) > 0
+
+    # & and | bind more loosely than the comparisons, as in pandas
+    mask = compile_expression(query, query=True).evaluate(full)
+    pd.testing.assert_frame_equal(full[mask], expected)
+    pd.testing.assert_frame_equal(read_blockmodel_attributes(blockmodel, query=query), expected)
+
+
+def test_evaluate_unsupported_dtype():
+    # a bitwise operator on floats cannot be evaluated over the arrays, so the caller falls back to pandas
+    df = pd.DataFrame({'cu': np.arange(10, dtype=float), 'au': np.arange(10, dtype=float)})
+    assert compile_expression('cu & au', query=False).evaluate(df) is None
+    assert compile_expression('cu & au', query=False).evaluate(df, chunk_cells=3, max_workers=2) is None
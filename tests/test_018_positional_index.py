@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from omfpandas import OMFPandasReader, OMFPandasWriter
+from conftest import get_omf_file
+
+
+@pytest.mark.parametrize('bm_name', ['tensor', 'regular'])
+def test_read_positional_index(bm_name):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    expected: pd.DataFrame = omfp.read_blockmodel(bm_name)
+    df: pd.DataFrame = omfp.read_blockmodel(bm_name, positional_index=True)
+
+    assert isinstance(df.index, pd.RangeIndex)
+    assert df.index.name == 'position'
+    assert df.omf.geometry.fingerprint == omfp.get_bm_geometry(bm_name).fingerprint
+    assert df.omf.to_multi_index().equals(expected.index)
+    pd.testing.assert_frame_equal(df.omf.with_multi_index(), expected)
+    np.testing.assert_array_equal(df.omf.x.to_numpy(), expected.index.get_level_values('x'))
+
+    # filtered reads are indexed by the positions of the cells
+    df = omfp.read_blockmodel(bm_name, query='`random attr` > 0.5', positional_index=True)
+    filtered: pd.DataFrame = expected.query('`random attr` > 0.5')
+    assert df.omf.to_multi_index().equals(filtered.index)
+    np.testing.assert_array_equal(df.omf.positions, np.flatnonzero(expected['random attr'] > 0.5))
+
+
+def test_positional_index_round_trip(tmp_path: Path):
+    omfp: OMFPandasReader = OMFPandasReader(filepath=get_omf_file())
+    df: pd.DataFrame = omfp.read_blockmodel('tensor', positional_index=True)
+
+    writer: OMFPandasWriter = OMFPandasWriter(filepath=tmp_path / 'positional.omf')
+    writer.create_blockmodel(blocks=df.iloc[::-1], blockmodel_name='tensor')
+    pd.testing.assert_frame_equal(writer.read_blockmodel('tensor'), omfp.read_blockmodel('tensor'))
+
+    sparse: pd.DataFrame = df.query('`random attr` > 0.5')
+    writer.create_blockmodel(blocks=sparse, blockmodel_name='sparse')
+    res: pd.DataFrame = writer.read_blockmodel('sparse', positional_index=True)
+    pd.testing.assert_series_equal(res['random attr'].dropna(), sparse['random attr'])
+
+    writer.write_blockmodel_attribute('tensor', (df['random attr'] * 2).rename('double').iloc[::-1])
+    res = writer.read_blockmodel('tensor', positional_index=True)
+    np.testing.assert_array_equal(res['double'].to_numpy(), df['random attr'].to_numpy() * 2)
+
+
+def test_accessor_requires_positional_index():
+    df: pd.DataFrame = OMFPandasReader(filepath=get_omf_file()).read_blockmodel('regular')
+    with pytest.raises(AttributeError, match='positional_index'):
+        df.omf.geometry